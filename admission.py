@@ -0,0 +1,383 @@
+"""
+Admission control: an adaptive concurrency limit in front of the app.
+
+Without it every request is let in, and when the database slows down they
+all queue on the connection pool (for up to DB_POOL_TIMEOUT) until latency
+is bad for everyone. AdmissionMiddleware caps the requests in flight per
+worker instead; requests over the cap wait in a short priority queue and
+are answered with a fast 503 + Retry-After when their queue deadline
+passes or the queue is full.
+
+The cap adapts (Gradient2, as in Netflix's concurrency-limits): every
+window the average latency of the window is compared with a long-term
+average. Latency near the long-term level lets the limit grow by about
+sqrt(limit); latency rising past ADMISSION_TOLERANCE times it shrinks the
+limit in proportion. Server errors in a window back the limit off
+multiplicatively (ADMISSION_BACKOFF), as in AIMD.
+
+Priority classes (see classify()):
+    critical     health checks, metrics and Socket.IO: never limited
+    interactive  reads and pages: may use the whole limit, served first
+    write        creates/updates/deletes: up to 75% of the limit
+    bulk         bulk ingest and exports (also /web/posts?format=json):
+                 up to 25%, shed first
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional
+from urllib.parse import parse_qsl
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import Histogram, PrometheusWriter
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# Requests in flight per worker: starting point and bounds of the adaptive limit
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "20"))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "4"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "200"))
+# Latency may reach this multiple of its long-term average before the limit shrinks
+ADMISSION_TOLERANCE = float(os.getenv("ADMISSION_TOLERANCE", "2.0"))
+# Share of each new estimate blended into the limit (higher reacts faster, flaps more)
+ADMISSION_SMOOTHING = float(os.getenv("ADMISSION_SMOOTHING", "0.2"))
+# Limit multiplier after a window with server errors
+ADMISSION_BACKOFF = float(os.getenv("ADMISSION_BACKOFF", "0.9"))
+# The limit is recomputed once per window holding at least ADMISSION_MIN_SAMPLES requests
+ADMISSION_WINDOW_SECONDS = float(os.getenv("ADMISSION_WINDOW_SECONDS", "1.0"))
+ADMISSION_MIN_SAMPLES = int(os.getenv("ADMISSION_MIN_SAMPLES", "10"))
+# Windows averaged into the long-term latency
+ADMISSION_LONG_WINDOWS = int(os.getenv("ADMISSION_LONG_WINDOWS", "600"))
+# Longest wait for a slot before a 503, and queued requests per priority class
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "1.0"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+# Retry-After (seconds) sent with a 503; bulk clients are asked to back off longer
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+ADMISSION_BULK_RETRY_AFTER = int(os.getenv("ADMISSION_BULK_RETRY_AFTER", "10"))
+
+
+class PriorityClass(NamedTuple):
+    name: str
+    rank: int  # lower is served first
+    share: float  # fraction of the limit the class may hold
+    queue_timeout: float
+    retry_after: int
+
+
+CRITICAL = "critical"
+PRIORITY_CLASSES = {
+    cls.name: cls for cls in (
+        PriorityClass("interactive", 0, 1.0, ADMISSION_QUEUE_TIMEOUT, ADMISSION_RETRY_AFTER),
+        PriorityClass("write", 1, 0.75, ADMISSION_QUEUE_TIMEOUT, ADMISSION_RETRY_AFTER),
+        PriorityClass("bulk", 2, 0.25, ADMISSION_QUEUE_TIMEOUT, ADMISSION_BULK_RETRY_AFTER),
+    )
+}
+
+# Path prefixes that bypass the limiter: what orchestrators, Prometheus and
+# Socket.IO clients (handshakes and long-lived connections) depend on
+CRITICAL_PREFIXES = (
+    "/check-db", "/metrics", "/startup/stats", "/db/pool", "/admission/stats",
+    "/broadcast/stats", "/jobs/stats", "/socket/presence", "/socket.io",
+)
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+# Pages that stream the whole table for a query parameter (the posts list
+# refresh with ?format=json), classed with the /export endpoints
+EXPORT_QUERIES = {"/web/posts": ("format", "json")}
+
+
+def classify(method: str, path: str, query_string: bytes = b"") -> str:
+    if path.startswith(CRITICAL_PREFIXES):
+        return CRITICAL
+    if path.endswith(("/bulk", "/export")):
+        return "bulk"
+    export = EXPORT_QUERIES.get(path)
+    if export is not None and export in parse_qsl(query_string.decode("latin-1")):
+        return "bulk"
+    # The socket token request precedes every authenticated Socket.IO handshake
+    if method in READ_METHODS or path == "/auth/socket-token":
+        return "interactive"
+    return "write"
+
+
+class Rejected(Exception):
+    def __init__(self, cls: PriorityClass, reason: str):
+        super().__init__(reason)
+        self.cls = cls
+        self.reason = reason
+
+
+class GradientLimit:
+    """
+    The adaptive limit; fed one window of latencies at a time
+    """
+
+    def __init__(
+        self,
+        initial: int = ADMISSION_INITIAL_LIMIT,
+        min_limit: int = ADMISSION_MIN_LIMIT,
+        max_limit: int = ADMISSION_MAX_LIMIT,
+        tolerance: float = ADMISSION_TOLERANCE,
+        smoothing: float = ADMISSION_SMOOTHING,
+        backoff: float = ADMISSION_BACKOFF,
+        long_windows: int = ADMISSION_LONG_WINDOWS
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.backoff = backoff
+        self.long_decay = 2 / (long_windows + 1)
+        self.long_rtt: Optional[float] = None
+        self.short_rtt: Optional[float] = None
+
+    def update(self, rtt: float, max_in_flight: int, errors: int) -> float:
+        self.short_rtt = rtt
+        if self.long_rtt is None:
+            self.long_rtt = rtt
+        else:
+            self.long_rtt += (rtt - self.long_rtt) * self.long_decay
+            if self.long_rtt > 2 * rtt:
+                # Overload is over: don't keep judging latency against its peak
+                self.long_rtt *= 0.9
+
+        if errors:
+            estimate = self.limit * self.backoff
+        elif max_in_flight < self.limit / 2:
+            # The limit isn't what holds requests back; growing it would prove nothing
+            return self.limit
+        else:
+            gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / rtt))
+            estimate = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit * (1 - self.smoothing) + estimate * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, limit))
+        return self.limit
+
+
+class AdmissionController:
+    """
+    Slots under the adaptive limit, handed out by priority. Runs on one
+    event loop; nothing here needs a lock.
+    """
+
+    def __init__(
+        self,
+        limiter: Optional[GradientLimit] = None,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        window_seconds: float = ADMISSION_WINDOW_SECONDS,
+        min_samples: int = ADMISSION_MIN_SAMPLES
+    ):
+        self.limiter = limiter or GradientLimit()
+        self.max_queue = max_queue
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.in_flight = 0
+        self.class_in_flight: Dict[str, int] = {name: 0 for name in PRIORITY_CLASSES}
+        self.queues: Dict[str, Deque[asyncio.Future]] = {name: deque() for name in PRIORITY_CLASSES}
+        self.admitted: Dict[str, int] = {name: 0 for name in PRIORITY_CLASSES}
+        self.rejected: Dict[str, Dict[str, int]] = {
+            name: {"queue_full": 0, "timeout": 0} for name in PRIORITY_CLASSES
+        }
+        self.queue_wait: Dict[str, Histogram] = {name: Histogram() for name in PRIORITY_CLASSES}
+        self.bypassed = 0
+        self._reset_window(time.monotonic())
+
+    @property
+    def limit(self) -> int:
+        return int(self.limiter.limit)
+
+    def _reset_window(self, now: float) -> None:
+        self._window_start = now
+        self._window_rtt = 0.0
+        self._window_samples = 0
+        self._window_errors = 0
+        self._window_max_in_flight = self.in_flight
+
+    def _has_room(self, cls: PriorityClass) -> bool:
+        return (
+            self.in_flight < self.limit
+            and self.class_in_flight[cls.name] < max(1, int(cls.share * self.limit))
+        )
+
+    def _queued_ahead(self, cls: PriorityClass) -> bool:
+        return any(self.queues[other.name] for other in PRIORITY_CLASSES.values() if other.rank <= cls.rank)
+
+    def _take(self, cls: PriorityClass) -> None:
+        self.in_flight += 1
+        self.class_in_flight[cls.name] += 1
+        self.admitted[cls.name] += 1
+        self._window_max_in_flight = max(self._window_max_in_flight, self.in_flight)
+
+    def _wake(self) -> None:
+        """
+        Hand free slots to waiters, highest priority first
+        """
+        for cls in sorted(PRIORITY_CLASSES.values(), key=lambda c: c.rank):
+            queue = self.queues[cls.name]
+            while queue and self._has_room(cls):
+                waiter = queue.popleft()
+                if not waiter.done():
+                    self._take(cls)
+                    waiter.set_result(None)
+
+    async def acquire(self, cls: PriorityClass) -> None:
+        """
+        Wait for a slot; raises Rejected when the queue is full or the
+        class's queue deadline passes
+        """
+        started = time.perf_counter()
+        if not self._queued_ahead(cls) and self._has_room(cls):
+            self._take(cls)
+            self.queue_wait[cls.name].observe(0.0)
+            return
+        queue = self.queues[cls.name]
+        if len(queue) >= self.max_queue:
+            self.rejected[cls.name]["queue_full"] += 1
+            raise Rejected(cls, "queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=cls.queue_timeout)
+        except asyncio.CancelledError:
+            # Client went away; give back a slot handed over in the meantime
+            if waiter.done() and not waiter.cancelled():
+                self._free(cls)
+            self._discard(queue, waiter)
+            raise
+        if not waiter.done():
+            waiter.cancel()
+            self._discard(queue, waiter)
+            self.rejected[cls.name]["timeout"] += 1
+            raise Rejected(cls, "timeout")
+        self.queue_wait[cls.name].observe(time.perf_counter() - started)
+
+    @staticmethod
+    def _discard(queue: Deque[asyncio.Future], waiter: asyncio.Future) -> None:
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+
+    def _free(self, cls: PriorityClass) -> None:
+        self.in_flight -= 1
+        self.class_in_flight[cls.name] -= 1
+        self._wake()
+
+    def release(self, cls: PriorityClass, latency: Optional[float], status_code: int) -> None:
+        """
+        Give the slot back; `latency` None keeps the request out of the
+        limit's samples
+        """
+        if latency is not None:
+            self._window_rtt += latency
+            self._window_samples += 1
+            # 503s are load shedding (ours or the password pool's), not failures
+            if status_code >= 500 and status_code != 503:
+                self._window_errors += 1
+            now = time.monotonic()
+            if now - self._window_start >= self.window_seconds and self._window_samples >= self.min_samples:
+                self.limiter.update(
+                    self._window_rtt / self._window_samples, self._window_max_in_flight, self._window_errors
+                )
+                self._reset_window(now)
+        self._free(cls)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "bypassed": self.bypassed,
+            "long_rtt": self.limiter.long_rtt,
+            "short_rtt": self.limiter.short_rtt,
+            "classes": {
+                name: {
+                    "in_flight": self.class_in_flight[name],
+                    "queued": len(self.queues[name]),
+                    "admitted": self.admitted[name],
+                    "rejected": dict(self.rejected[name]),
+                    "queue_wait": self.queue_wait[name].snapshot(),
+                }
+                for name in PRIORITY_CLASSES
+            },
+        }
+
+    def write(self, writer: PrometheusWriter) -> None:
+        writer.family("admission_limit", "gauge", "Current adaptive concurrency limit")
+        writer.sample("admission_limit", self.limit)
+        writer.family("admission_in_flight", "gauge", "Admitted requests in flight")
+        writer.family("admission_queued", "gauge", "Requests waiting for a slot")
+        writer.family("admission_admitted_total", "counter", "Requests admitted")
+        writer.family("admission_rejected_total", "counter", "Requests shed with 503")
+        writer.family("admission_queue_wait_seconds", "histogram", "Time admitted requests waited for a slot")
+        for name in PRIORITY_CLASSES:
+            labels = {"class": name}
+            writer.sample("admission_in_flight", self.class_in_flight[name], labels)
+            writer.sample("admission_queued", len(self.queues[name]), labels)
+            writer.sample("admission_admitted_total", self.admitted[name], labels)
+            for reason, count in self.rejected[name].items():
+                writer.sample("admission_rejected_total", count, {**labels, "reason": reason})
+            writer.histogram("admission_queue_wait_seconds", self.queue_wait[name], labels)
+        writer.family("admission_bypassed_total", "counter", "Critical requests that skipped the limiter")
+        writer.sample("admission_bypassed_total", self.bypassed)
+        writer.family("admission_latency_seconds", "gauge", "Average latency the limit is computed from")
+        for window, value in (("short", self.limiter.short_rtt), ("long", self.limiter.long_rtt)):
+            if value is not None:
+                writer.sample("admission_latency_seconds", value, {"window": window})
+
+
+admission = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying the admission controller to HTTP requests;
+    WebSocket and lifespan scopes pass straight through
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController = admission, enabled: bool = ADMISSION_ENABLED):
+        self.app = app
+        self.controller = controller
+        self.enabled = enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = classify(scope["method"], scope["path"], scope.get("query_string", b""))
+        if name == CRITICAL:
+            self.controller.bypassed += 1
+            await self.app(scope, receive, send)
+            return
+
+        cls = PRIORITY_CLASSES[name]
+        try:
+            await self.controller.acquire(cls)
+        except Rejected as e:
+            response = JSONResponse(
+                {"detail": "Server is overloaded, retry shortly"},
+                status_code=503,
+                headers={"Retry-After": str(e.cls.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Bulk ingest and exports take as long as their payload, not as the load makes them
+            latency = None if cls.name == "bulk" else time.perf_counter() - started
+            self.controller.release(cls, latency, status_code)
@@ -0,0 +1,197 @@
+"""
+Job queue (jobs.py) throughput and latency, and what queued post counters
+change for writes.
+
+queue:  --jobs jobs of a handler doing one small upsert per batch are
+        enqueued in transactions of --enqueue-batch, then drained by
+        --workers loops, for every handler batch size in --batch-sizes.
+        Reported: drain throughput, retries, and enqueue-to-acknowledgement
+        latency p50/p99 (from the runner's histogram, so bucket bounds).
+writes: POST /posts/ from --concurrency clients against the app, once with
+        POST_STATS_UPDATES=inline and once with queued; p50/p99 latency,
+        throughput, and whether the counters matched the posts afterwards.
+
+Runs against a throwaway database (SQLite by default). On SQLite writes are
+serialized anyway, so the counter contention queued updates remove only
+shows on Postgres. Use:
+    python benchmarks/bench_jobs.py
+    python benchmarks/bench_jobs.py --jobs 20000 --workers 4 --batch-sizes 1,100,500
+    python benchmarks/bench_jobs.py --database-url postgresql+asyncpg://.../bench
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import Server, percentile, run_http_scenario  # noqa: E402
+
+
+def to_ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+async def run_queue(args):
+    from sqlalchemy import delete
+
+    from database import SessionLocal
+    import jobs
+    import models
+    from stats import upsert_post_stats
+
+    async def bench_handler(db, payloads):
+        # One write per batch, the shape of a batching handler
+        await upsert_post_stats(db, [{"dimension": "bench", "bucket": "", "posts": len(payloads), "published": 0}])
+
+    results = {}
+    for batch_size in args.batch_sizes:
+        kind = f"bench_{batch_size}"
+        jobs.handlers[kind] = jobs.HandlerSpec(kind, bench_handler, batch_size, jobs.JOBS_MAX_ATTEMPTS)
+        runner = jobs.JobRunner(workers=args.workers, poll_interval=0.05)
+
+        started = time.perf_counter()
+        runner.start()
+        for offset in range(0, args.jobs, args.enqueue_batch):
+            async with SessionLocal() as db:
+                count = min(args.enqueue_batch, args.jobs - offset)
+                await jobs.enqueue_many(db, kind, [{"n": offset + i} for i in range(count)])
+                await db.commit()
+            runner.wake()
+        stats = runner.kind_stats(kind)
+        while stats.succeeded + stats.failed < args.jobs:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        await runner.stop()
+        del jobs.handlers[kind]
+
+        async with SessionLocal() as db:
+            await db.execute(delete(models.PostStat).where(models.PostStat.dimension == "bench"))
+            await db.commit()
+        results[f"batch {batch_size}"] = {
+            "jobs": args.jobs,
+            "retried": stats.retried,
+            "failed": stats.failed,
+            "throughput_jobs_s": round(stats.succeeded / elapsed, 1),
+            "latency_p50_ms": to_ms(stats.latency.quantile(0.50)),
+            "latency_p99_ms": to_ms(stats.latency.quantile(0.99)),
+            "average_batch": stats.snapshot()["average_batch"],
+        }
+        print(f"queue  batch {batch_size:4}  {results[f'batch {batch_size}']['throughput_jobs_s']:9} jobs/s  "
+              f"p99 {results[f'batch {batch_size}']['latency_p99_ms']} ms", file=sys.stderr)
+    return results
+
+
+async def counters_match():
+    from sqlalchemy import func, select
+
+    from database import SessionLocal
+    import models
+    from stats import TOTAL
+
+    async with SessionLocal() as db:
+        posts = (await db.execute(select(func.count()).select_from(models.Post))).scalar()
+        counted = (await db.execute(
+            select(models.PostStat.posts).where(models.PostStat.dimension == TOTAL[0], models.PostStat.bucket == TOTAL[1])
+        )).scalar()
+    return posts == counted
+
+
+async def run_writes(args, database_url, counts):
+    rng = random.Random(args.seed)
+    results = {}
+    for mode in ("inline", "queued"):
+        server = Server(database_url, args.port)
+        server.env.update({"POST_STATS_UPDATES": mode, "SOCKETIO_MANAGER": "memory"})
+        await server.start()
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=120) as client:
+                latencies, errors, elapsed = await run_http_scenario(
+                    client, "POST", "/posts/?user_id={user}", {"json": {"title": "bench", "content": "job bench"}},
+                    args.writes, args.concurrency, counts, rng
+                )
+                # Let queued counter updates drain before comparing
+                for _ in range(100):
+                    depth = (await client.get("/jobs/stats")).json()["queue"].get("post_stats", {})
+                    if not depth.get("due") and not depth.get("scheduled"):
+                        break
+                    await asyncio.sleep(0.1)
+        finally:
+            server.stop()
+        matched = await counters_match()
+        results[mode] = {
+            "requests": len(latencies) + errors,
+            "errors": errors,
+            "p50_ms": to_ms(percentile(latencies, 0.50)),
+            "p99_ms": to_ms(percentile(latencies, 0.99)),
+            "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+            "counters_match": matched,
+        }
+        print(f"writes {mode:7}  p99 {results[mode]['p99_ms']} ms  {results[mode]['throughput_rps']} req/s  "
+              f"counters match: {matched}", file=sys.stderr)
+    return results
+
+
+async def run(args, database_url):
+    os.environ["DATABASE_URL"] = database_url
+    from fixtures import seed_database
+    from database import engine
+
+    counts = await seed_database(args.users, args.posts, args.seed)
+    queue = await run_queue(args)
+    # Release the SQLite file before the app opens it
+    await engine.dispose()
+    writes = await run_writes(args, database_url, counts)
+    await engine.dispose()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "database": database_url.split("://", 1)[0],
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+        },
+        "queue": queue,
+        "writes": writes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the job queue and queued post counters")
+    parser.add_argument("--database-url", help="Throwaway database (default: temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--jobs", type=int, default=2000, help="Jobs per batch size")
+    parser.add_argument("--enqueue-batch", type=int, default=50, help="Jobs enqueued per transaction")
+    parser.add_argument("--batch-sizes", type=lambda value: [int(size) for size in value.split(",")], default=[1, 100])
+    parser.add_argument("--workers", type=int, default=2, help="Worker loops draining the queue")
+    parser.add_argument("--writes", type=int, default=1000, help="POST /posts/ requests per mode")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--output", help="Write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench_jobs.db')}"
+        results = asyncio.run(run(args, database_url))
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
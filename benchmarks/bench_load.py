@@ -0,0 +1,320 @@
+"""
+Load and latency benchmark for the JSON API, the /web pages and Socket.IO.
+
+Seeds the fixture from fixtures.py into a throwaway database (SQLite by
+default), starts the app with uvicorn in a subprocess and drives it with
+concurrent HTTP requests and Socket.IO clients. Every scenario reports
+p50/p95/p99 latency, throughput and the server's RSS. Use:
+    python benchmarks/bench_load.py                              - run, print JSON
+    python benchmarks/bench_load.py --output run.json            - also write it to a file
+    python benchmarks/bench_load.py --save-baseline base.json    - record a baseline
+    python benchmarks/bench_load.py --baseline base.json         - fail on regressions
+    python benchmarks/bench_load.py --database-url postgresql+asyncpg://.../bench --socket-clients 5000
+
+Latency numbers depend on the machine, so only compare runs made on the same
+hardware with the same options.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# (name, method, path, request kwargs); "{post}"/"{user}" pick a random seeded id
+HTTP_SCENARIOS = [
+    ("api list posts", "GET", "/posts/", {}),
+    ("api list posts page 2", "GET", "/posts/?skip=20&limit=20", {}),
+    ("api search posts", "GET", "/posts/?search=cache", {}),
+    ("api read post", "GET", "/posts/{post}", {}),
+    ("api list users", "GET", "/users/", {}),
+    ("api create post", "POST", "/posts/?user_id={user}", {"json": {"title": "bench", "content": "load test"}}),
+    ("api update post", "PUT", "/posts/{post}", {"json": {"title": "bench update"}}),
+    ("web posts list", "GET", "/web/posts", {}),
+    ("web post detail", "GET", "/web/posts/{post}", {}),
+    ("web users list", "GET", "/web/users", {}),
+]
+
+# A scenario regresses when p95 grows or throughput drops by more than this
+DEFAULT_TOLERANCE = 0.2
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def summarize(latencies, errors, elapsed, rss_mb):
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "rss_mb": rss_mb,
+    }
+
+
+def process_rss_mb(pid):
+    """
+    Resident set size of `pid` in MB (Linux /proc only, None elsewhere)
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def raise_fd_limit():
+    # Every Socket.IO client holds a socket on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class Server:
+    """
+    The app under uvicorn in a subprocess, so its RSS is measured on its own
+    """
+
+    def __init__(self, database_url, port):
+        self.port = port
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.env = {**os.environ, "DATABASE_URL": database_url}
+        self.process = None
+
+    async def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=ROOT, env=self.env
+        )
+        async with httpx.AsyncClient() as client:
+            for _ in range(100):
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"server exited with code {self.process.returncode}")
+                try:
+                    await client.get(self.base_url + "/check-db")
+                    return
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+        raise RuntimeError("server did not start")
+
+    def rss_mb(self):
+        return process_rss_mb(self.process.pid)
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+
+
+async def run_http_scenario(client, method, path, kwargs, requests, concurrency, counts, rng):
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            url = path.format(post=rng.randint(1, counts["posts"]), user=rng.randint(1, counts["users"]))
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                # 4xx answers are still answers; only server errors count as failures
+                if response.status_code >= 500:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_socket_scenarios(server, http, clients, writes, counts, rng):
+    """
+    Connect `clients` Socket.IO clients, then create `writes` posts and time how
+    long each list update takes to reach every client
+    """
+    import socketio
+
+    connect_latencies = []
+    connect_errors = 0
+    sent_at = {}
+    delivery_latencies = []
+    sockets = []
+    semaphore = asyncio.Semaphore(200)
+
+    def on_list_update(data):
+        received = time.perf_counter()
+        for change in data.get("changes", []):
+            started = sent_at.get(change.get("post_id"))
+            if started is not None:
+                delivery_latencies.append(received - started)
+
+    async def connect_one():
+        nonlocal connect_errors
+        sio = socketio.AsyncClient(reconnection=False)
+        sio.on("posts_list_update", on_list_update)
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await sio.connect(server.base_url, transports=["websocket"], wait_timeout=30)
+            except Exception:
+                connect_errors += 1
+                return
+            connect_latencies.append(time.perf_counter() - started)
+        sockets.append(sio)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(connect_one() for _ in range(clients)))
+    connect_elapsed = time.perf_counter() - started
+    results = {"socket connect": summarize(connect_latencies, connect_errors, connect_elapsed, server.rss_mb())}
+
+    started = time.perf_counter()
+    for i in range(writes):
+        write_started = time.perf_counter()
+        response = await http.post(
+            f"/posts/?user_id={rng.randint(1, counts['users'])}",
+            json={"title": f"socket bench {i}", "content": "load test"}
+        )
+        sent_at[response.json()["id"]] = write_started
+        await asyncio.sleep(0.05)
+    # Give the last broadcasts time to arrive
+    await asyncio.sleep(2)
+    delivery_elapsed = time.perf_counter() - started
+    expected = writes * len(sockets)
+    results["socket broadcast delivery"] = summarize(
+        delivery_latencies, max(0, expected - len(delivery_latencies)), delivery_elapsed, server.rss_mb()
+    )
+
+    await asyncio.gather(*(sio.disconnect() for sio in sockets), return_exceptions=True)
+    return results
+
+
+async def run(args, database_url):
+    os.environ["DATABASE_URL"] = database_url
+    from fixtures import seed_database
+    from database import engine
+
+    counts = await seed_database(args.users, args.posts, args.seed)
+    await engine.dispose()
+
+    rng = random.Random(args.seed)
+    server = Server(database_url, args.port)
+    await server.start()
+    results = {"idle": {"rss_mb": server.rss_mb()}}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=60) as client:
+            for name, method, path, kwargs in HTTP_SCENARIOS:
+                # Warm up caches and connections before measuring
+                await run_http_scenario(client, method, path, kwargs, args.concurrency, args.concurrency, counts, rng)
+                latencies, errors, elapsed = await run_http_scenario(
+                    client, method, path, kwargs, args.requests, args.concurrency, counts, rng
+                )
+                results[name] = summarize(latencies, errors, elapsed, server.rss_mb())
+                print(f"{name:28} p95 {results[name]['p95_ms']} ms, {results[name]['throughput_rps']} req/s", file=sys.stderr)
+
+            if args.socket_clients:
+                results.update(await run_socket_scenarios(server, client, args.socket_clients, args.socket_writes, counts, rng))
+                for name in ("socket connect", "socket broadcast delivery"):
+                    print(f"{name:28} p95 {results[name]['p95_ms']} ms", file=sys.stderr)
+    finally:
+        server.stop()
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "database": database_url.split("://", 1)[0],
+            "users": args.users,
+            "posts": args.posts,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "socket_clients": args.socket_clients,
+        },
+        "scenarios": results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """
+    Names of scenarios whose p95 or throughput regressed past `tolerance`
+    """
+    regressions = []
+    for name, base in baseline["scenarios"].items():
+        now = current["scenarios"].get(name)
+        if now is None or base.get("p95_ms") is None or now.get("p95_ms") is None:
+            continue
+        if now["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {now['p95_ms']} ms (baseline {base['p95_ms']} ms)")
+        if base.get("throughput_rps") and now["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {now['throughput_rps']} req/s (baseline {base['throughput_rps']} req/s)")
+        if now["errors"] > base["errors"]:
+            regressions.append(f"{name}: {now['errors']} errors (baseline {base['errors']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and latency benchmark")
+    parser.add_argument("--database-url", help="Throwaway database (default: temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per HTTP scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--socket-clients", type=int, default=1000, help="0 skips the Socket.IO scenarios")
+    parser.add_argument("--socket-writes", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Compare with this results file and exit 1 on regressions")
+    parser.add_argument("--save-baseline", help="Write the results as a baseline to this file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench_load.db')}"
+        results = asyncio.run(run(args, database_url))
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                f.write(output + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""
+Behaviour under overload with admission control (admission.py) on and off.
+
+The app runs with a deliberately small connection pool (--pool-size, no
+overflow) and receives open-loop traffic (Poisson arrivals at a fixed rate,
+whatever the response times) above its capacity for --duration seconds:
+    read   GET /posts/{post} and GET /web/posts/{post} at --read-rate
+    write  POST /posts/ at --write-rate
+    bulk   POST /posts/bulk with --bulk-rows rows at --bulk-rate
+while a probe requests /check-db every 100 ms, as an orchestrator would.
+Clients give up after --timeout seconds (counted as errors).
+
+Reported per class: successful requests, goodput (successes within --slo-ms
+per second), 503s, other errors, and p50/p99 of the successful requests;
+for the probe also the slowest answer.
+Use:
+    python benchmarks/bench_overload.py                         - SQLite, 30 s per mode
+    python benchmarks/bench_overload.py --read-rate 200 --write-rate 40 --duration 60
+    python benchmarks/bench_overload.py --database-url postgresql+asyncpg://.../bench
+
+Latency numbers depend on the machine, so only compare runs made on the same
+hardware with the same options.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import Server, percentile, raise_fd_limit  # noqa: E402
+
+PROBE_INTERVAL = 0.1
+
+
+def to_ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+class Tally:
+    def __init__(self):
+        self.latencies = []
+        self.shed = 0
+        self.errors = 0
+
+    def summary(self, elapsed, slo):
+        good = sum(1 for latency in self.latencies if latency <= slo)
+        return {
+            "ok": len(self.latencies),
+            "goodput_rps": round(good / elapsed, 1),
+            "shed_503": self.shed,
+            "errors": self.errors,
+            "p50_ms": to_ms(percentile(self.latencies, 0.50)),
+            "p99_ms": to_ms(percentile(self.latencies, 0.99)),
+        }
+
+
+def bulk_body(rows, user, rng):
+    lines = (
+        json.dumps({"title": f"overload {rng.random():.6f}", "content": "bulk " * 50, "author_id": user})
+        for _ in range(rows)
+    )
+    return "\n".join(lines).encode()
+
+
+async def arrivals(tally, deadline, rate, request, rng):
+    """
+    Start `request` at Poisson arrivals of `rate` per second until `deadline`
+    """
+    async def one():
+        started = time.perf_counter()
+        try:
+            response = await request()
+        except httpx.HTTPError:
+            tally.errors += 1
+            return
+        if response.status_code == 503:
+            tally.shed += 1
+        elif response.status_code >= 500:
+            tally.errors += 1
+        else:
+            tally.latencies.append(time.perf_counter() - started)
+
+    tasks = []
+    while rate and time.monotonic() < deadline:
+        tasks.append(asyncio.create_task(one()))
+        await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+
+
+async def probe_loop(client, tally, deadline):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.get("/check-db")
+            if response.status_code == 200:
+                tally.latencies.append(time.perf_counter() - started)
+            else:
+                tally.errors += 1
+        except httpx.HTTPError:
+            tally.errors += 1
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+async def run_mode(enabled, args, database_url, counts):
+    rng = random.Random(args.seed)
+    server = Server(database_url, args.port)
+    server.env.update({
+        "ADMISSION_ENABLED": "true" if enabled else "false",
+        "DB_POOL_SIZE": str(args.pool_size),
+        "DB_MAX_OVERFLOW": "0",
+        "SOCKETIO_MANAGER": "memory",
+    })
+    await server.start()
+    tallies = {name: Tally() for name in ("read", "write", "bulk", "check-db")}
+    try:
+        # Enough connections that requests never wait for one in the client
+        limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+        async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=args.timeout) as client:
+            def read():
+                path = rng.choice(("/posts/{}", "/web/posts/{}"))
+                return client.get(path.format(rng.randint(1, counts["posts"])))
+
+            def write():
+                return client.post(
+                    f"/posts/?user_id={rng.randint(1, counts['users'])}",
+                    json={"title": "overload", "content": "overload test"}
+                )
+
+            def bulk():
+                return client.post(
+                    "/posts/bulk",
+                    content=bulk_body(args.bulk_rows, rng.randint(1, counts["users"]), rng),
+                    headers={"Content-Type": "application/x-ndjson"}
+                )
+
+            started = time.monotonic()
+            deadline = started + args.duration
+            await asyncio.gather(
+                arrivals(tallies["read"], deadline, args.read_rate, read, rng),
+                arrivals(tallies["write"], deadline, args.write_rate, write, rng),
+                arrivals(tallies["bulk"], deadline, args.bulk_rate, bulk, rng),
+                probe_loop(client, tallies["check-db"], deadline),
+            )
+            elapsed = time.monotonic() - started
+            admission = (await client.get("/admission/stats")).json()
+    finally:
+        server.stop()
+
+    slo = args.slo_ms / 1000
+    results = {name: tally.summary(elapsed, slo) for name, tally in tallies.items()}
+    results["check-db"]["max_ms"] = to_ms(max(tallies["check-db"].latencies, default=None))
+    if enabled:
+        results["admission"] = {
+            key: admission[key] for key in ("limit", "short_rtt", "long_rtt")
+        }
+        results["admission"]["rejected"] = {name: cls["rejected"] for name, cls in admission["classes"].items()}
+    mode = "on" if enabled else "off"
+    for name in ("read", "write", "bulk", "check-db"):
+        row = results[name]
+        print(f"admission {mode:3} {name:8} goodput {row['goodput_rps']:7} req/s  p99 {row['p99_ms']} ms  "
+              f"503 {row['shed_503']}  errors {row['errors']}", file=sys.stderr)
+    return results
+
+
+async def run(args, database_url):
+    os.environ["DATABASE_URL"] = database_url
+    from fixtures import seed_database
+    from database import engine
+
+    counts = await seed_database(args.users, args.posts, args.seed)
+    await engine.dispose()
+
+    modes = {}
+    for enabled in (False, True):
+        modes["on" if enabled else "off"] = await run_mode(enabled, args, database_url, counts)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "database": database_url.split("://", 1)[0],
+            "pool_size": args.pool_size,
+            "read_rate": args.read_rate,
+            "write_rate": args.write_rate,
+            "bulk_rate": args.bulk_rate,
+            "duration_s": args.duration,
+            "slo_ms": args.slo_ms,
+        },
+        "modes": modes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark overload behaviour with and without admission control")
+    parser.add_argument("--database-url", help="Throwaway database (default: temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pool-size", type=int, default=2, help="DB_POOL_SIZE of the server (overflow is 0)")
+    parser.add_argument("--read-rate", type=float, default=60, help="Reads started per second")
+    parser.add_argument("--write-rate", type=float, default=10, help="Writes started per second")
+    parser.add_argument("--bulk-rate", type=float, default=0.5, help="Bulk requests started per second")
+    parser.add_argument("--bulk-rows", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load per mode")
+    parser.add_argument("--timeout", type=float, default=10, help="Seconds before a client gives up")
+    parser.add_argument("--slo-ms", type=float, default=500, help="Latency a success must meet to count as goodput")
+    parser.add_argument("--max-connections", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--output", help="Write the results to this file")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench_overload.db')}"
+        results = asyncio.run(run(args, database_url))
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Show that password hashing doesn't stall the rest of the app.
+
+Starts the app with uvicorn (see bench_load.py) and measures the latency of
+cheap probe requests (GET /stats/posts) twice: on an idle server and while
+signup workers keep POSTing /users/ (one password hash each). Runs this once
+with the hashing pool and once with PASSWORD_HASH_WORKERS=0, which hashes on
+the event loop the way a plain `hasher.hash(password)` in the endpoint would.
+With the pool the probe p99 under signup load should stay close to idle;
+inline it grows by roughly one hash duration per queued signup. Use:
+    python benchmarks/bench_password_hashing.py
+    python benchmarks/bench_password_hashing.py --duration 20 --signup-concurrency 16 --workers 4
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import Server, summarize  # noqa: E402
+
+# Usernames stay unique across every measurement against the same database
+SIGNUP_IDS = itertools.count()
+
+
+async def probe(client, stop, latencies, errors):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            response = await client.get("/stats/posts")
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+
+async def signup(client, stop, latencies, rejected, errors):
+    while not stop.is_set():
+        n = next(SIGNUP_IDS)
+        started = time.perf_counter()
+        try:
+            response = await client.post("/users/", json={
+                "username": f"signup{n}", "email": f"signup{n}@example.com", "password": f"password {n}"
+            })
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        if response.status_code == 503:
+            rejected.append(n)
+            await asyncio.sleep(float(response.headers.get("retry-after", "1")))
+        elif response.status_code >= 400:
+            errors.append(response.status_code)
+        else:
+            latencies.append(time.perf_counter() - started)
+
+
+async def measure(server, args, signups):
+    """
+    Probe latency for args.duration seconds, with `signups` concurrent signup workers
+    """
+    stop = asyncio.Event()
+    probe_latencies, probe_errors = [], []
+    signup_latencies, rejected, signup_errors = [], [], []
+    limits = httpx.Limits(max_connections=args.probe_concurrency + signups + 5)
+    async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=60) as client:
+        tasks = [asyncio.create_task(probe(client, stop, probe_latencies, probe_errors)) for _ in range(args.probe_concurrency)]
+        tasks += [
+            asyncio.create_task(signup(client, stop, signup_latencies, rejected, signup_errors))
+            for _ in range(signups)
+        ]
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    result = {"probe": summarize(probe_latencies, len(probe_errors), elapsed, server.rss_mb())}
+    if signups:
+        result["signup"] = summarize(signup_latencies, len(signup_errors), elapsed, server.rss_mb())
+        result["signup"]["rejected_503"] = len(rejected)
+    return result
+
+
+async def run_mode(name, args, database_url, workers):
+    server = Server(database_url, args.port)
+    server.env["PASSWORD_HASH_WORKERS"] = str(workers)
+    await server.start()
+    try:
+        # Warm up connections and caches
+        await measure(server, argparse.Namespace(**{**vars(args), "duration": 1}), 0)
+        idle = await measure(server, args, 0)
+        loaded = await measure(server, args, args.signup_concurrency)
+    finally:
+        server.stop()
+
+    idle_p99, loaded_p99 = idle["probe"]["p99_ms"], loaded["probe"]["p99_ms"]
+    result = {
+        "workers": workers,
+        "idle": idle,
+        "signup_load": loaded,
+        "probe_p99_slowdown": round(loaded_p99 / idle_p99, 2) if idle_p99 and loaded_p99 else None,
+    }
+    print(
+        f"{name:7} probe p99 idle {idle_p99} ms, under signups {loaded_p99} ms "
+        f"({result['probe_p99_slowdown']}x), {loaded['signup']['throughput_rps']} signups/s",
+        file=sys.stderr
+    )
+    return result
+
+
+async def run(args, database_url):
+    os.environ["DATABASE_URL"] = database_url
+    from fixtures import seed_database
+    from database import engine
+    from passwords import PASSWORD_HASH_WORKERS
+
+    await seed_database(users=10, posts=100, seed=42)
+    await engine.dispose()
+
+    workers = args.workers or PASSWORD_HASH_WORKERS
+    return {
+        "meta": {
+            "cpus": os.cpu_count(),
+            "duration_s": args.duration,
+            "probe_concurrency": args.probe_concurrency,
+            "signup_concurrency": args.signup_concurrency,
+        },
+        "pool": await run_mode("pool", args, database_url, workers),
+        "inline": await run_mode("inline", args, database_url, 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app latency under concurrent signup load")
+    parser.add_argument("--database-url", help="Throwaway database (default: temporary SQLite file)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per measurement")
+    parser.add_argument("--probe-concurrency", type=int, default=4)
+    parser.add_argument("--signup-concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, help="Hashing pool size (default: PASSWORD_HASH_WORKERS)")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench_password_hashing.db')}"
+        results = asyncio.run(run(args, database_url))
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Bytes a posts list query reads with bodies inline versus the compact row.
+
+inline:  every column plus the full body, joined from post_bodies
+         (what select(Post) read while content was a posts column)
+compact: the list columns only (excerpt, word count, content hash, ...),
+         what GET /posts/ selects unless `fields` asks for content
+
+For each, one page of `--limit` posts and a full scan are fetched; "row
+bytes" is the size of the values the database sent back (text and binary
+lengths, 8 bytes per number or timestamp), "json bytes" the serialized page.
+
+Seeds the fixture from fixtures.py into a throwaway database (SQLite by
+default). Use:
+    python benchmarks/bench_post_storage.py                   - 10k rows
+    python benchmarks/bench_post_storage.py --rows 50000 --limit 100 --repeat 5
+    python benchmarks/bench_post_storage.py --database-url postgresql+asyncpg://.../bench
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def row_bytes(rows):
+    total = 0
+    for row in rows:
+        for value in row:
+            if isinstance(value, str):
+                total += len(value.encode())
+            elif isinstance(value, bytes):
+                total += len(value)
+            elif value is not None:
+                total += 8
+    return total
+
+
+async def run(args):
+    from sqlalchemy.future import select
+
+    from database import engine, SessionLocal
+    from fixtures import seed_database
+    import models
+    from pagination import keyset_order
+    from post_content import body_columns, column_fields, row_dict
+    from serialization import POST_FIELDS, POST_SUMMARY_FIELDS, dumps, projection, to_dicts
+
+    await seed_database(users=100, posts=args.rows, seed=42)
+
+    inline_columns = projection(models.Post, column_fields(POST_FIELDS))
+
+    def inline_query():
+        return (
+            select(*inline_columns, *body_columns())
+            .outerjoin(models.PostBody)
+        )
+
+    def compact_query():
+        return select(*projection(models.Post, POST_SUMMARY_FIELDS))
+
+    scenarios = {
+        "inline": (inline_query, lambda rows: [row_dict(row, POST_FIELDS) for row in rows]),
+        "compact": (compact_query, lambda rows: to_dicts(rows, POST_SUMMARY_FIELDS)),
+    }
+
+    async def fetch(build, limit):
+        query = keyset_order(build(), models.Post)
+        if limit:
+            query = query.limit(limit)
+        async with SessionLocal() as db:
+            return (await db.execute(query)).all()
+
+    results = {}
+    for name, (build, to_plain) in scenarios.items():
+        results[name] = {}
+        for scope, limit in (("page", args.limit), ("scan", None)):
+            rows = await fetch(build, limit)  # warm-up
+            samples = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                rows = await fetch(build, limit)
+                body = dumps(to_plain(rows))
+                samples.append((time.perf_counter() - started) * 1000)
+            results[name][scope] = {
+                "rows": len(rows),
+                "row_bytes": row_bytes(rows),
+                "json_bytes": len(body),
+                "median_ms": round(statistics.median(samples), 1),
+            }
+            print(f"{name:8} {scope:5} {results[name][scope]['median_ms']:8.1f} ms  "
+                  f"{results[name][scope]['row_bytes']} row bytes  {len(body)} json bytes", file=sys.stderr)
+
+    for scope in ("page", "scan"):
+        inline, compact = results["inline"][scope], results["compact"][scope]
+        results["compact"][scope]["row_bytes_ratio"] = round(compact["row_bytes"] / inline["row_bytes"], 3)
+        results["compact"][scope]["speedup"] = round(inline["median_ms"] / compact["median_ms"], 2)
+
+    await engine.dispose()
+    return {"rows": args.rows, "limit": args.limit, "repeat": args.repeat, "scenarios": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bytes read by posts list queries")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--limit", type=int, default=100, help="Posts per page")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--database-url", help="Throwaway database (default: temporary SQLite file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench_post_storage.db')}"
+        results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
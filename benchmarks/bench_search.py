@@ -0,0 +1,133 @@
+"""
+Compare the old `title LIKE '%term%'` search with the tsvector full-text search.
+
+Seeds a synthetic corpus (1M posts by default) into the database from
+DATABASE_URL, which must be a disposable Postgres database. Use:
+    python benchmarks/bench_search.py                   - seed 1M posts and benchmark
+    python benchmarks/bench_search.py --rows 100000     - smaller corpus
+    python benchmarks/bench_search.py --skip-seed       - reuse an existing corpus
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, text
+from sqlalchemy.future import select
+
+from database import engine, SessionLocal
+from migrate import migrate
+from post_content import insert_posts
+import models
+from search import search_posts
+
+VOCABULARY_SIZE = 5000
+BATCH_SIZE = 10000
+
+
+def make_vocabulary(rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(VOCABULARY_SIZE)]
+
+
+def make_sentence(rng, vocabulary, cum_weights, words):
+    return " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=words))
+
+
+async def seed(rows, rng, vocabulary):
+    # Zipf-like word frequencies so some terms are common and some are rare
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    await migrate()
+    async with engine.begin() as conn:
+        await conn.execute(text("TRUNCATE posts, users RESTART IDENTITY CASCADE"))
+        await conn.execute(insert(models.User.__table__), [{
+            "username": "bench", "email": "bench@example.com", "hashed_password": "x", "is_active": True
+        }])
+
+    started = time.perf_counter()
+    for offset in range(0, rows, BATCH_SIZE):
+        batch = [{
+            "title": make_sentence(rng, vocabulary, cum_weights, rng.randint(3, 8)),
+            "content": make_sentence(rng, vocabulary, cum_weights, rng.randint(40, 200)),
+            "published": True,
+            "author_id": 1,
+        } for _ in range(min(BATCH_SIZE, rows - offset))]
+        async with engine.begin() as conn:
+            await insert_posts(conn, batch)
+        print(f"seeded {offset + len(batch)}/{rows}", end="\r", flush=True)
+    print(f"\nseeded {rows} posts in {time.perf_counter() - started:.1f}s")
+
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE posts"))
+
+
+async def time_query(run, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await run()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 2),
+        "max_ms": round(samples[-1], 2),
+    }
+
+
+async def benchmark(terms, repeat, limit):
+    results = []
+    async with SessionLocal() as db:
+        for term in terms:
+            async def old_query():
+                query = select(models.Post).filter(models.Post.title.contains(term)).offset(0).limit(limit)
+                (await db.execute(query)).scalars().all()
+
+            async def fulltext_query():
+                await search_posts(db, term, None, limit)
+
+            matches = (await db.execute(
+                select(func.count()).select_from(models.Post).filter(models.Post.title.contains(term))
+            )).scalar()
+            results.append({
+                "term": term,
+                "title_matches": matches,
+                "like": await time_query(old_query, repeat),
+                "fulltext": await time_query(fulltext_query, repeat),
+            })
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark post search")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Posts in the synthetic corpus")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per query")
+    parser.add_argument("--limit", type=int, default=100, help="Page size")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the corpus")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the existing corpus")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        sys.exit("bench_search needs a Postgres DATABASE_URL")
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng)
+    if not args.skip_seed:
+        await seed(args.rows, rng, vocabulary)
+
+    # A common, a mid-frequency and a rare term, plus a prefix of a common one
+    terms = [vocabulary[0], vocabulary[100], vocabulary[4000], vocabulary[1][:3]]
+    results = await benchmark(terms, args.repeat, args.limit)
+    print(json.dumps({"rows": args.rows, "limit": args.limit, "results": results}, indent=2))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""
+Compare the old list serialization path with the column-projected fast path.
+
+old:    select(Post) -> ORM objects -> List[PostResponse] validation -> json.dumps
+        (what FastAPI does for a response_model)
+fast:   select(columns) -> Core rows -> dicts -> orjson, bodies in one extra query
+sparse: the fast path with fields=id,title,published,created_at,author_id
+
+Seeds the fixture from fixtures.py into a throwaway database (SQLite by
+default). Use:
+    python benchmarks/bench_serialization.py                  - 10k rows
+    python benchmarks/bench_serialization.py --rows 50000 --repeat 5
+    python benchmarks/bench_serialization.py --database-url postgresql+asyncpg://.../bench
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SPARSE_FIELDS = "id,title,published,created_at,author_id"
+
+
+async def run(args):
+    from pydantic import TypeAdapter
+    from sqlalchemy.future import select
+    from sqlalchemy.orm import joinedload
+    from typing import List
+
+    from database import engine, SessionLocal
+    from fixtures import seed_database
+    import models
+    from pagination import keyset_order
+    from post_content import column_fields, post_dicts
+    from schemas import PostResponse
+    from serialization import POST_FIELDS, dumps, parse_fields, projection
+
+    await seed_database(users=100, posts=args.rows, seed=42)
+    adapter = TypeAdapter(List[PostResponse])
+
+    async def old_path():
+        async with SessionLocal() as db:
+            result = await db.execute(
+                keyset_order(select(models.Post).options(joinedload(models.Post.body)), models.Post)
+            )
+            posts = result.scalars().all()
+        validated = adapter.validate_python(posts, from_attributes=True)
+        return json.dumps(adapter.dump_python(validated, mode="json"), separators=(",", ":")).encode()
+
+    def fast(fields):
+        async def fast_path():
+            async with SessionLocal() as db:
+                query = select(*projection(models.Post, column_fields(fields)))
+                result = await db.execute(keyset_order(query, models.Post))
+                return dumps(await post_dicts(db, result.all(), fields))
+        return fast_path
+
+    scenarios = {
+        "old": old_path,
+        "fast": fast(POST_FIELDS),
+        "sparse": fast(parse_fields(SPARSE_FIELDS, POST_FIELDS)),
+    }
+
+    results = {}
+    for name, scenario in scenarios.items():
+        body = await scenario()  # warm-up
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            await scenario()
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = {
+            "median_ms": round(statistics.median(samples), 1),
+            "min_ms": round(min(samples), 1),
+            "bytes": len(body),
+        }
+        print(f"{name:8} {results[name]['median_ms']:8.1f} ms  {len(body)} bytes", file=sys.stderr)
+
+    for name in ("fast", "sparse"):
+        results[name]["speedup"] = round(results["old"]["median_ms"] / results[name]["median_ms"], 2)
+
+    await engine.dispose()
+    return {"rows": args.rows, "repeat": args.repeat, "scenarios": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark list serialization paths")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--database-url", help="Throwaway database (default: temporary SQLite file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench_serialization.db')}"
+        results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
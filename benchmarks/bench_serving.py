@@ -0,0 +1,220 @@
+"""
+Compare `run.py --prod` (serving.py) with the plain uvicorn.run call it replaced.
+
+uvicorn: uvicorn.run("main:app", workers=N) with uvicorn's defaults, what
+         `run.py --prod` did before (N=4)
+prod:    python run.py --prod (worker count from the CPUs, uvloop/httptools
+         when installed, worker recycling, rolling restart on SIGHUP)
+
+Both serve the same seeded database. Every mode runs the read scenarios
+twice: steady, and with SIGHUP sent halfway through ("... during reload"),
+which shows whether requests fail or stall while workers are replaced.
+A few errors remain in both modes: keep-alive connections a stopping worker
+closes just as the client reuses them (a proxy retries those).
+Reported per scenario: p50/p95/p99/max latency, throughput, errors and the
+RSS of the whole process tree. Use:
+    python benchmarks/bench_serving.py                          - SQLite, 2000 requests per scenario
+    python benchmarks/bench_serving.py --workers 4 --concurrency 50
+    python benchmarks/bench_serving.py --database-url postgresql+asyncpg://.../bench
+
+Only compare runs made on the same machine: the prod worker count follows
+the CPUs available (pass --workers to pin both modes to the same count).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import percentile, process_rss_mb, run_http_scenario  # noqa: E402
+
+SCENARIOS = [
+    ("api list posts", "GET", "/posts/", {}),
+    ("api read post", "GET", "/posts/{post}", {}),
+    ("web post detail", "GET", "/web/posts/{post}", {}),
+]
+
+
+def tree_rss_mb(pid):
+    """
+    RSS of `pid` and its children (supervisor plus workers), Linux only
+    """
+    total = process_rss_mb(pid)
+    if total is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return total
+    return round(total + sum(process_rss_mb(child) or 0 for child in children), 1)
+
+
+class Server:
+    def __init__(self, mode, workers, database_url, port):
+        self.mode = mode
+        self.workers = workers
+        self.port = port
+        self.base_url = f"http://127.0.0.1:{port}"
+        # Broadcasts stay in-process: the benchmark only measures HTTP serving
+        self.env = {**os.environ, "DATABASE_URL": database_url, "SOCKETIO_MANAGER": "memory"}
+        self.process = None
+
+    def command(self):
+        if self.mode == "uvicorn":
+            return [sys.executable, "-c",
+                    "import uvicorn; uvicorn.run('main:app', host='127.0.0.1', "
+                    f"port={self.port}, workers={self.workers or 4}, log_level='warning')"]
+        command = [sys.executable, "run.py", "--prod", "--no-migrate", "--port", str(self.port)]
+        if self.workers:
+            command += ["--workers", str(self.workers)]
+        return command
+
+    async def start(self):
+        self.process = subprocess.Popen(
+            self.command(), cwd=ROOT, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        async with httpx.AsyncClient() as client:
+            for _ in range(300):
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"{self.mode} server exited with code {self.process.returncode}")
+                try:
+                    await client.get(self.base_url + "/check-db")
+                    # Give the remaining workers time to finish starting
+                    await asyncio.sleep(2)
+                    return
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+        raise RuntimeError(f"{self.mode} server did not start")
+
+    def reload(self):
+        os.kill(self.process.pid, signal.SIGHUP)
+
+    def rss_mb(self):
+        return tree_rss_mb(self.process.pid)
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=60)
+
+
+def to_ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def summarize(latencies, errors, elapsed, rss_mb):
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50_ms": to_ms(percentile(latencies, 0.50)),
+        "p95_ms": to_ms(percentile(latencies, 0.95)),
+        "p99_ms": to_ms(percentile(latencies, 0.99)),
+        "max_ms": to_ms(max(latencies) if latencies else None),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "rss_mb": rss_mb,
+    }
+
+
+async def run_mode(mode, args, database_url, counts):
+    rng = random.Random(args.seed)
+    server = Server(mode, args.workers, database_url, args.port)
+    await server.start()
+    results = {"idle": {"rss_mb": server.rss_mb()}}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=120) as client:
+            for name, method, path, kwargs in SCENARIOS:
+                await run_http_scenario(client, method, path, kwargs, args.concurrency, args.concurrency, counts, rng)
+                latencies, errors, elapsed = await run_http_scenario(
+                    client, method, path, kwargs, args.requests, args.concurrency, counts, rng
+                )
+                results[name] = summarize(latencies, errors, elapsed, server.rss_mb())
+                print(f"{mode:8} {name:36} p95 {results[name]['p95_ms']} ms, "
+                      f"{results[name]['throughput_rps']} req/s, {errors} errors", file=sys.stderr)
+
+            # Same load again with a reload in the middle of it
+            name, method, path, kwargs = SCENARIOS[0]
+            loop = asyncio.get_running_loop()
+            loop.call_later(args.reload_after, server.reload)
+            latencies, errors, elapsed = await run_http_scenario(
+                client, method, path, kwargs, args.reload_requests, args.concurrency, counts, rng
+            )
+            reload_name = f"{name} during reload"
+            results[reload_name] = summarize(latencies, errors, elapsed, server.rss_mb())
+            print(f"{mode:8} {reload_name:36} p99 {results[reload_name]['p99_ms']} ms, "
+                  f"max {results[reload_name]['max_ms']} ms, {errors} errors", file=sys.stderr)
+    finally:
+        server.stop()
+    return results
+
+
+async def run(args, database_url):
+    os.environ["DATABASE_URL"] = database_url
+    from fixtures import seed_database
+    from database import engine
+
+    counts = await seed_database(args.users, args.posts, args.seed)
+    await engine.dispose()
+
+    modes = {}
+    for mode in ("uvicorn", "prod"):
+        modes[mode] = await run_mode(mode, args, database_url, counts)
+
+    from serving import available_cpus, default_workers, resolve_http, resolve_loop
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "cpus_available": available_cpus(),
+            "database": database_url.split("://", 1)[0],
+            "workers": {"uvicorn": args.workers or 4, "prod": args.workers or default_workers()},
+            "prod_loop": resolve_loop(),
+            "prod_http": resolve_http(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "modes": modes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark run.py --prod against plain uvicorn.run")
+    parser.add_argument("--database-url", help="Throwaway database (default: temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Workers for both modes; 0 lets prod pick (uvicorn mode then uses 4)")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--reload-requests", type=int, default=3000, help="Requests in the reload scenario")
+    parser.add_argument("--reload-after", type=float, default=1.0, help="Seconds into the reload scenario to send SIGHUP")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", help="Write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench_serving.db')}"
+        results = asyncio.run(run(args, database_url))
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Deterministic users/posts fixture for benchmarks, built on the models.
+
+Use from another benchmark (`await seed_database(users=..., posts=...)`) or
+on its own against the database from DATABASE_URL:
+    python benchmarks/fixtures.py --users 1000 --posts 50000
+
+Existing users and posts are wiped first, so point it at a disposable database.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, insert, text
+
+from database import engine
+from migrate import migrate
+from post_content import insert_posts
+from stats import ensure_post_stats
+import models
+
+BATCH_SIZE = 5000
+# Posts are spread over the year before this date so every run seeds the same rows
+FIXTURE_EPOCH = datetime(2025, 1, 1)
+WORDS = (
+    "async database socket template cache query index replica worker latency "
+    "stream batch cursor render event update delete create post user page"
+).split()
+
+
+def user_rows(count):
+    for i in range(1, count + 1):
+        yield {
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "hashed_password": "x",
+            "is_active": True,
+        }
+
+
+def post_rows(count, author_ids, rng):
+    for _ in range(count):
+        yield {
+            "title": " ".join(rng.choices(WORDS, k=rng.randint(3, 8))).capitalize(),
+            "content": " ".join(rng.choices(WORDS, k=rng.randint(30, 150))),
+            "published": rng.random() < 0.8,
+            "author_id": rng.choice(author_ids),
+            "created_at": FIXTURE_EPOCH - timedelta(seconds=rng.randint(0, 365 * 24 * 3600)),
+        }
+
+
+async def insert_batches(write, rows):
+    """
+    Insert `rows` BATCH_SIZE at a time with `write(conn, batch)`, one
+    transaction per batch; returns the new ids
+    """
+    ids = []
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            ids.extend(await insert_batch(write, batch))
+            batch = []
+    if batch:
+        ids.extend(await insert_batch(write, batch))
+    return ids
+
+
+async def insert_batch(write, batch):
+    async with engine.begin() as conn:
+        return await write(conn, batch)
+
+
+async def write_users(conn, batch):
+    table = models.User.__table__
+    result = await conn.execute(insert(table).returning(table.c.id), batch)
+    return result.scalars().all()
+
+
+async def write_posts(conn, batch):
+    # Same path as bulk ingest: derived columns, search vector and bodies
+    return [post_id for post_id, _ in await insert_posts(conn, batch)]
+
+
+async def seed_database(users=100, posts=1000, seed=42):
+    """
+    Migrate the schema, wipe users/posts and insert `users` users and `posts`
+    posts, then recount the post counters. The same seed always produces the
+    same rows. Returns the row counts.
+    """
+    rng = random.Random(seed)
+    await migrate()
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("TRUNCATE posts, users, post_stats RESTART IDENTITY CASCADE"))
+        else:
+            await conn.execute(delete(models.PostStat.__table__))
+            await conn.execute(delete(models.PostBody.__table__))
+            await conn.execute(delete(models.Post.__table__))
+            await conn.execute(delete(models.User.__table__))
+
+    author_ids = await insert_batches(write_users, user_rows(users))
+    await insert_batches(write_posts, post_rows(posts, author_ids, rng))
+    async with engine.begin() as conn:
+        await ensure_post_stats(conn)
+    return {"users": users, "posts": posts}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Seed the benchmark fixture")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = await seed_database(args.users, args.posts, args.seed)
+    await engine.dispose()
+    print(f"seeded {counts['users']} users and {counts['posts']} posts in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
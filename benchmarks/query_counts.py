@@ -0,0 +1,113 @@
+"""
+Count SQL statements issued per endpoint and fail when a count goes up.
+
+Runs the app in-process against a throwaway database (SQLite by default) with
+the read-through cache cleared before every request, so the numbers reflect
+the database path. Use:
+    python benchmarks/query_counts.py            - compare with query_counts.json
+    python benchmarks/query_counts.py --update   - record a new baseline
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_counts.json")
+
+# Scenarios run in order against the seeded data; ids refer to seeded rows
+SCENARIOS = [
+    ("list posts", "GET", "/posts/", {}),
+    ("read post", "GET", "/posts/1", {}),
+    ("list users", "GET", "/users/", {}),
+    ("create post", "POST", "/posts/?user_id=1", {"json": {"title": "t", "content": "c"}}),
+    ("create post unknown user", "POST", "/posts/?user_id=999", {"json": {"title": "t", "content": "c"}}),
+    ("update post", "PUT", "/posts/1", {"json": {"title": "updated"}}),
+    ("delete post", "DELETE", "/posts/2", {}),
+    ("web posts list", "GET", "/web/posts", {}),
+    ("web post detail", "GET", "/web/posts/1", {}),
+    ("web create post form", "GET", "/web/posts/create", {}),
+    ("web edit post form", "GET", "/web/posts/1/edit", {}),
+    ("web create post", "POST", "/web/posts/create", {"data": {"title": "t", "content": "c", "author_id": 1}}),
+    ("web update post", "POST", "/web/posts/1/edit", {"data": {"title": "t", "content": "c", "author_id": 1}}),
+    ("web delete post", "POST", "/web/posts/3/delete", {}),
+    ("web users list", "GET", "/web/users", {}),
+]
+
+
+def run_scenarios(database_url):
+    os.environ["DATABASE_URL"] = database_url
+    # Job worker polls would land in whichever request happens to be running
+    os.environ["JOBS_WORKERS"] = "0"
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    import main
+    from cache import cache
+    from database import engine
+
+    statements = []
+    event.listen(
+        engine.sync_engine, "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement)
+    )
+
+    counts = {}
+    with TestClient(main.app) as client:
+        client.post("/users/", json={"username": "bench", "email": "bench@example.com", "password": "x"})
+        for i in range(5):
+            client.post("/posts/?user_id=1", json={"title": f"post {i}", "content": "body", "published": True})
+
+        for name, method, path, kwargs in SCENARIOS:
+            client.portal.call(cache.clear)
+            statements.clear()
+            response = client.request(method, path, follow_redirects=False, **kwargs)
+            if response.status_code >= 500:
+                raise RuntimeError(f"{name}: {method} {path} returned {response.status_code}")
+            counts[name] = len(statements)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check SQL statement counts per endpoint")
+    parser.add_argument("--update", action="store_true", help="Write the current counts as the new baseline")
+    parser.add_argument("--database-url", help="Throwaway database to run against (default: temporary SQLite file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'query_counts.db')}"
+        counts = run_scenarios(database_url)
+
+    if args.update or not os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(counts, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_FILE}")
+        return 0
+
+    with open(BASELINE_FILE) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for name, count in counts.items():
+        expected = baseline.get(name)
+        marker = ""
+        if expected is not None and count > expected:
+            regressions.append(name)
+            marker = f"  REGRESSION (baseline {expected})"
+        elif expected is not None and count < expected:
+            marker = f"  improved (baseline {expected}), run with --update"
+        print(f"{name:30} {count}{marker}")
+
+    if regressions:
+        print(f"\n{len(regressions)} endpoint(s) issue more SQL statements than the baseline")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from metrics import Histogram
+
+# Jendela penggabungan: event yang masuk dalam jendela yang sama dikirim sekali,
+# dan flush berikutnya paling cepat satu jendela kemudian
+BROADCAST_WINDOW_MS = float(os.getenv("BROADCAST_WINDOW_MS", "100"))
+# Batas event berbeda yang menunggu; jika penuh event tertua dibuang
+# (delta daftar post tidak pernah dibuang, melainkan langsung di-flush)
+BROADCAST_MAX_PENDING = int(os.getenv("BROADCAST_MAX_PENDING", "10000"))
+# Jumlah post yang state terakhirnya diingat untuk update diff-only
+BROADCAST_DIFF_CACHE_SIZE = int(os.getenv("BROADCAST_DIFF_CACHE_SIZE", "1000"))
+
+LIST_EVENT = "posts_list_update"
+
+_MISSING = object()
+
+
+class FieldDiffer:
+    """State terakhir yang dikirim per kunci, untuk mengirim field yang berubah saja
+
+    diff() mengembalikan (field yang berubah, versi basis). Versi basis adalah
+    nilai `version_field` dari state sebelumnya; klien hanya boleh menerapkan
+    diff jika state yang dimilikinya berada di versi itu, selain itu klien
+    mengambil state penuh. Tanpa state sebelumnya (kunci baru atau sudah
+    tergusur dari LRU) hasilnya state penuh dengan basis None.
+    """
+
+    def __init__(self, version_field: str, max_entries: int = BROADCAST_DIFF_CACHE_SIZE):
+        self.version_field = version_field
+        self.max_entries = max_entries
+        self._last: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self.full = 0
+        self.diffs = 0
+
+    def remember(self, key: Hashable, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Simpan state yang baru dikirim; kembalikan state sebelumnya"""
+        previous = self._last.pop(key, None)
+        self._last[key] = state
+        if len(self._last) > self.max_entries:
+            self._last.popitem(last=False)
+        return previous
+
+    def diff(self, key: Hashable, state: Dict[str, Any]) -> Tuple[Dict[str, Any], Any, bool]:
+        """(payload, versi basis, apakah diff) untuk state baru `state`"""
+        previous = self.remember(key, state)
+        if previous is None:
+            self.full += 1
+            return state, None, False
+        self.diffs += 1
+        changed = {name: value for name, value in state.items() if previous.get(name, _MISSING) != value}
+        return changed, previous.get(self.version_field), True
+
+    def forget(self, key: Hashable) -> None:
+        self._last.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"tracked": len(self._last), "full": self.full, "diffs": self.diffs}
+
+
+class BroadcastScheduler:
+    """Antrean broadcast Socket.IO yang dikirim oleh task latar belakang
+
+    Request hanya mengantrikan event lalu langsung kembali. Event dengan
+    (event, room, key) yang sama dalam satu jendela digabung: yang terakhir
+    menang. Delta daftar post digabung per post_id, dicatat ke changelog saat
+    flush dan dikirim sebagai satu `posts_list_update`.
+    """
+
+    def __init__(self, sio, changelog, window: float = BROADCAST_WINDOW_MS / 1000,
+                 max_pending: int = BROADCAST_MAX_PENDING):
+        self.sio = sio
+        self.changelog = changelog
+        self.window = window
+        self.max_pending = max_pending
+        # (event, room, key) -> [data, waktu antre pertama]
+        self._pending: "OrderedDict[Tuple[str, Optional[str], Hashable], list]" = OrderedDict()
+        # post_id -> (change_type, post_id, post_data)
+        self._list_changes: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._list_queued_at: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._urgent = False
+        self._task: Optional[asyncio.Task] = None
+        self._sequence = 0
+        # event -> fungsi yang mengubah data tepat sebelum emit (mis. jadi diff)
+        self.transforms: Dict[str, Callable[[Any], Any]] = {}
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.emitted = 0
+        self.flushes = 0
+        self.errors = 0
+        # Waktu dari event diantrikan sampai emit selesai
+        self.emit_latency = Histogram()
+        self.flush_duration = Histogram()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending) + len(self._list_changes)
+
+    def emit(self, event: str, data: Any, room: Optional[str] = None, key: Hashable = None) -> None:
+        """Antrikan satu emit; tanpa `key` event tidak pernah digabung"""
+        self.enqueued += 1
+        if key is None:
+            self._sequence += 1
+            key = ("seq", self._sequence)
+        slot = (event, room, key)
+        entry = self._pending.get(slot)
+        if entry is not None:
+            entry[0] = data
+            self.coalesced += 1
+        else:
+            if len(self._pending) >= self.max_pending:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+            self._pending[slot] = [data, time.perf_counter()]
+        self._wake()
+
+    def post_list_changes(self, changes) -> None:
+        """Antrikan delta daftar post berupa tuple (change_type, post_id, post_data)"""
+        for change_type, post_id, post_data in changes:
+            self.enqueued += 1
+            previous = self._list_changes.pop(post_id, None)
+            if previous is not None:
+                self.coalesced += 1
+                # Post yang dibuat lalu diubah dalam jendela yang sama tetap "created"
+                if previous[0] == "created" and change_type == "updated":
+                    change_type = "created"
+            self._list_changes[post_id] = (change_type, post_id, post_data)
+        if self._list_queued_at is None:
+            self._list_queued_at = time.perf_counter()
+        if len(self._list_changes) >= self.max_pending:
+            self._urgent = True
+        self._wake()
+
+    def _wake(self) -> None:
+        self.start()
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if not self._urgent:
+                await asyncio.sleep(self.window)
+            self._wakeup.clear()
+            self._urgent = False
+            try:
+                await self.flush()
+            except Exception as e:
+                self.errors += 1
+                print(f"Broadcast flush failed: {e}")
+
+    async def flush(self) -> None:
+        """Kirim semua event yang menunggu"""
+        started = time.perf_counter()
+        pending, self._pending = self._pending, OrderedDict()
+        changes, self._list_changes = list(self._list_changes.values()), OrderedDict()
+        list_queued_at, self._list_queued_at = self._list_queued_at, None
+
+        if changes:
+            try:
+                recorded = await self.changelog.record(changes)
+            except Exception:
+                # Kembalikan delta ke antrean supaya dicoba lagi di jendela berikutnya
+                self.post_list_changes(changes)
+                self.enqueued -= len(changes)
+                raise
+            pending[(LIST_EVENT, None, None)] = [
+                {"version": recorded[-1]["version"], "changes": recorded}, list_queued_at
+            ]
+            pending.move_to_end((LIST_EVENT, None, None), last=False)
+
+        for (event, room, _), (data, queued_at) in pending.items():
+            try:
+                # Diubah saat flush, bukan saat diantrikan, supaya event yang
+                # digabung tetap dibandingkan dengan yang benar-benar terkirim
+                transform = self.transforms.get(event)
+                if transform is not None:
+                    data = transform(data)
+                # Dienkode sekali per emit: python-socketio memakai paket yang
+                # sama untuk semua penerima di room
+                await self.sio.emit(event, data, room=room)
+                self.emitted += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Broadcast of {event} failed: {e}")
+            self.emit_latency.observe(time.perf_counter() - queued_at)
+
+        if pending:
+            self.flushes += 1
+            self.flush_duration.observe(time.perf_counter() - started)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Hentikan task dan kirim sisa antrean"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "emitted": self.emitted,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "window_ms": self.window * 1000,
+            "emit_latency": self.emit_latency.snapshot(),
+            "flush_duration": self.flush_duration.snapshot(),
+        }
@@ -0,0 +1,232 @@
+import os
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+import models
+from cache import invalidate_posts, invalidate_users
+from passwords import passwords
+from post_content import insert_posts
+from schemas import PostBulkCreate, UserCreate
+from sockets import broadcast_post_list_changes
+from stats import PostStatsDelta
+
+# Rows validated and written per transaction
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+# Per-row errors kept in the report; further errors are only counted
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", "1000"))
+# Longest NDJSON line accepted; a longer one ends the upload (413)
+BULK_MAX_LINE_BYTES = int(os.getenv("BULK_MAX_LINE_BYTES", str(1024 * 1024)))
+
+
+class LineTooLong(Exception):
+    def __init__(self, line: int):
+        super().__init__(f"Line is longer than {BULK_MAX_LINE_BYTES} bytes; the rest of the upload was not read")
+        self.line = line
+
+
+class BulkReport:
+    """
+    Outcome of a bulk ingest: counters plus a bounded list of per-row errors
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.batches = 0
+        self.aborted = False
+        self.errors: List[Dict[str, Any]] = []
+
+    def add_error(self, line: int, error: Any) -> None:
+        self.failed += 1
+        if len(self.errors) < BULK_MAX_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "batches": self.batches,
+            "aborted": self.aborted,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def iter_ndjson(
+    stream: AsyncIterator[bytes],
+    max_line_bytes: int = BULK_MAX_LINE_BYTES
+) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Split a byte stream into (line number, line) pairs, skipping blank lines.
+    Raises LineTooLong as soon as a line exceeds max_line_bytes, so one huge
+    or newline-free upload is never buffered whole.
+    """
+    buffer = bytearray()
+    line_no = 0
+    async for chunk in stream:
+        # Only the new chunk can hold newlines not seen yet
+        scan_from = len(buffer)
+        buffer += chunk
+        start = 0
+        newline = buffer.find(b"\n", scan_from)
+        while newline != -1:
+            line_no += 1
+            if newline - start > max_line_bytes:
+                raise LineTooLong(line_no)
+            line = bytes(buffer[start:newline])
+            if line.strip():
+                yield line_no, line
+            start = newline + 1
+            newline = buffer.find(b"\n", start)
+        del buffer[:start]
+        if len(buffer) > max_line_bytes:
+            raise LineTooLong(line_no + 1)
+    if buffer.strip():
+        yield line_no + 1, bytes(buffer)
+
+
+async def iter_batches(
+    stream: AsyncIterator[bytes],
+    schema: type,
+    report: BulkReport
+) -> AsyncIterator[List[Tuple[int, BaseModel]]]:
+    """
+    Validate NDJSON lines with `schema` and group the valid ones into batches.
+    Invalid lines are recorded in the report.
+    """
+    batch: List[Tuple[int, BaseModel]] = []
+    try:
+        async for line_no, line in iter_ndjson(stream):
+            try:
+                batch.append((line_no, schema.model_validate_json(line)))
+            except ValidationError as e:
+                report.add_error(line_no, e.errors(include_url=False, include_context=False))
+            if len(batch) >= BULK_BATCH_SIZE:
+                yield batch
+                batch = []
+    except LineTooLong as e:
+        # Rows before the long line are still written
+        report.add_error(e.line, str(e))
+        report.aborted = True
+    if batch:
+        yield batch
+
+
+async def ingest_posts(db: AsyncSession, stream: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """
+    Insert posts from an NDJSON stream, one multi-row INSERT (plus one for
+    the bodies) and one transaction per batch, with a single list update
+    broadcast per batch
+    """
+    report = BulkReport()
+    async for batch in iter_batches(stream, PostBulkCreate, report):
+        report.batches += 1
+
+        # One lookup per batch for every author referenced in it
+        author_ids = {post.author_id for _, post in batch}
+        result = await db.execute(
+            select(models.User.id, models.User.username).filter(models.User.id.in_(author_ids))
+        )
+        authors = dict(result.all())
+
+        rows = []
+        for line_no, post in batch:
+            if post.author_id not in authors:
+                report.add_error(line_no, f"User with id {post.author_id} not found")
+            else:
+                rows.append((line_no, post))
+        if not rows:
+            continue
+
+        try:
+            inserted = await insert_posts(db, [post.model_dump() for _, post in rows])
+            delta = PostStatsDelta()
+            for (_, post), (_, created_at) in zip(rows, inserted):
+                delta.add(post.author_id, post.published, created_at)
+            await delta.apply(db)
+            await db.commit()
+        except IntegrityError as e:
+            await db.rollback()
+            for line_no, _ in rows:
+                report.add_error(line_no, f"Batch rejected by the database: {e.orig}")
+            continue
+
+        report.inserted += len(inserted)
+        changes = []
+        for (_, post), (post_id, created_at) in zip(rows, inserted):
+            changes.append(("created", post_id, {
+                "id": post_id,
+                "title": post.title,
+                "author": authors[post.author_id],
+                "published": post.published,
+                "created_at": created_at.isoformat(),
+                "author_id": post.author_id
+            }))
+        await invalidate_posts([post_id for post_id, _ in inserted])
+        await broadcast_post_list_changes(changes)
+
+    return report.as_dict()
+
+
+async def ingest_users(db: AsyncSession, stream: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """
+    Insert users from an NDJSON stream, one multi-row INSERT and one
+    transaction per batch. Duplicate usernames/emails are reported per row.
+    """
+    report = BulkReport()
+    async for batch in iter_batches(stream, UserCreate, report):
+        report.batches += 1
+
+        usernames = {user.username for _, user in batch}
+        emails = {user.email for _, user in batch}
+        result = await db.execute(
+            select(models.User.username, models.User.email).filter(
+                or_(models.User.username.in_(usernames), models.User.email.in_(emails))
+            )
+        )
+        taken_usernames = set()
+        taken_emails = set()
+        for username, email in result.all():
+            taken_usernames.add(username)
+            taken_emails.add(email)
+
+        rows = []
+        for line_no, user in batch:
+            if user.username in taken_usernames or user.email in taken_emails:
+                report.add_error(line_no, "Username or email already registered")
+                continue
+            # Also rejects duplicates within the same stream
+            taken_usernames.add(user.username)
+            taken_emails.add(user.email)
+            rows.append((line_no, {
+                "username": user.username,
+                "email": user.email,
+                "password": user.password,
+                "is_active": user.is_active
+            }))
+        if not rows:
+            continue
+
+        # Hashed on the password worker pool, a few at a time
+        hashed = await passwords.hash_many([values.pop("password") for _, values in rows])
+        for (_, values), hashed_password in zip(rows, hashed):
+            values["hashed_password"] = hashed_password
+
+        try:
+            await db.execute(insert(models.User.__table__), [values for _, values in rows])
+            await db.commit()
+        except IntegrityError as e:
+            await db.rollback()
+            for line_no, _ in rows:
+                report.add_error(line_no, f"Batch rejected by the database: {e.orig}")
+            continue
+
+        report.inserted += len(rows)
+        await invalidate_users()
+
+    return report.as_dict()
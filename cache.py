@@ -0,0 +1,297 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import pickle
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Cache settings from environment variables
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+# Optional shared tier: "redis://..." or "memory://" (in-process stand-in for tests)
+CACHE_SHARED_URL = os.getenv("CACHE_SHARED_URL", "")
+
+_MISSING = object()
+
+
+class SharedCacheBackend(ABC):
+    """
+    Interface for a cache tier shared between workers. Values are bytes.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """The stored value, or None when missing or expired"""
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        """Store a value for `ttl` seconds"""
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        """Drop keys (missing ones are ignored)"""
+
+
+class InMemorySharedCache(SharedCacheBackend):
+    """
+    Local stand-in for a shared tier, used in tests and single-process setups
+    """
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+
+    async def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key, value, ttl):
+        self._data[key] = (value, time.monotonic() + ttl)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._data.pop(key, None)
+
+
+class RedisSharedCache(SharedCacheBackend):
+    """
+    Shared tier backed by Redis (requires the optional `redis` package)
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self._client = redis.from_url(url)
+
+    async def get(self, key):
+        return await self._client.get(key)
+
+    async def set(self, key, value, ttl):
+        await self._client.set(key, value, px=int(ttl * 1000))
+
+    async def delete(self, *keys):
+        if keys:
+            await self._client.delete(*keys)
+
+
+class LocalCache:
+    """
+    In-process LRU cache with per-entry TTL and a bounded number of entries
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Flight:
+    """A load in progress; `stale` is set when the key is invalidated meanwhile"""
+    __slots__ = ("future", "stale")
+
+    def __init__(self, future):
+        self.future = future
+        self.stale = False
+
+
+class TieredCache:
+    """
+    Read-through cache: local LRU tier, then the optional shared tier, then the
+    loader. Concurrent misses for the same key share one load (single-flight).
+
+    Local tiers of other workers are cleared through on_invalidate (main.py
+    sends the keys over the Socket.IO pub/sub channel); with the in-memory
+    Socket.IO manager there is no channel, so only TTL clears them.
+    """
+
+    def __init__(self, local: LocalCache, shared: Optional[SharedCacheBackend] = None, ttl: float = CACHE_TTL):
+        self.local = local
+        self.shared = shared
+        self.ttl = ttl
+        self._inflight: Dict[str, _Flight] = {}
+        self.stats = {
+            "local_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "invalidations": 0,
+            "remote_invalidations": 0,
+        }
+        # Called with the keys after every invalidate(), to clear the local
+        # tiers of other workers
+        self.on_invalidate: Optional[Callable[[tuple], Awaitable[None]]] = None
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        ttl = ttl or self.ttl
+        value = self.local.get(key)
+        if value is not _MISSING:
+            self.stats["local_hits"] += 1
+            return value
+
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(flight.future)
+
+        flight = _Flight(asyncio.get_running_loop().create_future())
+        self._inflight[key] = flight
+        try:
+            value = await self._load(key, loader, ttl, flight)
+        except asyncio.CancelledError:
+            flight.future.cancel()
+            raise
+        except Exception as e:
+            flight.future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            flight.future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        flight.future.set_result(value)
+        return value
+
+    async def _load(self, key, loader, ttl, flight):
+        if self.shared is not None:
+            raw = await self.shared.get(key)
+            if raw is not None:
+                self.stats["shared_hits"] += 1
+                value = pickle.loads(raw)
+                if not flight.stale:
+                    self.local.set(key, value, ttl)
+                return value
+
+        self.stats["misses"] += 1
+        value = await loader()
+        # Don't store a value that was invalidated while it was loading
+        if not flight.stale:
+            self.local.set(key, value, ttl)
+            if self.shared is not None:
+                await self.shared.set(key, pickle.dumps(value), ttl)
+        return value
+
+    async def invalidate(self, *keys: str) -> None:
+        self.stats["invalidations"] += len(keys)
+        self._drop_local(keys)
+        if self.shared is not None:
+            await self.shared.delete(*keys)
+        if self.on_invalidate is not None:
+            await self.on_invalidate(keys)
+
+    def invalidate_local(self, *keys: str) -> None:
+        """
+        Drop keys from this worker's local tier only (an invalidation made by another worker)
+        """
+        self.stats["remote_invalidations"] += len(keys)
+        self._drop_local(keys)
+
+    def _drop_local(self, keys) -> None:
+        self.local.delete(*keys)
+        for key in keys:
+            flight = self._inflight.pop(key, None)
+            if flight is not None:
+                flight.stale = True
+
+    async def clear(self) -> None:
+        """
+        Drop every local entry (the shared tier is left alone)
+        """
+        for key in list(self.local._data):
+            await self.invalidate(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["local_hits"] + self.stats["shared_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "entries": len(self.local),
+            "evictions": self.local.evictions,
+            "shared_tier": type(self.shared).__name__ if self.shared else None,
+        }
+
+
+def create_shared_backend(url: str) -> Optional[SharedCacheBackend]:
+    """
+    Pick the shared tier from CACHE_SHARED_URL
+    """
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return InMemorySharedCache()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisSharedCache(url)
+    raise ValueError(f"Unsupported CACHE_SHARED_URL: {url}")
+
+
+cache = TieredCache(LocalCache(), create_shared_backend(CACHE_SHARED_URL))
+
+# Cache keys
+POSTS_LIST_KEY = "posts:list"
+USERS_CHOICES_KEY = "users:choices"
+
+
+def post_key(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+def post_detail_key(post_id: int) -> str:
+    return f"post:{post_id}:detail"
+
+
+async def invalidate_post(post_id: int) -> None:
+    """
+    Drop every cached view of a post, including the posts list
+    """
+    await cache.invalidate(post_key(post_id), post_detail_key(post_id), POSTS_LIST_KEY)
+
+
+async def invalidate_posts(post_ids) -> None:
+    """
+    Same as invalidate_post for a batch of posts
+    """
+    keys = [POSTS_LIST_KEY]
+    for post_id in post_ids:
+        keys += [post_key(post_id), post_detail_key(post_id)]
+    await cache.invalidate(*keys)
+
+
+async def invalidate_users() -> None:
+    """
+    Drop cached user lists (author dropdowns, author names in the posts list)
+    """
+    await cache.invalidate(USERS_CHOICES_KEY, POSTS_LIST_KEY)
@@ -0,0 +1,121 @@
+import os
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+# Bodies smaller than this are sent as-is; compressing them costs more than it saves
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Levels for dynamic responses: fast settings, static assets are pre-compressed at maximum
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# Already compressed or streamed event by event
+EXCLUDED_CONTENT_TYPES = (
+    "text/event-stream", "image/png", "image/jpeg", "image/gif", "image/webp", "font/woff",
+    "application/zip", "application/gzip", "application/octet-stream", "video/", "audio/",
+)
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    """
+    "br;q=1.0, gzip;q=0.8, *;q=0" -> {"br": 1.0, "gzip": 0.8, "*": 0.0}
+    """
+    encodings = {}
+    for item in value.split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[coding.strip().lower()] = quality
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str, available=("br", "gzip")) -> Optional[str]:
+    """
+    Best encoding from `available` the client accepts, preferring the order given
+    """
+    encodings = parse_accept_encoding(accept_encoding)
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = encodings.get(coding, encodings.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class _ResponderMixin:
+    """
+    Skip excluded content types and pass ASGI pathsend (zero-copy file) messages through
+    """
+
+    async def send_with_compression(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            await super().send_with_compression(message)
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            self.content_type_is_excluded = content_type.startswith(EXCLUDED_CONTENT_TYPES)
+        elif message["type"] == "http.response.pathsend":
+            if not self.started:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+        else:
+            await super().send_with_compression(message)
+
+
+class GzipCompressionResponder(_ResponderMixin, GZipResponder):
+    pass
+
+
+class BrotliResponder(_ResponderMixin, IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int = BROTLI_QUALITY) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        compressed = self.compressor.process(body)
+        # Flush every chunk so streamed responses (NDJSON exports) keep flowing
+        return compressed + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+class CompressionMiddleware:
+    """
+    Compress dynamic responses with brotli or gzip, whichever the client
+    prefers. Responses that already carry Content-Encoding (pre-compressed
+    static assets) and small bodies are left alone.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.available = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.available)
+        if encoding == "br":
+            responder = BrotliResponder(self.app, self.minimum_size)
+        elif encoding == "gzip":
+            responder = GzipCompressionResponder(self.app, self.minimum_size, compresslevel=GZIP_LEVEL)
+        else:
+            await self.app(scope, receive, send)
+            return
+        await responder(scope, receive, send)
@@ -1,18 +1,109 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import asyncio
-from fastapi import HTTPException
+import time
+from typing import List, Optional
+from fastapi import HTTPException, Request
 from sqlalchemy import text
 from dotenv import load_dotenv
 import os
 
+from metrics import Histogram
+from observability import record_pool_wait
+
 # Load environment variables from .env file
 load_dotenv()
 
 # Get DATABASE_URL from environment variables
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_async_engine(DATABASE_URL)
+# Connection pool settings. With `run.py --prod` every worker gets its own pool,
+# so Postgres sees up to workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# asyncpg only: prepared statement cache per connection and server-side timeout
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "fastapi-crud-demo")
+
+# Read replicas (comma-separated URLs). Read-only handlers use them; a client
+# that just wrote keeps reading from the primary (and past the cache, see
+# main.cached_read) for DB_READ_YOUR_WRITES_SECONDS.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_HEALTH_INTERVAL = float(os.getenv("DB_REPLICA_HEALTH_INTERVAL", "5"))
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+PRIMARY_STICKY_COOKIE = "db_primary_until"
+PRIMARY_STICKY_HEADER = "x-read-primary"
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that tracks how many callers are waiting for a connection
+    and how long a checkout takes
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiters = 0
+        self.checkout_latency = Histogram()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        self.waiters += 1
+        try:
+            return super()._do_get()
+        finally:
+            self.waiters -= 1
+            elapsed = time.perf_counter() - started
+            self.checkout_latency.observe(elapsed)
+            record_pool_wait(elapsed)
+
+    def recreate(self):
+        pool = super().recreate()
+        # Keep the statistics when the engine is disposed
+        pool.checkout_latency = self.checkout_latency
+        return pool
+
+
+def engine_options(url: str) -> dict:
+    """
+    Build create_async_engine() keyword arguments for `url` from the DB_* settings
+    """
+    options = {
+        "poolclass": InstrumentedPool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if make_url(url).get_driver_name() == "asyncpg":
+        server_settings = {"application_name": DB_APPLICATION_NAME}
+        if DB_STATEMENT_TIMEOUT_MS:
+            server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+        options["connect_args"] = {
+            # SQLAlchemy's own prepared statement cache and asyncpg's
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "server_settings": server_settings,
+        }
+    return options
+
+
+def create_db_engine(url: str, **overrides):
+    """
+    Create an async engine configured from the environment; keyword arguments
+    override individual options
+    """
+    return create_async_engine(url, **{**engine_options(url), **overrides})
+
+
+engine = create_db_engine(DATABASE_URL)
 SessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
@@ -25,6 +116,128 @@ async def get_db():
     finally:
         await db.close()
 
+class Replica:
+    """
+    One read replica: its engine, session factory and last known health
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = create_db_engine(url)
+        self.sessionmaker = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        self.healthy = True
+        self.last_error: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return make_url(self.url).render_as_string(hide_password=True)
+
+
+class ReplicaRouter:
+    """
+    Round-robin over healthy replicas. A background task re-checks every
+    replica, so one that failed comes back once it answers again.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self._next = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def pick(self) -> Optional[Replica]:
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+            if replica.healthy:
+                return replica
+        return None
+
+    def mark_unhealthy(self, replica: Replica, error: Exception) -> None:
+        replica.healthy = False
+        replica.last_error = str(error)
+        print(f"Replica {replica.name} marked unhealthy: {error}")
+
+    async def check(self) -> None:
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as conn:
+                    await asyncio.wait_for(conn.execute(text("SELECT 1")), DB_REPLICA_HEALTH_INTERVAL)
+                if not replica.healthy:
+                    print(f"Replica {replica.name} is healthy again")
+                replica.healthy = True
+                replica.last_error = None
+            except Exception as e:
+                if replica.healthy:
+                    self.mark_unhealthy(replica, e)
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(DB_REPLICA_HEALTH_INTERVAL)
+
+    def start(self) -> None:
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+replicas = ReplicaRouter(DATABASE_REPLICA_URLS)
+
+
+def wants_primary(request: Request) -> bool:
+    """
+    True when the client wrote recently (read-your-writes) or asked for the primary
+    """
+    if request.headers.get(PRIMARY_STICKY_HEADER):
+        return True
+    try:
+        return float(request.cookies.get(PRIMARY_STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_sessionmaker(request: Request):
+    """
+    Session factory for a read-only request: a healthy replica unless the
+    client must see its own writes, otherwise the primary
+    """
+    if replicas and not wants_primary(request):
+        replica = replicas.pick()
+        if replica is not None:
+            return replica.sessionmaker
+    return SessionLocal
+
+
+# Dependency to get a DB session for read-only handlers
+async def get_read_db(request: Request):
+    db = None
+    if replicas and not wants_primary(request):
+        replica = replicas.pick()
+        if replica is not None:
+            db = replica.sessionmaker()
+            try:
+                # Check out the connection now so a dead replica fails over here
+                await db.connection()
+            except Exception as e:
+                replicas.mark_unhealthy(replica, e)
+                await db.close()
+                db = None
+    if db is None:
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
 # Function to test database connection
 async def check_database_connection():
     try:
@@ -35,4 +248,25 @@ async def check_database_connection():
             return {"status": "success", "message": "Connected to database successfully!"}
     except Exception as e:
         # Return error details if connection fails
-        return {"status": "error", "message": f"Database connection failed: {str(e)}"}
\ No newline at end of file
+        return {"status": "error", "message": f"Database connection failed: {str(e)}"}
+
+# Function to report connection pool usage
+def get_pool_stats(db_engine=None):
+    pool = (db_engine or engine).sync_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "waiters": getattr(pool, "waiters", 0),
+        "checkout_latency": pool.checkout_latency.snapshot() if hasattr(pool, "checkout_latency") else None,
+        "config": {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+        },
+    }
@@ -0,0 +1,95 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+# HTML pages may be stored but must be revalidated (cheap with the ETag)
+WEB_CACHE_CONTROL = os.getenv("WEB_CACHE_CONTROL", "no-cache")
+# Default policy of the JSON API
+API_CACHE_CONTROL = os.getenv("API_CACHE_CONTROL", "no-cache")
+
+
+def parse_route_policies(value: str) -> Dict[str, str]:
+    """
+    Parse "route=policy;route=policy", e.g.
+    "/posts/{post_id}=public, max-age=30;/users/=private, no-cache"
+    """
+    policies = {}
+    for entry in value.split(";"):
+        route, sep, policy = entry.partition("=")
+        if sep and route.strip() and policy.strip():
+            policies[route.strip()] = policy.strip()
+    return policies
+
+
+# Per-route overrides, keyed by the route template
+CACHE_CONTROL_ROUTES = parse_route_policies(os.getenv("CACHE_CONTROL_ROUTES", ""))
+
+
+def cache_control_for(request: Request, default: str = API_CACHE_CONTROL) -> str:
+    route = request.scope.get("route")
+    if route is not None:
+        return CACHE_CONTROL_ROUTES.get(route.path, default)
+    return default
+
+
+def make_etag(*parts) -> str:
+    """
+    Strong ETag from the values a representation was built from
+    """
+    return '"' + hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, so W/"x" matches "x"
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def as_utc(value: datetime) -> datetime:
+    # SQLite returns naive timestamps; they are UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def is_not_modified(request: Request, etag: Optional[str] = None, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Evaluate If-None-Match, or If-Modified-Since when no ETag was sent
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag is not None and etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have one-second resolution
+        return as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def validator_headers(
+    etag: Optional[str] = None,
+    last_modified: Optional[datetime] = None,
+    cache_control: Optional[str] = None
+) -> Dict[str, str]:
+    headers = {}
+    if etag is not None:
+        headers["ETag"] = etag
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(as_utc(last_modified), usegmt=True)
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    return headers
+
+
+def not_modified_response(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,442 @@
+"""
+Durable background jobs stored in the application database.
+
+A write enqueues a job in its own transaction (enqueue()), so the job
+exists exactly when the write committed; after the commit the worker loops
+of this process are woken, other processes find it at their next poll.
+Worker loops run inside the app (JOBS_WORKERS per process, started on
+startup) or beside it:
+    python jobs.py                - run JOBS_WORKERS loops until interrupted
+    python jobs.py --workers 4
+
+A loop claims up to a handler's batch_size due jobs of one kind with
+SELECT ... FOR UPDATE SKIP LOCKED (concurrent loops skip each other's rows
+instead of waiting on them) and leases them for JOBS_LEASE_SECONDS by
+moving run_at forward. The handler then runs in a new transaction that
+also deletes the jobs, so its database changes and the acknowledgement
+commit together. A job whose handler raises is retried with exponential
+backoff; once it has used max_attempts it is kept with failed_at set. A
+failing batch is retried one job at a time, so one bad job doesn't hold
+back the others. Jobs of a process that dies come back when their lease
+ends.
+
+The post counters (stats.py, POST_STATS_UPDATES) are kept this way by
+default.
+
+Handlers are registered with @job_handler and receive the payloads of a
+batch: `async def handler(db, payloads)`. They must not commit, and must be
+safe to run again for the same payload (a lease that ends while the
+handler is still running lets another loop claim the job; the late ack is
+then rolled back, but side effects outside the database are not).
+"""
+import argparse
+import asyncio
+import os
+import random
+import secrets
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import case, delete, event, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from http_cache import as_utc
+from metrics import DEFAULT_BUCKETS, Histogram, PrometheusWriter
+import models
+
+# Worker loops per app process; 0 leaves jobs to `python jobs.py`
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "1"))
+# Seconds between polls of an idle loop (enqueues in the same process wake it at once)
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1.0"))
+# How long a claimed job is reserved for the loop that claimed it
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+# Defaults for handlers that don't set their own
+JOBS_BATCH_SIZE = int(os.getenv("JOBS_BATCH_SIZE", "100"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+# Retry delay: JOBS_RETRY_BASE * 2^(attempt - 1) seconds, at most JOBS_RETRY_MAX, with jitter
+JOBS_RETRY_BASE = float(os.getenv("JOBS_RETRY_BASE", "1"))
+JOBS_RETRY_MAX = float(os.getenv("JOBS_RETRY_MAX", "300"))
+# Seconds a stopping worker gets to finish the batch it is handling
+JOBS_SHUTDOWN_TIMEOUT = float(os.getenv("JOBS_SHUTDOWN_TIMEOUT", "10"))
+
+# Jobs wait behind a backlog or a retry delay for far longer than requests take
+JOB_BUCKETS = DEFAULT_BUCKETS + (30.0, 60.0, 300.0, 1800.0)
+
+Job = models.Job
+JobHandler = Callable[[AsyncSession, List[Any]], Awaitable[None]]
+
+
+class HandlerSpec(NamedTuple):
+    kind: str
+    handler: JobHandler
+    batch_size: int
+    max_attempts: int
+
+
+handlers: Dict[str, HandlerSpec] = {}
+
+
+def job_handler(kind: str, batch_size: int = JOBS_BATCH_SIZE, max_attempts: int = JOBS_MAX_ATTEMPTS):
+    """
+    Register the decorated coroutine as the handler of `kind`
+    """
+    def register(handler: JobHandler) -> JobHandler:
+        if kind in handlers:
+            raise ValueError(f"Job handler for {kind!r} registered twice")
+        handlers[kind] = HandlerSpec(kind, handler, batch_size, max_attempts)
+        return handler
+    return register
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def retry_delay(attempts: int) -> float:
+    delay = min(JOBS_RETRY_MAX, JOBS_RETRY_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class KindStats:
+    def __init__(self):
+        self.enqueued = 0
+        self.claimed = 0
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+        self.lease_lost = 0
+        self.batches = 0
+        # Due time to claim, handler time per batch, enqueue to acknowledgement
+        self.wait = Histogram(JOB_BUCKETS)
+        self.duration = Histogram()
+        self.latency = Histogram(JOB_BUCKETS)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enqueued": self.enqueued,
+            "claimed": self.claimed,
+            "succeeded": self.succeeded,
+            "retried": self.retried,
+            "failed": self.failed,
+            "lease_lost": self.lease_lost,
+            "batches": self.batches,
+            "average_batch": round(self.claimed / self.batches, 1) if self.batches else 0,
+            "wait": self.wait.snapshot(),
+            "duration": self.duration.snapshot(),
+            "latency": self.latency.snapshot(),
+        }
+
+
+class Claim(NamedTuple):
+    token: str
+    jobs: List[Any]  # rows of id, payload, attempts, created_at
+
+
+class JobRunner:
+    """
+    Worker loops of this process and the counters behind /jobs/stats
+    """
+
+    def __init__(
+        self,
+        workers: int = JOBS_WORKERS,
+        poll_interval: float = JOBS_POLL_INTERVAL,
+        lease_seconds: float = JOBS_LEASE_SECONDS,
+        sessionmaker=SessionLocal
+    ):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.sessionmaker = sessionmaker
+        self.stats: Dict[str, KindStats] = {}
+        self.errors = 0
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._tasks: List[asyncio.Task] = []
+
+    def kind_stats(self, kind: str) -> KindStats:
+        stats = self.stats.get(kind)
+        if stats is None:
+            stats = self.stats[kind] = KindStats()
+        return stats
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def claim(self, spec: HandlerSpec) -> Optional[Claim]:
+        """
+        Lease up to batch_size due jobs of one kind; None when there are none
+        """
+        now = utcnow()
+        token = secrets.token_hex(16)
+        async with self.sessionmaker() as db:
+            due = await db.execute(
+                select(Job.id, Job.run_at)
+                .where(Job.kind == spec.kind, Job.run_at <= now, Job.failed_at.is_(None))
+                .order_by(Job.run_at, Job.id)
+                .limit(spec.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            due_at = {row.id: row.run_at for row in due.all()}
+            if not due_at:
+                await db.rollback()
+                return None
+            # The run_at condition repeats the SELECT's: without row locks
+            # (SQLite) it keeps a job from being claimed twice
+            result = await db.execute(
+                update(Job)
+                .where(Job.id.in_(due_at), Job.run_at <= now)
+                .values(
+                    run_at=now + timedelta(seconds=self.lease_seconds),
+                    attempts=Job.attempts + 1,
+                    claim_token=token
+                )
+                .returning(Job.id, Job.payload, Job.attempts, Job.created_at)
+                .execution_options(synchronize_session=False)
+            )
+            jobs = result.all()
+            await db.commit()
+        stats = self.kind_stats(spec.kind)
+        stats.claimed += len(jobs)
+        stats.batches += 1 if jobs else 0
+        for job in jobs:
+            stats.wait.observe(max(0.0, (now - as_utc(due_at[job.id])).total_seconds()))
+        return Claim(token, jobs) if jobs else None
+
+    async def _acknowledge(self, spec: HandlerSpec, token: str, jobs: List[Any]) -> Optional[str]:
+        """
+        Run the handler on `jobs` and delete them in one transaction; returns
+        the error when the handler raised (and nothing was committed)
+        """
+        stats = self.kind_stats(spec.kind)
+        started = time.perf_counter()
+        async with self.sessionmaker() as db:
+            try:
+                await spec.handler(db, [job.payload for job in jobs])
+                result = await db.execute(
+                    delete(Job)
+                    .where(Job.id.in_([job.id for job in jobs]), Job.claim_token == token)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount != len(jobs):
+                    # The lease ran out and another loop holds (or finished) some
+                    # of these jobs: drop this run's changes, theirs count
+                    await db.rollback()
+                    stats.lease_lost += len(jobs)
+                    print(f"Job lease lost for {len(jobs)} {spec.kind} job(s); consider a longer JOBS_LEASE_SECONDS")
+                    return None
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                return traceback.format_exc(limit=5)
+            finally:
+                stats.duration.observe(time.perf_counter() - started)
+        now = utcnow()
+        stats.succeeded += len(jobs)
+        for job in jobs:
+            stats.latency.observe(max(0.0, (now - as_utc(job.created_at)).total_seconds()))
+        return None
+
+    async def _reschedule(self, spec: HandlerSpec, token: str, job: Any, error: str) -> None:
+        stats = self.kind_stats(spec.kind)
+        now = utcnow()
+        values: Dict[str, Any] = {"claim_token": None, "last_error": error}
+        if job.attempts >= spec.max_attempts:
+            values["failed_at"] = now
+            stats.failed += 1
+            print(f"Job {job.id} ({spec.kind}) failed after {job.attempts} attempts: {error.splitlines()[-1]}")
+        else:
+            values["run_at"] = now + timedelta(seconds=retry_delay(job.attempts))
+            stats.retried += 1
+        async with self.sessionmaker() as db:
+            await db.execute(
+                update(Job).where(Job.id == job.id, Job.claim_token == token).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def process(self, spec: HandlerSpec, claim: Claim) -> None:
+        """
+        Handle a claimed batch; if it fails, each job on its own, then
+        reschedule the ones that still fail
+        """
+        error = await self._acknowledge(spec, claim.token, claim.jobs)
+        if error is None:
+            return
+        for job in claim.jobs:
+            if len(claim.jobs) > 1:
+                error = await self._acknowledge(spec, claim.token, [job])
+            if error is not None:
+                await self._reschedule(spec, claim.token, job, error)
+
+    async def run_once(self) -> int:
+        """
+        One round over every registered kind; returns the jobs handled
+        """
+        handled = 0
+        for spec in list(handlers.values()):
+            claim = await self.claim(spec)
+            if claim is not None:
+                await self.process(spec, claim)
+                handled += len(claim.jobs)
+        return handled
+
+    async def _loop(self) -> None:
+        while not self._stopping:
+            try:
+                if await self.run_once():
+                    # More may be due: poll again at once
+                    continue
+            except Exception as e:
+                self.errors += 1
+                print(f"Job worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._stopping = False
+            self._tasks = [asyncio.create_task(self._loop()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = JOBS_SHUTDOWN_TIMEOUT) -> None:
+        """
+        Let the loops finish their current round, then cancel those still
+        busy; jobs a cancelled loop had claimed come back when their lease ends
+        """
+        if not self._tasks:
+            return
+        self._stopping = True
+        self.wake()
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def queue_depth(self) -> Dict[str, Dict[str, int]]:
+        """
+        Jobs per kind in the table: due, scheduled (later, or leased) and failed
+        """
+        state = case(
+            (Job.failed_at.is_not(None), "failed"), (Job.run_at > utcnow(), "scheduled"), else_="due"
+        ).label("state")
+        async with self.sessionmaker() as db:
+            result = await db.execute(select(Job.kind, state, func.count()).group_by(Job.kind, state))
+            rows = result.all()
+        depth: Dict[str, Dict[str, int]] = {}
+        for kind, state_name, count in rows:
+            depth.setdefault(kind, {"due": 0, "scheduled": 0, "failed": 0})[state_name] = count
+        return depth
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._tasks),
+            "errors": self.errors,
+            "handlers": {
+                spec.kind: {"batch_size": spec.batch_size, "max_attempts": spec.max_attempts}
+                for spec in handlers.values()
+            },
+            "kinds": {kind: stats.snapshot() for kind, stats in self.stats.items()},
+        }
+
+    def write(self, writer: PrometheusWriter, depth: Optional[Dict[str, Dict[str, int]]] = None) -> None:
+        writer.family("jobs_queue_depth", "gauge", "Jobs in the table by state (due, scheduled, failed)")
+        for kind, counts in (depth or {}).items():
+            for state, count in counts.items():
+                writer.sample("jobs_queue_depth", count, {"kind": kind, "state": state})
+        for metric, help_text in (
+            ("enqueued", "Jobs enqueued by this process"),
+            ("succeeded", "Jobs handled and acknowledged"),
+            ("retried", "Failed jobs scheduled for another attempt"),
+            ("failed", "Jobs that used up their attempts"),
+            ("lease_lost", "Jobs whose lease ended before the handler finished"),
+            ("batches", "Batches claimed"),
+        ):
+            writer.family(f"jobs_{metric}_total", "counter", help_text)
+            for kind, stats in self.stats.items():
+                writer.sample(f"jobs_{metric}_total", getattr(stats, metric), {"kind": kind})
+        for metric, help_text in (
+            ("wait", "Time from a job's due time to its claim"),
+            ("duration", "Handler time per batch"),
+            ("latency", "Time from enqueue to acknowledgement"),
+        ):
+            writer.family(f"jobs_{metric}_seconds", "histogram", help_text)
+            for kind, stats in self.stats.items():
+                writer.histogram(f"jobs_{metric}_seconds", getattr(stats, metric), {"kind": kind})
+
+
+runner = JobRunner()
+
+
+async def enqueue_many(db: AsyncSession, kind: str, payloads: Iterable[Any], delay: float = 0) -> None:
+    """
+    Add jobs to the caller's transaction: they exist once it commits and
+    vanish with it on rollback. Payloads must be JSON-serializable.
+    """
+    now = utcnow()
+    rows = [
+        {"kind": kind, "payload": payload, "attempts": 0, "run_at": now + timedelta(seconds=delay), "created_at": now}
+        for payload in payloads
+    ]
+    if not rows:
+        return
+    await db.execute(Job.__table__.insert(), rows)
+    db.sync_session.info["jobs_enqueued"] = True
+    runner.kind_stats(kind).enqueued += len(rows)
+
+
+async def enqueue(db: AsyncSession, kind: str, payload: Any, delay: float = 0) -> None:
+    await enqueue_many(db, kind, [payload], delay)
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session) -> None:
+    # Jobs are only visible once committed, so this is the earliest useful wakeup
+    if session.info.pop("jobs_enqueued", False):
+        runner.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session) -> None:
+    session.info.pop("jobs_enqueued", None)
+
+
+async def run_workers(workers: int) -> None:
+    from database import engine
+
+    runner.workers = workers
+    runner.start()
+    print(f"Job workers: {workers}, handlers: {', '.join(handlers) or 'none'}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.stop()
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run job worker loops beside the app")
+    parser.add_argument("--workers", type=int, default=max(1, JOBS_WORKERS))
+    args = parser.parse_args()
+
+    # The app imports every module that registers handlers; they register with
+    # the `jobs` module it imports, not with this script's __main__ copy
+    import main as app_module  # noqa: F401
+    import jobs
+
+    try:
+        asyncio.run(jobs.run_workers(args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload
+
+from database import get_db
+import models
+
+
+class BatchLoader:
+    """
+    Request-scoped DataLoader: every `load()` made in the same event-loop tick is
+    answered by a single `SELECT ... WHERE id IN (...)`, and each id is fetched
+    at most once per request.
+
+    The loader shares the request's session, so don't run other queries on that
+    session concurrently with a pending load.
+    """
+
+    def __init__(self, db: AsyncSession, model, options: Iterable[Any] = ()):
+        self.db = db
+        self.model = model
+        self.options = tuple(options)
+        self._results: Dict[Any, Any] = {}
+        self._pending: Dict[Any, asyncio.Future] = {}
+        self._dispatch_scheduled = False
+
+    def prime(self, key, obj) -> None:
+        """
+        Seed the loader with an object the request already has
+        """
+        self._results[key] = obj
+
+    async def load(self, key) -> Optional[Any]:
+        if key in self._results:
+            return self._results[key]
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            if not self._dispatch_scheduled:
+                self._dispatch_scheduled = True
+                asyncio.get_running_loop().call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return await future
+
+    async def load_many(self, keys: Iterable[Any]) -> List[Optional[Any]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    async def _dispatch(self) -> None:
+        pending, self._pending = self._pending, {}
+        self._dispatch_scheduled = False
+        try:
+            query = select(self.model).filter(self.model.id.in_(list(pending))).options(*self.options)
+            result = await self.db.execute(query)
+            found = {obj.id: obj for obj in result.scalars().all()}
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in pending.items():
+            self._results[key] = found.get(key)
+            if not future.done():
+                future.set_result(found.get(key))
+
+
+class Loaders:
+    """
+    The batch loaders of one request
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.users = BatchLoader(db, models.User)
+        # Posts are loaded to be shown or edited one at a time, so with their body
+        self.posts = BatchLoader(db, models.Post, [joinedload(models.Post.body)])
+
+
+# Dependency to get the request's loaders (shares the request's DB session)
+async def get_loaders(db: AsyncSession = Depends(get_db)) -> Loaders:
+    return Loaders(db)
@@ -1,39 +1,259 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Form, Response, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from fastapi.responses import PlainTextResponse
 from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func
+from sqlalchemy import insert, update, delete, exists, func, literal
+from sqlalchemy.orm import joinedload
 from typing import List, Optional
 import json
+import time
 
-from database import engine, get_db, check_database_connection, Base
+from database import (
+    engine, SessionLocal, get_db, get_read_db, read_sessionmaker, replicas, wants_primary,
+    check_database_connection, get_pool_stats, DB_READ_YOUR_WRITES_SECONDS, PRIMARY_STICKY_COOKIE
+)
 import models
-from schemas import UserCreate, UserResponse, PostCreate, PostResponse, PostUpdate
-from sockets import socket_app, broadcast_post_update, broadcast_post_list_update, broadcast_new_post
+from cache import cache, post_key, post_detail_key, POSTS_LIST_KEY, USERS_CHOICES_KEY, invalidate_post, invalidate_users
+from loaders import Loaders, get_loaders
+from bulk import ingest_posts, ingest_users
+from search import search_posts, search_vector_value
+from pagination import keyset_order, keyset_paginate, next_cursor, stream_rows, ndjson_lines, json_array
+from http_cache import (
+    WEB_CACHE_CONTROL, cache_control_for, is_not_modified, make_etag, not_modified_response, validator_headers
+)
+from metrics import PrometheusWriter
+from observability import (
+    OBS_SERVER_TIMING, TimedJinja2Templates, finish_request, instrument_engine, instrument_serialization, registry,
+    start_request, startup_timings
+)
+from template_cache import configure_templates, fragments
+from compression import COMPRESSION_ENABLED, CompressionMiddleware
+from admission import AdmissionMiddleware, admission
+from jobs import runner as job_runner
+from static_assets import STATIC_DIR, STATIC_URL, HashedStaticFiles, StaticDispatcher, asset_url
+from passwords import needs_rehash, passwords
+from migrate import check_schema
+from stats import (
+    count_created, count_deleted, count_updated, get_author_stats, get_daily_stats, get_post_totals,
+    lock_post_counts
+)
+from serialization import (
+    FastJSONResponse, POST_FIELDS, POST_SUMMARY_FIELDS, USER_FIELDS, dumps, parse_fields, projection, to_dict, to_dicts
+)
+from schemas import SocketTokenRequest, UserCreate, UserResponse, PostCreate, PostResponse, PostSummary, PostUpdate
+from post_content import (
+    attach_body, body_columns, column_fields, content_hash, delete_bodies, derived_fields, insert_body, load_body,
+    post_dicts, post_values, row_dict, update_body
+)
+import sockets
+from sockets import SOCKETIO_AUTH_TTL, socket_app, broadcast_post_update, broadcast_post_list_update, broadcast_new_post, get_post_list_changes
 
 app = FastAPI(title="FastAPI CRUD Demo")
 
 # Mount Socket.IO app
 app.mount("/socket.io", socket_app)
 
-# Mount static files directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Mount static files directory (hashed builds in static/dist, see static_assets.py)
+static_files = HashedStaticFiles(directory=STATIC_DIR)
+app.mount(STATIC_URL, static_files, name="static")
 
-# Initialize Jinja2Templates
-templates = Jinja2Templates(directory="templates")
+# Initialize Jinja2Templates (rendering time is reported as "render")
+templates = TimedJinja2Templates(directory="templates")
+configure_templates(templates)
+templates.env.globals["asset_url"] = asset_url
+# base.html loads the matching Socket.IO parser in the browser
+templates.env.globals["socketio_serializer"] = sockets.SOCKETIO_SERIALIZER
 
-# Create tables on startup
+# Per-statement, serialization and per-route metrics for /metrics and Server-Timing
+instrument_engine(engine)
+for replica in replicas.replicas:
+    instrument_engine(replica.engine, replica.name)
+instrument_serialization()
+
+# Innermost middleware: compress dynamic responses (brotli/gzip) above the size threshold
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Keep a client on the primary and past the cache right after it writes, so
+# its next reads hit neither a replica that hasn't caught up yet nor a worker
+# whose local cache tier hasn't received the invalidation yet
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        response.set_cookie(
+            PRIMARY_STICKY_COOKIE,
+            str(time.time() + DB_READ_YOUR_WRITES_SECONDS),
+            max_age=int(DB_READ_YOUR_WRITES_SECONDS) + 1,
+            httponly=True,
+            samesite="lax"
+        )
+    return response
+
+# Outermost middleware (except for /static and admission control): times the
+# whole request, including the ones above. Requests shed with 503 never get here
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    timings = start_request()
+    try:
+        response = await call_next(request)
+    except Exception:
+        finish_request(request, timings, 500)
+        raise
+    total = finish_request(request, timings, response.status_code)
+    startup_timings.mark("first_request")
+    if OBS_SERVER_TIMING:
+        response.headers["Server-Timing"] = timings.server_timing(total)
+    return response
+
+# Adaptive concurrency limit: requests over it wait briefly by priority, then
+# get a 503 with Retry-After. Health checks, metrics and Socket.IO bypass it
+app.add_middleware(AdmissionMiddleware)
+
+# Static files skip all of the above: they are served (pre-compressed, or
+# compressed on the fly when no build exists) before any per-request work
+app.add_middleware(
+    StaticDispatcher,
+    static_app=CompressionMiddleware(static_files) if COMPRESSION_ENABLED else static_files
+)
+
+# Columns API ETags are derived from. Users have no version column and can't be
+# edited through the API, so their id plus the mutable columns stand in for one.
+POST_VERSION_COLUMNS = (models.Post.id, models.Post.updated_at)
+USER_VERSION_COLUMNS = (models.User.id, models.User.username, models.User.email, models.User.is_active)
+
+def page_etag(tag, rows, columns):
+    """
+    ETag of a page of ORM objects, from their version columns
+    """
+    return make_etag(tag, [tuple(getattr(row, column.key) for column in columns) for row in rows])
+
+async def fetch_page_etag(db, query, tag, columns):
+    """
+    Same ETag as page_etag() but selecting only the version columns, so a
+    revalidation that ends in 304 never loads full rows or ORM objects
+    """
+    result = await db.execute(query.with_only_columns(*columns))
+    return make_etag(tag, [tuple(row) for row in result.all()])
+
+def post_list_item(post, author_name):
+    """
+    Serialize a post the way a row of the posts list needs it
+    """
+    return {
+        "id": post.id,
+        "title": post.title,
+        "author": author_name,
+        "published": post.published,
+        "created_at": post.created_at.isoformat(),
+        "author_id": post.author_id
+    }
+
+async def cached_read(request: Request, db: AsyncSession, key: str, load):
+    """
+    `await load(session)` through the shared cache without breaking
+    read-your-writes: a client that just wrote skips the cache (other
+    workers may not have dropped the entry yet), and a miss is loaded from
+    the primary, so a lagging replica can't put the old row back right after
+    invalidate_post()
+    """
+    if wants_primary(request):
+        return await load(db)
+    if db.bind is engine:
+        return await cache.get_or_load(key, lambda: load(db))
+    
+    async def load_from_primary():
+        async with SessionLocal() as primary:
+            return await load(primary)
+    
+    return await cache.get_or_load(key, load_from_primary)
+
+async def insert_post(db: AsyncSession, author_id: int, title: str, content: str, published: bool):
+    """
+    INSERT ... SELECT FROM users ... RETURNING in one round trip. The SELECT
+    yields no row when the author doesn't exist, so None means "unknown author"
+    and no separate existence check is needed. The post's counter changes are
+    enqueued in the same transaction (see stats.py) and its body written to
+    post_bodies.
+    """
+    columns = {"title": literal(title), **{name: literal(value) for name, value in derived_fields(content).items()}}
+    vector = search_vector_value(title, content)
+    if vector is not None:
+        columns["search_vector"] = vector
+    columns["published"] = literal(published)
+    values = select(*columns.values(), models.User.id).filter(models.User.id == author_id)
+    stmt = insert(models.Post).from_select([*columns, "author_id"], values).returning(models.Post)
+    result = await db.scalars(stmt)
+    post = result.first()
+    if post is not None:
+        await insert_body(db, post.id, content)
+        await count_created(db, [post])
+        attach_body(post, content)
+    return post
+
+async def delete_post_returning(db: AsyncSession, post_id: int):
+    """
+    DELETE ... RETURNING, so a missing post is detected without a prior SELECT;
+    the returned counted columns take the post out of the post stats
+    """
+    result = await db.execute(
+        delete(models.Post).where(models.Post.id == post_id).returning(
+            models.Post.id, models.Post.author_id, models.Post.published, models.Post.created_at
+        )
+    )
+    post = result.first()
+    if post is None:
+        return None
+    await delete_bodies(db, [post.id])
+    await count_deleted(db, post)
+    return post.id
+
+async def get_user_choices(db: AsyncSession):
+    """
+    Users for the author dropdowns, served from the cache
+    """
+    async def load():
+        result = await db.execute(select(models.User.id, models.User.username, models.User.email))
+        return [dict(row._mapping) for row in result.all()]
+    
+    return await cache.get_or_load(USERS_CHOICES_KEY, load)
+
+# Invalidations also clear the local cache tier of the other workers and
+# nodes, over the Socket.IO pub/sub channel (SOCKETIO_MANAGER)
+cache.on_invalidate = sockets.publish_cache_invalidation
+sockets.on_cache_invalidation(cache.invalidate_local)
+
+# Check the schema version on startup. Tables, the search index and the post
+# counter backfill are migrations (migrate.py), applied once per deploy by
+# run.py instead of by every worker on every start.
 @app.on_event("startup")
 async def init_db():
-    async with engine.begin() as conn:
-        # Drop all tables (comment this out in production)
-        # await conn.run_sync(Base.metadata.drop_all)
-        
-        # Create all tables if they don't exist
-        await conn.run_sync(Base.metadata.create_all)
+    await check_schema()
+    startup_timings.mark("db_connect")
+    
+    # Start read replica health checks
+    replicas.start()
+    
+    # Start shared socket presence heartbeat
+    sockets.start_background_tasks()
+    
+    # Job worker loops (JOBS_WORKERS; 0 when `python jobs.py` runs them instead)
+    job_runner.start()
+    
+    startup_timings.mark("ready")
+    print(f"Startup: {startup_timings.summary()}")
+
+@app.on_event("shutdown")
+async def close_replicas():
+    await sockets.stop_background_tasks()
+    await job_runner.stop()
+    await replicas.stop()
+    passwords.shutdown()
+    # Close pooled connections, so a recycled or reloaded worker exits promptly
+    # and doesn't leave its connections for the database to time out
+    await engine.dispose()
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
@@ -42,6 +262,141 @@ async def root(request: Request):
     """
     return templates.TemplateResponse("index.html", {"request": request, "title": "FastAPI CRUD Demo"})
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss counters of the read-through cache
+    """
+    return {**cache.get_stats(), "fragments": fragments.get_stats()}
+
+@app.get("/passwords/stats")
+async def password_stats():
+    """
+    Password hashing pool: algorithm, queue and in-flight jobs, rejections, wait/duration histograms
+    """
+    return passwords.get_stats()
+
+@app.get("/startup/stats")
+async def startup_stats():
+    """
+    Cold start of this worker: seconds from process start to import, database
+    connect, ready and first response, and the time between them
+    """
+    return startup_timings.get_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Prometheus text exposition: per-route latency, SQL statements, pool,
+    template/serialization time, cache, admission control, job queue and
+    Socket.IO broadcast metrics
+    """
+    writer = PrometheusWriter()
+    registry.write(writer)
+    startup_timings.write(writer)
+    admission.write(writer)
+    job_runner.write(writer, await job_runner.queue_depth())
+
+    pools = [("primary", engine)] + [(replica.name, replica.engine) for replica in replicas.replicas]
+    pool_stats = [(name, get_pool_stats(db_engine)) for name, db_engine in pools]
+    for metric, key, help_text in (
+        ("db_pool_checked_out", "checked_out", "Connections currently checked out"),
+        ("db_pool_checked_in", "checked_in", "Idle connections in the pool"),
+        ("db_pool_overflow", "overflow", "Connections above pool_size"),
+        ("db_pool_waiters", "waiters", "Callers waiting for a connection"),
+    ):
+        writer.family(metric, "gauge", help_text)
+        for name, stats in pool_stats:
+            writer.sample(metric, stats[key], {"engine": name})
+    writer.family("db_pool_checkout_duration_seconds", "histogram", "Time to check a connection out of the pool")
+    for name, db_engine in pools:
+        writer.histogram("db_pool_checkout_duration_seconds", db_engine.sync_engine.pool.checkout_latency, {"engine": name})
+
+    cache_stats = cache.get_stats()
+    for tier in ("local_hits", "shared_hits", "misses"):
+        writer.family(f"cache_{tier}_total", "counter", f"Read-through cache {tier.replace('_', ' ')}")
+        writer.sample(f"cache_{tier}_total", cache_stats[tier])
+
+    hashing = passwords.get_stats()
+    for metric, kind, help_text in (
+        ("pending", "gauge", "Password operations waiting for a worker"),
+        ("in_flight", "gauge", "Password operations running"),
+        ("hashed", "counter", "Passwords hashed"),
+        ("verified", "counter", "Passwords verified"),
+        ("rejected", "counter", "Password operations rejected with 503"),
+    ):
+        name = f"password_hash_{metric}" + ("_total" if kind == "counter" else "")
+        writer.family(name, kind, help_text)
+        writer.sample(name, hashing[metric])
+    writer.family("password_hash_queue_wait_seconds", "histogram", "Time waiting for a password worker")
+    writer.histogram("password_hash_queue_wait_seconds", passwords.queue_wait)
+    writer.family("password_hash_duration_seconds", "histogram", "Time spent hashing or verifying")
+    writer.histogram("password_hash_duration_seconds", passwords.duration)
+
+    scheduler = sockets.scheduler
+    writer.family("socketio_broadcast_queue_depth", "gauge", "Broadcasts waiting for the next flush")
+    writer.sample("socketio_broadcast_queue_depth", scheduler.queue_depth)
+    for metric in ("enqueued", "coalesced", "dropped", "emitted"):
+        writer.family(f"socketio_broadcast_{metric}_total", "counter", f"Broadcast events {metric}")
+        writer.sample(f"socketio_broadcast_{metric}_total", getattr(scheduler, metric))
+    writer.family("socketio_broadcast_emit_latency_seconds", "histogram", "Time from enqueue to emit")
+    writer.histogram("socketio_broadcast_emit_latency_seconds", scheduler.emit_latency)
+    writer.family("socketio_post_updates_total", "counter", "post_update events sent in full or as a diff")
+    for kind in ("full", "diffs"):
+        writer.sample("socketio_post_updates_total", getattr(sockets.post_differ, kind), {"kind": kind})
+
+    presence_stats = sockets.get_presence_stats()
+    for metric, kind, help_text in (
+        ("connections", "gauge", "Socket.IO connections on this worker"),
+        ("users", "gauge", "Authenticated users connected to this worker"),
+        ("rooms", "gauge", "Post rooms with at least one connection"),
+        ("rejected", "counter", "Connections rejected at SOCKETIO_MAX_CONNECTIONS"),
+        ("evicted", "counter", "Connections closed after SOCKETIO_IDLE_SECONDS without events"),
+    ):
+        name = f"socketio_presence_{metric}" + ("_total" if kind == "counter" else "")
+        writer.family(name, kind, help_text)
+        writer.sample(name, presence_stats[metric])
+    return writer.render()
+
+@app.get("/metrics/slow-queries")
+async def slow_queries():
+    """
+    Most recent statements slower than OBS_SLOW_QUERY_MS, with the
+    application stack that issued them
+    """
+    return list(registry.slow_queries)
+
+@app.get("/admission/stats")
+async def admission_stats():
+    """
+    Admission control: current concurrency limit, latency it is based on,
+    and per priority class requests in flight, queued, admitted and shed
+    """
+    return admission.get_stats()
+
+@app.get("/jobs/stats")
+async def job_stats():
+    """
+    Job queue: jobs due, scheduled and failed per kind, plus this process's
+    worker counters (claimed, succeeded, retried, batches, wait/latency)
+    """
+    return {"queue": await job_runner.queue_depth(), **job_runner.get_stats()}
+
+@app.get("/broadcast/stats")
+async def broadcast_stats():
+    """
+    Socket.IO broadcast scheduler: queue depth, coalesced/dropped events,
+    emit latency and events skipped for slow clients
+    """
+    return sockets.get_broadcast_stats()
+
+@app.get("/socket/presence")
+async def socket_presence():
+    """
+    Socket.IO connections, users and post rooms on this worker
+    """
+    return sockets.get_presence_stats()
+
 @app.get("/check-db")
 async def check_db():
     """
@@ -50,6 +405,19 @@ async def check_db():
     """
     return await check_database_connection()
 
+@app.get("/db/pool")
+async def db_pool_stats():
+    """
+    Live connection pool usage: checked-out connections, waiters and
+    checkout latency histogram, for sizing DB_POOL_SIZE/DB_MAX_OVERFLOW
+    """
+    stats = get_pool_stats()
+    stats["replicas"] = [
+        {"url": replica.name, "healthy": replica.healthy, "last_error": replica.last_error, **get_pool_stats(replica.engine)}
+        for replica in replicas.replicas
+    ]
+    return stats
+
 # Web UI routes
 @app.get("/web/users", response_class=HTMLResponse)
 async def web_users_list(request: Request, db: AsyncSession = Depends(get_db)):
@@ -106,24 +474,25 @@ async def web_create_user(
             status_code=400
         )
     
-    # Create new user
+    # Create new user (hashed on the password worker pool)
     db_user = models.User(
         username=username,
         email=email,
-        hashed_password=password,  # Should be hashed in production!
+        hashed_password=await passwords.hash(password),
         is_active=is_active
     )
     
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    await invalidate_users()
     
     # Redirect to users list with success message
     response = RedirectResponse(url="/web/users", status_code=303)
     return response
 
 @app.get("/web/posts", response_class=HTMLResponse)
-async def web_posts_list(request: Request, format: str = None, db: AsyncSession = Depends(get_db)):
+async def web_posts_list(request: Request, format: str = None, db: AsyncSession = Depends(get_read_db)):
     """
     Display posts list web page or return JSON for API clients
     """
@@ -131,29 +500,72 @@ async def web_posts_list(request: Request, format: str = None, db: AsyncSession
     query = select(models.Post, models.User.username).join(
         models.User, models.Post.author_id == models.User.id
     )
-    result = await db.execute(query)
-    posts_with_authors = result.all()
     
-    # Return JSON if requested
+    async def load(session):
+        list_version = await sockets.changelog.current_version()
+        result = await session.execute(keyset_order(query, models.Post))
+        posts = [
+            (
+                {"id": post.id, "title": post.title, "published": post.published,
+                 "created_at": post.created_at, "updated_at": post.updated_at},
+                author_name
+            )
+            for post, author_name in result.all()
+        ]
+        # Everything a row shows, like the row fragments' keys in posts/list.html
+        etag = make_etag("posts-list", list_version, [
+            (post["id"], post["title"], post["published"], post["created_at"], post["updated_at"], author)
+            for post, author in posts
+        ])
+        return {"version": list_version, "posts": posts, "etag": etag}
+    
+    # Return JSON if requested, streamed so the full list is never held in memory
     if format == "json":
-        posts_data = []
-        for post, author_name in posts_with_authors:
-            posts_data.append({
-                "id": post.id,
-                "title": post.title,
-                "author": author_name,
-                "published": post.published,
-                "created_at": post.created_at.isoformat(),
-                "author_id": post.author_id
-            })
-        return JSONResponse({"posts": posts_data})
+        # Capture the list version before querying so deltas emitted meanwhile are
+        # replayed by the client (applying a delta twice is harmless)
+        list_version = await sockets.changelog.current_version()
+        # The ETag comes from one aggregate row instead of the list itself: any
+        # insert, delete or update moves the count, max id or last update time
+        signature = (await db.execute(
+            select(func.count(models.Post.id), func.max(models.Post.id), func.max(models.Post.updated_at))
+        )).one()
+        etag = make_etag("posts-list-json", list_version, *signature)
+        headers = validator_headers(etag, cache_control=cache_control_for(request, WEB_CACHE_CONTROL))
+        if is_not_modified(request, etag):
+            return not_modified_response(headers)
+        rows = stream_rows(
+            keyset_order(query, models.Post),
+            lambda row: json.dumps(post_list_item(row[0], row[1])),
+            read_sessionmaker(request)
+        )
+        return StreamingResponse(
+            json_array(rows, prefix=f'{{"version": {list_version}, "posts": [', suffix="]}"),
+            media_type="application/json",
+            headers=headers
+        )
+    
+    cached = await cached_read(request, db, POSTS_LIST_KEY, load)
+    
+    # Repeat views and socket-triggered reloads of an unchanged list skip rendering
+    headers = validator_headers(cached["etag"], cache_control=cache_control_for(request, WEB_CACHE_CONTROL))
+    if is_not_modified(request, cached["etag"]):
+        return not_modified_response(headers)
     
     # Otherwise return HTML template
     return templates.TemplateResponse("posts/list.html", {
         "request": request, 
-        "posts": posts_with_authors,
+        "posts": cached["posts"],
+        "list_version": cached["version"],
         "title": "Posts List"
-    })
+    }, headers=headers)
+
+@app.get("/web/posts/changes")
+async def web_posts_changes(since: int = 0):
+    """
+    Return posts list deltas after version `since` so lagging clients can resync.
+    `reset` is true when the version is no longer in the change log.
+    """
+    return await get_post_list_changes(since)
 
 @app.get("/web/posts/create", response_class=HTMLResponse)
 async def web_create_post_form(request: Request, db: AsyncSession = Depends(get_db)):
@@ -161,8 +573,7 @@ async def web_create_post_form(request: Request, db: AsyncSession = Depends(get_
     Display post creation form
     """
     # Get users for dropdown
-    result = await db.execute(select(models.User))
-    users = result.scalars().all()
+    users = await get_user_choices(db)
     
     return templates.TemplateResponse("posts/create.html", {
         "request": request,
@@ -177,19 +588,18 @@ async def web_create_post(
     content: str = Form(...),
     published: bool = Form(False),
     author_id: int = Form(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Process post creation form
     """
-    # Check if user exists
-    user_result = await db.execute(select(models.User).filter(models.User.id == author_id))
-    user = user_result.scalars().first()
+    # Create new post (fails to insert when the author doesn't exist)
+    db_post = await insert_post(db, author_id, title, content, published)
     
-    if not user:
+    if not db_post:
         # Get users for dropdown
-        result = await db.execute(select(models.User))
-        users = result.scalars().all()
+        users = await get_user_choices(db)
         
         return templates.TemplateResponse(
             "posts/create.html", 
@@ -205,17 +615,8 @@ async def web_create_post(
             status_code=400
         )
     
-    # Create new post
-    db_post = models.Post(
-        title=title,
-        content=content,
-        published=published,
-        author_id=author_id
-    )
-    
-    db.add(db_post)
     await db.commit()
-    await db.refresh(db_post)
+    user = await loaders.users.load(author_id)
     
     # Convert post model to dict for broadcast via socket
     post_data = {
@@ -227,49 +628,65 @@ async def web_create_post(
         "created_at": db_post.created_at.isoformat()
     }
     
+    await invalidate_post(db_post.id)
+    
     # Broadcast update via Socket.IO
     await broadcast_new_post(post_data)
-    await broadcast_post_list_update()
+    await broadcast_post_list_update("created", db_post.id, post_list_item(db_post, user.username))
     
     # Redirect to posts list
     response = RedirectResponse(url="/web/posts", status_code=303)
     return response
 
 @app.get("/web/posts/{post_id}", response_class=HTMLResponse)
-async def web_post_detail(request: Request, post_id: int, db: AsyncSession = Depends(get_db)):
+async def web_post_detail(request: Request, post_id: int, db: AsyncSession = Depends(get_read_db)):
     """
     Display post detail page
     """
-    # Get post with author information
-    result = await db.execute(
-        select(models.Post).filter(models.Post.id == post_id)
-    )
-    post = result.scalars().first()
+    async def load(session):
+        # Get post with author information in one query
+        result = await session.execute(
+            select(models.Post)
+            .options(joinedload(models.Post.author), joinedload(models.Post.body))
+            .filter(models.Post.id == post_id)
+        )
+        post = result.scalars().first()
+        
+        if not post:
+            return None
+        
+        author = post.author.username if post.author else None
+        return {
+            "post": PostResponse.model_validate(post).model_dump(),
+            "author": {"username": author},
+            "etag": make_etag("post-detail", post.id, post.updated_at, author)
+        }
     
-    if not post:
+    detail = await cached_read(request, db, post_detail_key(post_id), load)
+    
+    if not detail:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Get author
-    author_result = await db.execute(
-        select(models.User).filter(models.User.id == post.author_id)
-    )
-    author = author_result.scalars().first()
+    last_modified = detail["post"]["updated_at"] or detail["post"]["created_at"]
+    headers = validator_headers(detail["etag"], last_modified, cache_control_for(request, WEB_CACHE_CONTROL))
+    if is_not_modified(request, detail["etag"], last_modified):
+        return not_modified_response(headers)
     
     return templates.TemplateResponse("posts/detail.html", {
         "request": request,
-        "title": post.title,
-        "post": post,
-        "author": author
-    })
+        "title": detail["post"]["title"],
+        "post": detail["post"],
+        "author": detail["author"]
+    }, headers=headers)
 
 @app.get("/web/posts/{post_id}/edit", response_class=HTMLResponse)
 async def web_edit_post_form(request: Request, post_id: int, db: AsyncSession = Depends(get_db)):
     """
     Display post edit form
     """
-    # Get post
+    # Get post with its body
     result = await db.execute(
-        select(models.Post).filter(models.Post.id == post_id)
+        select(models.Post).options(joinedload(models.Post.body)).filter(models.Post.id == post_id)
     )
     post = result.scalars().first()
     
@@ -277,8 +694,7 @@ async def web_edit_post_form(request: Request, post_id: int, db: AsyncSession =
         raise HTTPException(status_code=404, detail="Post not found")
     
     # Get users for dropdown
-    users_result = await db.execute(select(models.User))
-    users = users_result.scalars().all()
+    users = await get_user_choices(db)
     
     return templates.TemplateResponse("posts/edit.html", {
         "request": request,
@@ -295,26 +711,39 @@ async def web_update_post(
     content: str = Form(...),
     published: bool = Form(False),
     author_id: int = Form(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Process post update form
     """
-    # Check if post exists
-    post_result = await db.execute(select(models.Post).filter(models.Post.id == post_id))
-    post = post_result.scalars().first()
-    
-    if not post:
+    # Counted columns before the update (author and published may change)
+    old = await lock_post_counts(db, post_id)
+    if old is None:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Check if user exists
-    user_result = await db.execute(select(models.User).filter(models.User.id == author_id))
-    user = user_result.scalars().first()
+    # The body is only rewritten when it changed (most edits touch the title or flags)
+    content_changed = old.content_hash != content_hash(content)
+    
+    # Update post with UPDATE ... RETURNING; the EXISTS guard skips the update
+    # when the new author doesn't exist
+    result = await db.scalars(
+        update(models.Post)
+        .where(models.Post.id == post_id, exists().where(models.User.id == author_id))
+        .values(
+            title=title, published=published, author_id=author_id,
+            **post_values(title, content if content_changed else None)
+        )
+        .returning(models.Post)
+    )
+    post = result.first()
     
-    if not user:
+    if not post:
+        # Nothing was updated: the author is missing
+        post = await loaders.posts.load(post_id)
+        
         # Get users for dropdown
-        result = await db.execute(select(models.User))
-        users = result.scalars().all()
+        users = await get_user_choices(db)
         
         return templates.TemplateResponse(
             "posts/edit.html", 
@@ -328,14 +757,12 @@ async def web_update_post(
             status_code=400
         )
     
-    # Update post
-    post.title = title
-    post.content = content
-    post.published = published
-    post.author_id = author_id
-    
+    if content_changed:
+        await update_body(db, post_id, content)
+    attach_body(post, content)
+    await count_updated(db, old, post)
     await db.commit()
-    await db.refresh(post)
+    user = await loaders.users.load(author_id)
     
     # Convert post model to dict for broadcast via socket
     post_data = {
@@ -347,8 +774,11 @@ async def web_update_post(
         "updated_at": post.updated_at.isoformat() if post.updated_at else None
     }
     
+    await invalidate_post(post_id)
+    
     # Broadcast update via Socket.IO
     await broadcast_post_update(post_id, post_data, "update")
+    await broadcast_post_list_update("updated", post.id, post_list_item(post, user.username))
     
     # Redirect to post detail
     response = RedirectResponse(url=f"/web/posts/{post_id}", status_code=303)
@@ -359,20 +789,17 @@ async def web_delete_post(post_id: int, db: AsyncSession = Depends(get_db)):
     """
     Delete post
     """
-    # Check if post exists
-    post_result = await db.execute(select(models.Post).filter(models.Post.id == post_id))
-    post = post_result.scalars().first()
-    
-    if not post:
+    # Delete post, a missing post returns no row
+    if await delete_post_returning(db, post_id) is None:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Delete post
-    await db.delete(post)
     await db.commit()
     
+    await invalidate_post(post_id)
+    
     # Broadcast delete via Socket.IO
     await broadcast_post_update(post_id, {}, "delete")
-    await broadcast_post_list_update()
+    await broadcast_post_list_update("deleted", post_id)
     
     # Redirect to posts list
     response = RedirectResponse(url="/web/posts", status_code=303)
@@ -381,16 +808,6 @@ async def web_delete_post(post_id: int, db: AsyncSession = Depends(get_db)):
 # User CRUD operations
 @app.post("/users/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
-    # In production, hash the password here
-    hashed_password = user.password  # This should be hashed in production!
-    
-    db_user = models.User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password,
-        is_active=user.is_active
-    )
-    
     # Check if username or email already exists
     result = await db.execute(select(models.User).filter(
         (models.User.username == user.username) | (models.User.email == user.email)
@@ -403,57 +820,253 @@ async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
             detail="Username or email already registered"
         )
     
+    # Hashed on the password worker pool, only once the user is known to be new
+    db_user = models.User(
+        username=user.username,
+        email=user.email,
+        hashed_password=await passwords.hash(user.password),
+        is_active=user.is_active
+    )
+    
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    await invalidate_users()
     return db_user
 
+@app.post("/auth/socket-token")
+async def socket_token(credentials: SocketTokenRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Check a username and password and return a signed token for the Socket.IO
+    `authenticate` event. Plain or outdated password hashes are upgraded here.
+    """
+    result = await db.execute(
+        select(models.User.id, models.User.hashed_password, models.User.is_active)
+        .filter(models.User.username == credentials.username)
+    )
+    user = result.first()
+    # Unknown users take as long as a wrong password (see PasswordService.verify)
+    valid = await passwords.verify(user.hashed_password if user else None, credentials.password)
+    if not valid or not user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
+    if needs_rehash(user.hashed_password):
+        await db.execute(
+            update(models.User).where(models.User.id == user.id)
+            .values(hashed_password=await passwords.hash(credentials.password))
+        )
+        await db.commit()
+    return {"token": sockets.make_socket_token(user.id), "user_id": user.id, "expires_in": SOCKETIO_AUTH_TTL}
+
+@app.post("/users/bulk")
+async def bulk_create_users(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    """
+    Create users from an NDJSON body, one UserCreate object per line.
+    Rows are written in batches; the response lists the rows that failed.
+    A line over BULK_MAX_LINE_BYTES ends the upload with 413 (rows before it
+    are kept, see `inserted`).
+    """
+    report = await ingest_users(db, request.stream())
+    if report["aborted"]:
+        response.status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    return report
+
 @app.get("/users/", response_model=List[UserResponse])
-async def read_users(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.User).offset(skip).limit(limit))
-    users = result.scalars().all()
-    return users
+async def read_users(
+    request: Request,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of fields to return"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    List users newest first. Pass the `X-Next-Cursor` header of a page as
+    `cursor` to get the next one; `skip` is kept for old clients only.
+    """
+    fields = parse_fields(fields, USER_FIELDS)
+    columns = projection(models.User, fields, [column.key for column in USER_VERSION_COLUMNS] + ["created_at"])
+    query = keyset_paginate(select(*columns), models.User, cursor, limit)
+    if skip and not cursor:
+        query = query.offset(skip)
+    cache_control = cache_control_for(request)
+    if request.headers.get("if-none-match"):
+        etag = await fetch_page_etag(db, query, "users", USER_VERSION_COLUMNS)
+        if is_not_modified(request, etag):
+            return not_modified_response(validator_headers(etag, cache_control=cache_control))
+    # Core rows straight to JSON: no ORM objects, no response_model validation
+    result = await db.execute(query)
+    users = list(result.all())
+    
+    # Includes the look-ahead row, like fetch_page_etag()
+    headers = validator_headers(page_etag("users", users, USER_VERSION_COLUMNS), cache_control=cache_control)
+    cursor = next_cursor(users, limit)
+    if cursor:
+        headers["X-Next-Cursor"] = cursor
+    return FastJSONResponse(to_dicts(users, fields), headers=headers)
+
+@app.get("/users/export")
+async def export_users(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|json)$"),
+    fields: Optional[str] = None
+):
+    """
+    Stream every user as NDJSON (default) or as a JSON array
+    """
+    fields = parse_fields(fields, USER_FIELDS)
+    rows = stream_rows(
+        keyset_order(select(*projection(models.User, fields)), models.User),
+        lambda row: dumps(to_dict(row, fields)).decode(),
+        read_sessionmaker(request)
+    )
+    if format == "json":
+        return StreamingResponse(json_array(rows), media_type="application/json")
+    return StreamingResponse(ndjson_lines(rows), media_type="application/x-ndjson")
 
 # Post CRUD operations
 @app.post("/posts/", response_model=PostResponse, status_code=status.HTTP_201_CREATED)
-async def create_post(post: PostCreate, user_id: int, db: AsyncSession = Depends(get_db)):
-    # Check if user exists
-    user_result = await db.execute(select(models.User).filter(models.User.id == user_id))
-    user = user_result.scalars().first()
+async def create_post(
+    post: PostCreate,
+    user_id: int,
+    db: AsyncSession = Depends(get_db),
+    loaders: Loaders = Depends(get_loaders)
+):
+    # Insert only if the user exists, in a single statement
+    db_post = await insert_post(db, user_id, post.title, post.content, post.published)
     
-    if not user:
+    if not db_post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User with id {user_id} not found"
         )
     
-    db_post = models.Post(**post.dict(), author_id=user_id)
-    db.add(db_post)
     await db.commit()
-    await db.refresh(db_post)
+    user = await loaders.users.load(user_id)
+    
+    await invalidate_post(db_post.id)
+    await broadcast_post_list_update("created", db_post.id, post_list_item(db_post, user.username))
     return db_post
 
-@app.get("/posts/", response_model=List[PostResponse])
+@app.post("/posts/bulk")
+async def bulk_create_posts(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    """
+    Create posts from an NDJSON body, one object per line with title, content,
+    published and author_id. Rows are written in batches with one posts list
+    broadcast per batch; the response lists the rows that failed. A line
+    over BULK_MAX_LINE_BYTES ends the upload with 413 (rows before it are
+    kept, see `inserted`).
+    """
+    report = await ingest_posts(db, request.stream())
+    if report["aborted"]:
+        response.status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    return report
+
+@app.get("/posts/", response_model=List[PostSummary])
 async def read_posts(
+    request: Request,
+    cursor: Optional[str] = None,
     skip: int = 0, 
-    limit: int = 100, 
+    limit: int = Query(100, ge=1, le=1000), 
     search: Optional[str] = None,
-    db: AsyncSession = Depends(get_db)
+    fields: Optional[str] = Query(None, description="Comma-separated subset of fields to return, e.g. id,title,created_at"),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    query = select(models.Post)
-    
+    """
+    List posts newest first, or by relevance when `search` is given (prefix
+    matching over title and content). Pass the `X-Next-Cursor` header of a page
+    as `cursor` to get the next one; `skip` is kept for old clients only.
+    Posts come without their body (the excerpt stands in for it); add
+    `content` to `fields` to get bodies too, at one extra query per page.
+    """
+    fields = parse_fields(fields, POST_FIELDS, POST_SUMMARY_FIELDS)
+    columns = projection(
+        models.Post, column_fields(fields), [column.key for column in POST_VERSION_COLUMNS] + ["created_at"]
+    )
+    cache_control = cache_control_for(request)
     if search:
-        query = query.filter(models.Post.title.contains(search))
+        # Ranked full-text search over title and content; the ETag only saves
+        # the transfer and serialization here
+        posts, cursor = await search_posts(db, search, cursor, limit, columns)
+        headers = validator_headers(make_etag(page_etag("search", posts, POST_VERSION_COLUMNS), cursor), cache_control=cache_control)
+        if is_not_modified(request, headers["ETag"]):
+            return not_modified_response(headers)
+        if cursor:
+            headers["X-Next-Cursor"] = cursor
+        return FastJSONResponse(await post_dicts(db, posts, fields), headers=headers)
     
-    query = query.offset(skip).limit(limit)
+    query = keyset_paginate(select(*columns), models.Post, cursor, limit)
+    if skip and not cursor:
+        query = query.offset(skip)
+    if request.headers.get("if-none-match"):
+        etag = await fetch_page_etag(db, query, "posts", POST_VERSION_COLUMNS)
+        if is_not_modified(request, etag):
+            return not_modified_response(validator_headers(etag, cache_control=cache_control))
+    # Core rows straight to JSON: no ORM objects, no response_model validation
     result = await db.execute(query)
-    posts = result.scalars().all()
-    return posts
+    posts = list(result.all())
+    
+    # Includes the look-ahead row, like fetch_page_etag()
+    headers = validator_headers(page_etag("posts", posts, POST_VERSION_COLUMNS), cache_control=cache_control)
+    cursor = next_cursor(posts, limit)
+    if cursor:
+        headers["X-Next-Cursor"] = cursor
+    return FastJSONResponse(await post_dicts(db, posts, fields), headers=headers)
+
+@app.get("/posts/export")
+async def export_posts(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|json)$"),
+    fields: Optional[str] = None
+):
+    """
+    Stream every post as NDJSON (default) or as a JSON array; bodies are
+    joined in only when `content` is among the fields
+    """
+    fields = parse_fields(fields, POST_FIELDS)
+    query = select(*projection(models.Post, column_fields(fields)))
+    if "content" in fields:
+        query = query.add_columns(*body_columns()).outerjoin(models.PostBody)
+    rows = stream_rows(
+        keyset_order(query, models.Post),
+        lambda row: dumps(row_dict(row, fields) if "content" in fields else to_dict(row, fields)).decode(),
+        read_sessionmaker(request)
+    )
+    if format == "json":
+        return StreamingResponse(json_array(rows), media_type="application/json")
+    return StreamingResponse(ndjson_lines(rows), media_type="application/x-ndjson")
+
+# Aggregates, read from the post_stats counters (never from the posts table)
+@app.get("/stats/posts")
+async def post_stats(db: AsyncSession = Depends(get_read_db)):
+    """
+    Total, published and draft post counts and the published ratio
+    """
+    return await get_post_totals(db)
+
+@app.get("/stats/posts/authors")
+async def post_stats_by_author(limit: int = Query(50, ge=1, le=1000), db: AsyncSession = Depends(get_read_db)):
+    """
+    Post counts per author, most prolific first
+    """
+    return await get_author_stats(db, limit)
+
+@app.get("/stats/posts/daily")
+async def post_stats_by_day(days: int = Query(30, ge=1, le=366), db: AsyncSession = Depends(get_read_db)):
+    """
+    Posts created per UTC day over the last `days` days, oldest first
+    """
+    return await get_daily_stats(db, days)
 
 @app.get("/posts/{post_id}", response_model=PostResponse)
-async def read_post(post_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.Post).filter(models.Post.id == post_id))
-    post = result.scalars().first()
+async def read_post(request: Request, response: Response, post_id: int, db: AsyncSession = Depends(get_read_db)):
+    async def load(session):
+        result = await session.execute(
+            select(models.Post).options(joinedload(models.Post.body)).filter(models.Post.id == post_id)
+        )
+        post = result.scalars().first()
+        return PostResponse.model_validate(post).model_dump() if post else None
+    
+    post = await cached_read(request, db, post_key(post_id), load)
     
     if post is None:
         raise HTTPException(
@@ -461,12 +1074,45 @@ async def read_post(post_id: int, db: AsyncSession = Depends(get_db)):
             detail=f"Post with id {post_id} not found"
         )
     
+    # Usually served from the cache, so revalidation doesn't touch the database at all
+    etag = make_etag("post", post["id"], post["updated_at"])
+    last_modified = post["updated_at"] or post["created_at"]
+    headers = validator_headers(etag, last_modified, cache_control_for(request))
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(headers)
+    response.headers.update(headers)
     return post
 
 @app.put("/posts/{post_id}", response_model=PostResponse)
-async def update_post(post_id: int, post: PostUpdate, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.Post).filter(models.Post.id == post_id))
-    db_post = result.scalars().first()
+async def update_post(
+    post_id: int,
+    post: PostUpdate,
+    db: AsyncSession = Depends(get_db),
+    loaders: Loaders = Depends(get_loaders)
+):
+    # Update only fields that are provided
+    update_data = post.dict(exclude_unset=True)
+    if update_data:
+        # Only a published change moves the post between counters
+        old = await lock_post_counts(db, post_id) if "published" in update_data else None
+        content = update_data.pop("content", None)
+        result = await db.scalars(
+            update(models.Post)
+            .where(models.Post.id == post_id)
+            .values(**update_data, **post_values(update_data.get("title"), content))
+            .returning(models.Post)
+        )
+        db_post = result.first()
+        if db_post is not None:
+            if content is not None:
+                await update_body(db, post_id, content)
+                attach_body(db_post, content)
+            else:
+                await load_body(db, db_post)
+        if old is not None and db_post is not None:
+            await count_updated(db, old, db_post)
+    else:
+        db_post = await loaders.posts.load(post_id)
     
     if db_post is None:
         raise HTTPException(
@@ -474,26 +1120,26 @@ async def update_post(post_id: int, post: PostUpdate, db: AsyncSession = Depends
             detail=f"Post with id {post_id} not found"
         )
     
-    # Update only fields that are provided
-    update_data = post.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_post, key, value)
-    
     await db.commit()
-    await db.refresh(db_post)
+    await invalidate_post(db_post.id)
+    
+    author = await loaders.users.load(db_post.author_id)
+    await broadcast_post_list_update("updated", db_post.id, post_list_item(db_post, author.username if author else None))
     return db_post
 
 @app.delete("/posts/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_post(post_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.Post).filter(models.Post.id == post_id))
-    post = result.scalars().first()
-    
-    if post is None:
+    if await delete_post_returning(db, post_id) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Post with id {post_id} not found"
         )
     
-    await db.delete(post)
     await db.commit()
-    return None
\ No newline at end of file
+    
+    await invalidate_post(post_id)
+    await broadcast_post_list_update("deleted", post_id)
+    return None
+
+# Everything above runs at import time; the startup hooks take it from here
+startup_timings.mark("import")
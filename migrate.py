@@ -0,0 +1,201 @@
+"""
+Versioned schema migrations.
+
+Every file migrations/NNNN_name.py is one schema version with an
+`async def upgrade(conn)`, applied in version order inside its own
+transaction and recorded in the schema_migrations table. Apply pending
+migrations once per deploy, before the workers start:
+    python migrate.py            - apply pending migrations
+    python migrate.py --status   - show applied and pending versions
+
+`python run.py` does this before starting uvicorn, so workers only compare
+the recorded version with the newest migration file (one query). On
+Postgres the runner holds an advisory lock, so processes migrating at the
+same time (several workers with DB_AUTO_MIGRATE, or two deploys) apply
+each migration exactly once; the others wait and then find nothing to do.
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import re
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, insert, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import func
+
+from database import engine
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# Apply pending migrations on worker startup when the schema is behind
+# (development convenience); false makes a stale schema a startup error
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "true").lower() == "true"
+# pg_advisory_lock key; any constant no other application on the database uses
+DB_MIGRATION_LOCK_KEY = int(os.getenv("DB_MIGRATION_LOCK_KEY", "720301"))
+
+_FILENAME_RE = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: str
+
+    def load(self):
+        """
+        Import the migration file; only done for migrations about to be applied
+        """
+        spec = importlib.util.spec_from_file_location(f"migrations.m{self.version:04d}_{self.name}", self.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.upgrade
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """
+    Migration files sorted by version (a directory listing, nothing imported)
+    """
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _FILENAME_RE.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort()
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def latest_version() -> int:
+    migrations = load_migrations()
+    return migrations[-1].version if migrations else 0
+
+
+async def current_version(db_engine=engine) -> Optional[int]:
+    """
+    Newest applied version; None when schema_migrations doesn't exist yet
+    """
+    async with db_engine.connect() as conn:
+        try:
+            return (await conn.execute(select(func.max(schema_migrations.c.version)))).scalar() or 0
+        except DBAPIError:
+            return None
+
+
+async def applied_versions(conn) -> Dict[int, str]:
+    result = await conn.execute(select(schema_migrations.c.version, schema_migrations.c.name))
+    return {row.version: row.name for row in result.all()}
+
+
+async def _lock(conn) -> None:
+    if conn.dialect.name == "postgresql":
+        # Session-level lock: held across the per-migration transactions below
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": DB_MIGRATION_LOCK_KEY})
+        await conn.commit()
+
+
+async def _unlock(conn) -> None:
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": DB_MIGRATION_LOCK_KEY})
+        await conn.commit()
+
+
+async def migrate(db_engine=engine) -> List[int]:
+    """
+    Apply pending migrations in order; returns the versions applied.
+    SQLite has no advisory locks: there the version's primary key keeps a
+    concurrent runner from recording a migration twice, which is enough
+    for the single-process setups SQLite is used with.
+    """
+    applied = []
+    async with db_engine.connect() as conn:
+        await _lock(conn)
+        try:
+            async with conn.begin():
+                await conn.run_sync(schema_migrations.metadata.create_all)
+            async with conn.begin():
+                done = await applied_versions(conn)
+            for migration in load_migrations():
+                if migration.version in done:
+                    continue
+                upgrade = migration.load()
+                started = time.perf_counter()
+                async with conn.begin():
+                    await upgrade(conn)
+                    await conn.execute(
+                        insert(schema_migrations).values(version=migration.version, name=migration.name)
+                    )
+                applied.append(migration.version)
+                print(f"Applied migration {migration.version:04d}_{migration.name} "
+                      f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+        finally:
+            await _unlock(conn)
+    return applied
+
+
+async def check_schema(db_engine=engine) -> int:
+    """
+    Worker startup check: one query comparing the recorded schema version
+    with the newest migration file. A stale schema is migrated when
+    DB_AUTO_MIGRATE is on and refuses to start otherwise. Returns the version.
+    """
+    latest = latest_version()
+    version = await current_version(db_engine)
+    if version == latest:
+        return version
+    if version is not None and version > latest:
+        # A newer deploy migrated already; this code still works with the columns it knows
+        print(f"Database schema version {version} is newer than this code ({latest})")
+        return version
+    if not DB_AUTO_MIGRATE:
+        raise RuntimeError(
+            f"Database schema is at version {version or 0}, this code needs {latest}: run `python migrate.py`"
+        )
+    await migrate(db_engine)
+    return latest
+
+
+async def status(db_engine=engine) -> List[str]:
+    async with db_engine.connect() as conn:
+        try:
+            done = await applied_versions(conn)
+        except DBAPIError:
+            done = {}
+    return [
+        f"{migration.version:04d}_{migration.name}: {'applied' if migration.version in done else 'pending'}"
+        for migration in load_migrations()
+    ]
+
+
+async def run(args) -> None:
+    try:
+        if args.status:
+            print("\n".join(await status()))
+        else:
+            applied = await migrate()
+            print(f"Schema at version {latest_version():04d} ({len(applied)} migrations applied)")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending database migrations")
+    parser.add_argument("--status", action="store_true", help="Only list applied and pending migrations")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
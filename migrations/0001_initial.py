@@ -0,0 +1,84 @@
+"""
+Initial schema: the tables as they were when migrations were introduced.
+
+Defined here rather than taken from models.py so later model changes need
+their own migration instead of silently changing this one. Tables that
+already exist (databases created by the old create_all() on startup) are
+left alone, but their indexes are still created when missing: those
+databases predate ix_users_created_at_id and ix_posts_created_at_id, which
+keyset pagination relies on.
+"""
+from sqlalchemy import (
+    JSON, BigInteger, Boolean, Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text
+)
+from sqlalchemy.sql import func
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String(50), unique=True, index=True),
+    Column("email", String(100), unique=True, index=True),
+    Column("hashed_password", String(100)),
+    Column("is_active", Boolean),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Index("ix_users_created_at_id", "created_at", "id"),
+)
+
+Table(
+    "posts", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("title", String(100), index=True),
+    Column("content", Text),
+    Column("published", Boolean),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True)),
+    Column("author_id", Integer, ForeignKey("users.id")),
+    Index("ix_posts_created_at_id", "created_at", "id"),
+)
+
+Table(
+    "post_stats", metadata,
+    Column("dimension", String(16), primary_key=True),
+    Column("bucket", String(32), primary_key=True),
+    Column("posts", Integer, nullable=False),
+    Column("published", Integer, nullable=False),
+)
+
+Table(
+    "post_list_changes", metadata,
+    Column("version", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+    Column("type", String(10)),
+    Column("post_id", Integer),
+    Column("post", JSON, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+Table(
+    "socket_presence", metadata,
+    Column("sid", String(64), primary_key=True),
+    Column("host_id", String(32), index=True),
+    Column("user_id", String(64), nullable=True, index=True),
+    Column("connected_at", DateTime(timezone=True), server_default=func.now()),
+    Column("seen_at", DateTime(timezone=True), server_default=func.now(), index=True),
+)
+
+Table(
+    "socketio_payloads", metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+    Column("payload", Text),
+    Column("created_at", DateTime(timezone=True), server_default=func.now(), index=True),
+)
+
+
+def _create(sync_conn) -> None:
+    metadata.create_all(sync_conn)
+    # create_all skips every index of a table that already exists
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+async def upgrade(conn) -> None:
+    await conn.run_sync(_create)
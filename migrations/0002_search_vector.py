@@ -0,0 +1,22 @@
+"""
+Full-text search column and its GIN index (Postgres only, see search.py).
+The column starts out generated from title and content; 0004 turns it into
+a plain column the application writes.
+"""
+from sqlalchemy import text
+
+from search import SEARCH_LANGUAGE
+
+
+async def upgrade(conn) -> None:
+    if conn.dialect.name != "postgresql":
+        return
+    await conn.execute(text(
+        "ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+        f"setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(title, '')), 'A') || "
+        f"setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(content, '')), 'B')"
+        ") STORED"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_posts_search_vector ON posts USING GIN (search_vector)"
+    ))
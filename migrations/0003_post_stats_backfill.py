@@ -0,0 +1,57 @@
+"""
+Fill the post counters from the posts table (see stats.py). Writes keep
+them current from here on, so this used to run on every start for nothing.
+
+The counting is a frozen copy of stats.PostStatsDelta as it was when this
+migration was written, so later changes there don't change this one. The
+posts table is read once, streamed.
+"""
+from datetime import timezone
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, MetaData, String, Table, insert, select
+
+metadata = MetaData()
+
+posts = Table(
+    "posts", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("published", Boolean),
+    Column("created_at", DateTime(timezone=True)),
+    Column("author_id", Integer),
+)
+
+post_stats = Table(
+    "post_stats", metadata,
+    Column("dimension", String(16), primary_key=True),
+    Column("bucket", String(32), primary_key=True),
+    Column("posts", Integer, nullable=False),
+    Column("published", Integer, nullable=False),
+)
+
+
+def _buckets(author_id, created_at):
+    # Days are UTC dates; SQLite returns naive timestamps, which are UTC
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    day = created_at.astimezone(timezone.utc).date().isoformat()
+    return ("total", ""), ("author", str(author_id)), ("day", day)
+
+
+async def upgrade(conn) -> None:
+    if (await conn.execute(select(post_stats.c.dimension).limit(1))).first() is not None:
+        return
+    counts = {}
+    result = await conn.stream(
+        select(posts.c.author_id, posts.c.published, posts.c.created_at).execution_options(yield_per=1000)
+    )
+    async for post in result:
+        for key in _buckets(post.author_id, post.created_at):
+            row = counts.setdefault(key, [0, 0])
+            row[0] += 1
+            row[1] += 1 if post.published else 0
+    rows = [
+        {"dimension": dimension, "bucket": bucket, "posts": total, "published": published}
+        for (dimension, bucket), (total, published) in sorted(counts.items())
+    ]
+    if rows:
+        await conn.execute(insert(post_stats), rows)
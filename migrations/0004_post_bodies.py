@@ -0,0 +1,109 @@
+"""
+Move post bodies out of line into post_bodies and add the columns derived
+from them (excerpt, word_count, content_hash; see post_content.py).
+
+Existing bodies are copied and the derived columns filled in batches of
+BACKFILL_BATCH posts. On Postgres search_vector stops being generated from
+posts.content (which is dropped) and becomes a plain column the application
+writes; the values already stored are kept.
+
+The derivation is a frozen copy of post_content.py as it was when this
+migration was written, so later changes there don't change this one. It
+honours the same settings (POST_EXCERPT_LENGTH, POST_BODY_COMPRESSION, ...).
+"""
+import hashlib
+import os
+import re
+import zlib
+
+from sqlalchemy import (
+    Column, ForeignKey, Integer, LargeBinary, MetaData, String, Table, Text, bindparam, insert, select, text, update
+)
+
+BACKFILL_BATCH = 1000
+
+EXCERPT_LENGTH = int(os.getenv("POST_EXCERPT_LENGTH", "200"))
+COMPRESSION = os.getenv("POST_BODY_COMPRESSION", "none").lower()
+COMPRESS_MIN_BYTES = int(os.getenv("POST_BODY_COMPRESS_MIN_BYTES", "1024"))
+ZLIB_LEVEL = int(os.getenv("POST_BODY_ZLIB_LEVEL", "6"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _excerpt(content: str) -> str:
+    text = _WHITESPACE_RE.sub(" ", content).strip()
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    cut = text[:EXCERPT_LENGTH]
+    space = cut.rfind(" ")
+    if space > EXCERPT_LENGTH // 2:
+        cut = cut[:space]
+    return cut.rstrip(" ,.;:") + "…"
+
+
+def derived_fields(content: str) -> dict:
+    return {
+        "excerpt": _excerpt(content),
+        "word_count": len(content.split()),
+        "content_hash": hashlib.blake2b(content.encode(), digest_size=16).hexdigest(),
+    }
+
+
+def encode_body(content: str) -> dict:
+    data = content.encode()
+    if COMPRESSION == "zlib" and len(data) >= COMPRESS_MIN_BYTES:
+        return {"content": None, "compressed": zlib.compress(data, ZLIB_LEVEL)}
+    return {"content": content, "compressed": None}
+
+
+metadata = MetaData()
+
+posts = Table(
+    "posts", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("content", Text),
+    Column("excerpt", String(300)),
+    Column("word_count", Integer),
+    Column("content_hash", String(32)),
+)
+
+post_bodies = Table(
+    "post_bodies", metadata,
+    Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True),
+    Column("content", Text, nullable=True),
+    Column("compressed", LargeBinary, nullable=True),
+)
+
+
+async def _backfill(conn) -> None:
+    last_id = 0
+    while True:
+        result = await conn.execute(
+            select(posts.c.id, posts.c.content).where(posts.c.id > last_id).order_by(posts.c.id).limit(BACKFILL_BATCH)
+        )
+        rows = result.all()
+        if not rows:
+            return
+        await conn.execute(
+            insert(post_bodies),
+            [{"post_id": row.id, **encode_body(row.content or "")} for row in rows]
+        )
+        await conn.execute(
+            update(posts).where(posts.c.id == bindparam("post_id")),
+            [{"post_id": row.id, **derived_fields(row.content or "")} for row in rows]
+        )
+        last_id = rows[-1].id
+
+
+async def upgrade(conn) -> None:
+    await conn.run_sync(post_bodies.create, checkfirst=True)
+    await conn.execute(text("ALTER TABLE posts ADD COLUMN excerpt VARCHAR(300) NOT NULL DEFAULT ''"))
+    await conn.execute(text("ALTER TABLE posts ADD COLUMN word_count INTEGER NOT NULL DEFAULT 0"))
+    await conn.execute(text("ALTER TABLE posts ADD COLUMN content_hash VARCHAR(32)"))
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("ALTER TABLE posts ALTER COLUMN search_vector DROP EXPRESSION"))
+    else:
+        # Never filled without Postgres; present so the model's column exists everywhere
+        await conn.execute(text("ALTER TABLE posts ADD COLUMN search_vector TEXT"))
+    await _backfill(conn)
+    await conn.execute(text("ALTER TABLE posts DROP COLUMN content"))
@@ -0,0 +1,31 @@
+"""
+Job queue table (see jobs.py). Workers claim due jobs per kind with
+SELECT ... FOR UPDATE SKIP LOCKED through the partial (kind, run_at) index,
+which leaves out jobs that have failed for good.
+"""
+from sqlalchemy import (
+    BigInteger, Column, DateTime, Index, Integer, JSON, MetaData, String, Table, Text
+)
+
+metadata = MetaData()
+
+jobs = Table(
+    "jobs", metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+    Column("kind", String(64), nullable=False),
+    Column("payload", JSON, nullable=False),
+    Column("attempts", Integer, nullable=False, default=0),
+    Column("run_at", DateTime(timezone=True), nullable=False),
+    Column("claim_token", String(32), nullable=True),
+    Column("last_error", Text, nullable=True),
+    Column("failed_at", DateTime(timezone=True), nullable=True),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+)
+Index(
+    "ix_jobs_kind_run_at", jobs.c.kind, jobs.c.run_at,
+    postgresql_where=jobs.c.failed_at.is_(None), sqlite_where=jobs.c.failed_at.is_(None)
+)
+
+
+async def upgrade(conn) -> None:
+    await conn.run_sync(metadata.create_all)
@@ -1,6 +1,9 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+import zlib
+
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Text, ForeignKey, Index, JSON, LargeBinary
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from database import Base
 
 class User(Base):
@@ -15,17 +18,116 @@ class User(Base):
     
     # Relationship with posts
     posts = relationship("Post", back_populates="author")
+    
+    # Keyset pagination index (see pagination.py)
+    __table_args__ = (Index("ix_users_created_at_id", "created_at", "id"),)
 
 class Post(Base):
     __tablename__ = "posts"
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(100), index=True)
-    content = Column(Text)
     published = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     author_id = Column(Integer, ForeignKey("users.id"))
     
+    # Derived from the body on every write (see post_content.py), so lists
+    # and search never read the body itself
+    excerpt = Column(String(300), nullable=False, default="")
+    word_count = Column(Integer, nullable=False, default=0)
+    content_hash = Column(String(32))
+    
+    # Full-text search vector, written with the post (Postgres only; see search.py)
+    search_vector = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite")))
+    
     # Relationship with user
-    author = relationship("User", back_populates="posts")
\ No newline at end of file
+    author = relationship("User", back_populates="posts")
+    
+    # The body lives in post_bodies and is only loaded when asked for
+    # (options(joinedload(Post.body))); anything else raises instead of lazy loading
+    body = relationship("PostBody", uselist=False, lazy="raise", passive_deletes=True)
+    
+    @property
+    def content(self):
+        return self.body.text if self.body is not None else None
+    
+    # Keyset pagination index (see pagination.py)
+    __table_args__ = (Index("ix_posts_created_at_id", "created_at", "id"),)
+
+class PostBody(Base):
+    """Full post body, out of line from posts; zlib-compressed when POST_BODY_COMPRESSION is on"""
+    __tablename__ = "post_bodies"
+    
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    # Exactly one of them is set
+    content = Column(Text, nullable=True)
+    compressed = Column(LargeBinary, nullable=True)
+    
+    @property
+    def text(self) -> str:
+        if self.compressed is not None:
+            return zlib.decompress(self.compressed).decode()
+        return self.content or ""
+
+class PostStat(Base):
+    """Post counters per dimension ("total", "author", "day"), kept in step with every post write (see stats.py)"""
+    __tablename__ = "post_stats"
+    
+    dimension = Column(String(16), primary_key=True)
+    bucket = Column(String(32), primary_key=True)
+    posts = Column(Integer, nullable=False, default=0)
+    published = Column(Integer, nullable=False, default=0)
+
+class PostListChange(Base):
+    """Shared posts list change log, used when several workers broadcast deltas"""
+    __tablename__ = "post_list_changes"
+    
+    version = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    type = Column(String(10))
+    post_id = Column(Integer)
+    post = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class SocketPresence(Base):
+    """Socket connections of every worker, so presence is shared"""
+    __tablename__ = "socket_presence"
+    
+    sid = Column(String(64), primary_key=True)
+    host_id = Column(String(32), index=True)
+    user_id = Column(String(64), nullable=True, index=True)
+    connected_at = Column(DateTime(timezone=True), server_default=func.now())
+    seen_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class SocketPayload(Base):
+    """Socket.IO messages too large for a NOTIFY payload, fetched by id"""
+    __tablename__ = "socketio_payloads"
+    
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    payload = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class Job(Base):
+    """Deferred work, enqueued in the transaction of the write that needs it (see jobs.py)"""
+    __tablename__ = "jobs"
+    
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    kind = Column(String(64), nullable=False)
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Due time; while a worker holds the job, the end of its lease
+    run_at = Column(DateTime(timezone=True), nullable=False)
+    # Set by the claim that holds the job, so an expired lease can't ack it
+    claim_token = Column(String(32), nullable=True)
+    last_error = Column(Text, nullable=True)
+    # Set once the job has used up its attempts; kept for inspection, never claimed
+    failed_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    
+    # Claim order per kind, live jobs only
+    __table_args__ = (
+        Index(
+            "ix_jobs_kind_run_at", "kind", "run_at",
+            postgresql_where=failed_at.is_(None), sqlite_where=failed_at.is_(None)
+        ),
+    )
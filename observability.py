@@ -0,0 +1,310 @@
+import os
+import random
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import fastapi.routing
+import greenlet
+from fastapi.templating import Jinja2Templates
+from sqlalchemy import event
+
+from metrics import Histogram, PrometheusWriter
+
+# Add a Server-Timing header (db, pool, render, serialize, app) to every response
+OBS_SERVER_TIMING = os.getenv("OBS_SERVER_TIMING", "true").lower() == "true"
+# Statements slower than this are logged with the application stack; 0 disables
+OBS_SLOW_QUERY_MS = float(os.getenv("OBS_SLOW_QUERY_MS", "200"))
+# Fraction of requests whose individual statements are traced and printed
+OBS_TRACE_SAMPLE_RATE = float(os.getenv("OBS_TRACE_SAMPLE_RATE", "0"))
+# Slow queries kept for /metrics/slow-queries
+OBS_SLOW_QUERY_LOG_SIZE = int(os.getenv("OBS_SLOW_QUERY_LOG_SIZE", "100"))
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PHASES = ("db", "pool", "render", "serialize")
+
+
+class RequestTimings:
+    """
+    Where the time of one request went; shared with the SQLAlchemy hooks
+    through a context variable
+    """
+
+    def __init__(self, sampled: bool = False):
+        self.started = time.perf_counter()
+        self.durations: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.statements = 0
+        self.sampled = sampled
+        self.trace: List[Tuple[float, str]] = []
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.durations[phase] += seconds
+
+    def server_timing(self, total: float) -> str:
+        parts = [f'db;dur={self.durations["db"] * 1000:.1f};desc="{self.statements} queries"']
+        parts.extend(f"{phase};dur={self.durations[phase] * 1000:.1f}" for phase in PHASES[1:])
+        parts.append(f"app;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+class Registry:
+    """
+    Process-wide metrics. With several workers every process has its own
+    registry, so scrape each worker or aggregate in Prometheus.
+    """
+
+    def __init__(self):
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.request_latency: Dict[Tuple[str, str], Histogram] = {}
+        self.statements: Dict[str, int] = {}
+        self.statement_latency: Dict[str, Histogram] = {}
+        self.phase_latency = {phase: Histogram() for phase in ("render", "serialize")}
+        self.slow_queries: Deque[Dict[str, Any]] = deque(maxlen=OBS_SLOW_QUERY_LOG_SIZE)
+        self.slow_query_count = 0
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float) -> None:
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.request_latency.get((method, route))
+        if histogram is None:
+            histogram = self.request_latency[(method, route)] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_statement(self, engine_name: str, seconds: float) -> None:
+        self.statements[engine_name] = self.statements.get(engine_name, 0) + 1
+        histogram = self.statement_latency.get(engine_name)
+        if histogram is None:
+            histogram = self.statement_latency[engine_name] = Histogram()
+        histogram.observe(seconds)
+
+    def write(self, writer: PrometheusWriter) -> None:
+        writer.family("http_requests_total", "counter", "HTTP requests by route and status")
+        for (method, route, status), count in sorted(self.requests.items()):
+            writer.sample("http_requests_total", count, {"method": method, "route": route, "status": str(status)})
+        writer.family("http_request_duration_seconds", "histogram", "HTTP request latency by route")
+        for (method, route), histogram in sorted(self.request_latency.items()):
+            writer.histogram("http_request_duration_seconds", histogram, {"method": method, "route": route})
+
+        writer.family("db_statements_total", "counter", "SQL statements executed")
+        for engine_name, count in sorted(self.statements.items()):
+            writer.sample("db_statements_total", count, {"engine": engine_name})
+        writer.family("db_statement_duration_seconds", "histogram", "SQL statement execution time")
+        for engine_name, histogram in sorted(self.statement_latency.items()):
+            writer.histogram("db_statement_duration_seconds", histogram, {"engine": engine_name})
+        writer.family("db_slow_statements_total", "counter", f"SQL statements slower than {OBS_SLOW_QUERY_MS} ms")
+        writer.sample("db_slow_statements_total", self.slow_query_count)
+
+        writer.family("template_render_duration_seconds", "histogram", "Jinja template rendering time")
+        writer.histogram("template_render_duration_seconds", self.phase_latency["render"])
+        writer.family("response_serialize_duration_seconds", "histogram", "response_model validation and serialization time")
+        writer.histogram("response_serialize_duration_seconds", self.phase_latency["serialize"])
+
+
+def process_start_time() -> Optional[float]:
+    """
+    time.time() at which this process started (Linux), None when unknown
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the command name, which may itself contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    started_after_boot = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    return time.time() - (uptime - started_after_boot)
+
+
+class StartupTimings:
+    """
+    Cold start of this worker: when each milestone was reached, in seconds
+    since the process started (since this module was imported where the
+    process start time is unknown). Milestones, in order: "import" (main.py
+    and everything it sets up loaded), "db_connect" (first connection and
+    schema version check done), "ready" (startup hooks finished, serving)
+    and "first_request" (first response sent).
+    """
+
+    MILESTONES = ("import", "db_connect", "ready", "first_request")
+
+    def __init__(self):
+        self.started = process_start_time() or time.time()
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, milestone: str) -> None:
+        # Only the first time counts; called on every request for "first_request"
+        if milestone not in self.marks:
+            self.marks[milestone] = time.time() - self.started
+
+    def phases(self) -> Dict[str, float]:
+        """
+        Time spent between consecutive milestones
+        """
+        phases, previous = {}, 0.0
+        for milestone in self.MILESTONES:
+            if milestone in self.marks:
+                phases[milestone] = round(self.marks[milestone] - previous, 4)
+                previous = self.marks[milestone]
+        return phases
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases().items())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "since_process_start": {name: round(seconds, 4) for name, seconds in self.marks.items()},
+            "phases": self.phases(),
+        }
+
+    def write(self, writer: PrometheusWriter) -> None:
+        writer.family("app_startup_seconds", "gauge", "Seconds from process start to each startup milestone")
+        for milestone, seconds in self.marks.items():
+            writer.sample("app_startup_seconds", seconds, {"milestone": milestone})
+
+
+registry = Registry()
+startup_timings = StartupTimings()
+
+
+def start_request() -> RequestTimings:
+    timings = RequestTimings(sampled=OBS_TRACE_SAMPLE_RATE > 0 and random.random() < OBS_TRACE_SAMPLE_RATE)
+    _current.set(timings)
+    return timings
+
+
+def route_name(request) -> str:
+    """
+    Route template (/posts/{post_id}) rather than the raw path, so labels stay bounded
+    """
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    # Mounted apps (static files, Socket.IO polling) are reported under their mount path
+    return request.scope.get("root_path") or "<unmatched>"
+
+
+def finish_request(request, timings: RequestTimings, status: int) -> float:
+    total = time.perf_counter() - timings.started
+    route = route_name(request)
+    registry.observe_request(request.method, route, status, total)
+    if timings.sampled:
+        print(
+            f"Trace {request.method} {route} {status}: {total * 1000:.1f} ms, "
+            f"{timings.statements} queries ({timings.durations['db'] * 1000:.1f} ms), "
+            f"render {timings.durations['render'] * 1000:.1f} ms, serialize {timings.durations['serialize'] * 1000:.1f} ms"
+        )
+        for seconds, statement in timings.trace:
+            print(f"  {seconds * 1000:8.1f} ms  {statement}")
+    return total
+
+
+@contextmanager
+def timed(phase: str):
+    """
+    Attribute the time spent in the block to `phase` of the current request
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.phase_latency[phase].observe(elapsed)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(phase, elapsed)
+
+
+def record_pool_wait(seconds: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add("pool", seconds)
+
+
+def application_stack() -> List[str]:
+    """
+    Frames of this project that led to the current statement. SQLAlchemy runs
+    the driver in a child greenlet, so the awaiting code is on the parent's stack.
+    """
+    current = greenlet.getcurrent()
+    frame = current.parent.gr_frame if current.parent is not None else None
+    stack = traceback.extract_stack(frame)
+    return [
+        f"{os.path.relpath(entry.filename, ROOT)}:{entry.lineno} in {entry.name}"
+        for entry in stack
+        if entry.filename.startswith(ROOT) and "site-packages" not in entry.filename
+    ]
+
+
+def instrument_engine(db_engine, name: str = "primary") -> None:
+    """
+    Count and time every statement executed through `db_engine`
+    """
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        registry.observe_statement(name, elapsed)
+        timings = _current.get()
+        if timings is not None:
+            timings.statements += 1
+            timings.add("db", elapsed)
+            if timings.sampled:
+                timings.trace.append((elapsed, " ".join(statement.split())[:200]))
+        if OBS_SLOW_QUERY_MS and elapsed * 1000 >= OBS_SLOW_QUERY_MS:
+            slow = {
+                "engine": name,
+                "duration_ms": round(elapsed * 1000, 1),
+                "statement": statement[:2000],
+                "stack": application_stack(),
+                "at": time.time(),
+            }
+            registry.slow_query_count += 1
+            registry.slow_queries.append(slow)
+            print(f"Slow query ({slow['duration_ms']} ms on {name}): {' '.join(statement.split())[:200]}")
+            for line in slow["stack"]:
+                print(f"  {line}")
+
+    def handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    event.listen(db_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(db_engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(db_engine.sync_engine, "handle_error", handle_error)
+
+
+class TimedJinja2Templates(Jinja2Templates):
+    """
+    Jinja2Templates that attributes TemplateResponse rendering to "render"
+    """
+
+    def TemplateResponse(self, *args, **kwargs):
+        with timed("render"):
+            return super().TemplateResponse(*args, **kwargs)
+
+
+def instrument_serialization() -> None:
+    """
+    Time FastAPI's response_model validation/serialization. FastAPI has no hook
+    for it, so wrap the module-level function its request handler calls.
+    """
+    original = fastapi.routing.serialize_response
+    if getattr(original, "_timed", False):
+        return
+
+    async def serialize_response(*args, **kwargs):
+        with timed("serialize"):
+            return await original(*args, **kwargs)
+
+    serialize_response._timed = True
+    fastapi.routing.serialize_response = serialize_response
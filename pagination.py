@@ -0,0 +1,159 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import DateTime, func, literal, tuple_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from database import SessionLocal
+
+# Rows fetched per round-trip when streaming exports
+STREAM_BATCH_SIZE = 500
+
+
+def encode_position(values: list) -> str:
+    """
+    Pack a list of JSON-serializable sort key values into an opaque cursor
+    """
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_position(cursor: str) -> list:
+    """
+    Unpack a cursor created by encode_position, raising 400 on garbage input
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list):
+            raise ValueError("cursor is not a list")
+        return values
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """
+    Build an opaque cursor pointing at a (created_at, id) position
+    """
+    return encode_position([created_at.isoformat(), row_id])
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor created by encode_cursor, raising 400 on garbage input
+    """
+    try:
+        created_at, row_id = decode_position(cursor)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+class keyset_time(FunctionElement):
+    """
+    A timestamp as the keyset compares and sorts it. The column itself
+    everywhere but SQLite, which stores timestamps as text in two formats
+    (CURRENT_TIMESTAMP without fractional seconds, SQLAlchemy with six
+    digits) that don't compare as the times they stand for; there both sides
+    are rewritten to one format.
+    """
+    type = DateTime(timezone=True)
+    name = "keyset_time"
+    inherit_cache = True
+
+
+@compiles(keyset_time)
+def _keyset_time(element, compiler, **kw):
+    return compiler.process(element.clauses, **kw)
+
+
+@compiles(keyset_time, "sqlite")
+def _keyset_time_sqlite(element, compiler, **kw):
+    return compiler.process(func.strftime("%Y-%m-%d %H:%M:%f", *element.clauses), **kw)
+
+
+def keyset_order(query, model):
+    """
+    Order a query newest first on (created_at, id), the keyset used by every cursor
+    """
+    return query.order_by(keyset_time(model.created_at).desc(), model.id.desc())
+
+
+def keyset_paginate(query, model, cursor: Optional[str], limit: int):
+    """
+    Apply keyset ordering, the cursor position and the page size to a query.
+    One extra row is fetched so the caller can tell whether a next page exists.
+    """
+    query = keyset_order(query, model)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        position = tuple_(keyset_time(literal(created_at, model.created_at.type)), literal(row_id, model.id.type))
+        query = query.filter(tuple_(keyset_time(model.created_at), model.id) < position)
+    return query.limit(limit + 1)
+
+
+def next_cursor(rows, limit: int, key: Callable[[Any], Any] = lambda row: row) -> Optional[str]:
+    """
+    Trim the look-ahead row from `rows` in place and return the cursor of the next page
+    """
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last = key(rows[-1])
+    return encode_cursor(last.created_at, last.id)
+
+
+async def stream_scalars(query, serialize: Callable[[Any], str], session_factory=SessionLocal) -> AsyncIterator[Any]:
+    """
+    Stream ORM objects from `query` in batches with their own session, so the
+    export outlives the request-scoped session and memory stays flat
+    """
+    async with session_factory() as db:
+        result = await db.stream_scalars(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for obj in result:
+            yield serialize(obj)
+
+
+async def stream_rows(query, serialize: Callable[[Any], str], session_factory=SessionLocal) -> AsyncIterator[Any]:
+    """
+    Same as stream_scalars but yields full result rows (for joined selects)
+    """
+    async with session_factory() as db:
+        result = await db.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for row in result:
+            yield serialize(row)
+
+
+async def ndjson_lines(items: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Frame serialized items as newline-delimited JSON
+    """
+    async for item in items:
+        yield item + "\n"
+
+
+async def json_array(items: AsyncIterator[str], prefix: str = "[", suffix: str = "]") -> AsyncIterator[str]:
+    """
+    Frame serialized items as a JSON array without holding the whole list in memory.
+    `prefix`/`suffix` allow wrapping the array in an object, e.g. '{"posts": [' and ']}'.
+    """
+    yield prefix
+    first = True
+    async for item in items:
+        if first:
+            first = False
+            yield item
+        else:
+            yield "," + item
+    yield suffix
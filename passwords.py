@@ -0,0 +1,249 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException, status
+
+from metrics import Histogram
+
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHashError, VerificationError
+except ImportError:  # optional: falls back to scrypt from the standard library
+    PasswordHasher = None
+
+# Threads hashing at once; argon2 and scrypt release the GIL, so threads run
+# in parallel without the cost of a process pool. 0 hashes on the event loop
+# (only useful to compare against in benchmarks/bench_password_hashing.py).
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Callers allowed to wait for a worker; beyond that requests fail fast with 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+# Longest wait for a worker before giving up with 503
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "5"))
+
+# Cost parameters (OWASP minimums by default). Changing them makes verify()
+# report old hashes as needing a rehash.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "19456"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+SCRYPT_LOG_N = int(os.getenv("SCRYPT_LOG_N", "15"))
+SCRYPT_R = int(os.getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SCRYPT_P", "1"))
+
+SCRYPT_PREFIX = "$scrypt$"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+def _scrypt(password: str, salt: bytes, log_n: int, r: int, p: int) -> bytes:
+    n = 1 << log_n
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+
+
+def _scrypt_hash(password: str) -> str:
+    """
+    PHC-style string: $scrypt$ln=15,r=8,p=1$<salt>$<hash>
+    """
+    salt = secrets.token_bytes(16)
+    digest = _scrypt(password, salt, SCRYPT_LOG_N, SCRYPT_R, SCRYPT_P)
+    return f"{SCRYPT_PREFIX}ln={SCRYPT_LOG_N},r={SCRYPT_R},p={SCRYPT_P}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def _scrypt_params(stored: str) -> Dict[str, int]:
+    params = stored[len(SCRYPT_PREFIX):].split("$", 1)[0]
+    return {key: int(value) for key, value in (item.split("=") for item in params.split(","))}
+
+
+def _scrypt_verify(stored: str, password: str) -> bool:
+    try:
+        params = _scrypt_params(stored)
+        salt, digest = stored.rsplit("$", 2)[1:]
+        expected = _b64decode(digest)
+        actual = _scrypt(password, _b64decode(salt), params["ln"], params["r"], params["p"])
+    except (KeyError, ValueError):
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+_argon2 = (
+    PasswordHasher(time_cost=ARGON2_TIME_COST, memory_cost=ARGON2_MEMORY_COST, parallelism=ARGON2_PARALLELISM)
+    if PasswordHasher is not None else None
+)
+
+
+def hash_password_sync(password: str) -> str:
+    if _argon2 is not None:
+        return _argon2.hash(password)
+    return _scrypt_hash(password)
+
+
+def verify_password_sync(stored: str, password: str) -> bool:
+    if stored.startswith("$argon2"):
+        if _argon2 is None:
+            raise RuntimeError("argon2 hash found but argon2-cffi is not installed")
+        try:
+            return _argon2.verify(stored, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    if stored.startswith(SCRYPT_PREFIX):
+        return _scrypt_verify(stored, password)
+    # Rows written before passwords were hashed hold the plain password
+    return hmac.compare_digest(stored.encode(), password.encode())
+
+
+_dummy_hash: Optional[str] = None
+
+
+def verify_missing_sync(password: str) -> bool:
+    """
+    Verify against a throwaway hash, so an unknown user costs as much as a wrong password
+    """
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password_sync(secrets.token_hex(16))
+    verify_password_sync(_dummy_hash, password)
+    return False
+
+
+def needs_rehash(stored: str) -> bool:
+    """
+    True for plain passwords and hashes made with another algorithm or cost
+    """
+    if _argon2 is not None:
+        return not stored.startswith("$argon2") or _argon2.check_needs_rehash(stored)
+    if not stored.startswith(SCRYPT_PREFIX):
+        return True
+    try:
+        return _scrypt_params(stored) != {"ln": SCRYPT_LOG_N, "r": SCRYPT_R, "p": SCRYPT_P}
+    except ValueError:
+        return True
+
+
+class PasswordService:
+    """
+    Password hashing off the event loop. Work runs on a dedicated thread
+    pool (not the default one shared with file and sync-endpoint work);
+    at most `workers` jobs are handed to it, further callers wait in a
+    bounded queue and are rejected with 503 once it is full, so a signup
+    burst can't pile up unbounded work.
+    """
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+        queue_timeout: float = PASSWORD_HASH_QUEUE_TIMEOUT
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="password-hash") if workers else None
+        self.slots = asyncio.Semaphore(max(workers, 1))
+        self.algorithm = "argon2id" if _argon2 is not None else "scrypt"
+        self.pending = 0
+        self.in_flight = 0
+        self.hashed = 0
+        self.verified = 0
+        self.rejected = 0
+        self.queue_wait = Histogram()
+        self.duration = Histogram()
+
+    def _busy(self) -> HTTPException:
+        self.rejected += 1
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password operations in progress, retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+    async def _run(self, func: Callable, *args, reject: bool = True) -> Any:
+        queued = time.perf_counter()
+        if not self.slots.locked():
+            await self.slots.acquire()
+        else:
+            if reject and self.pending >= self.max_pending:
+                raise self._busy()
+            self.pending += 1
+            try:
+                await asyncio.wait_for(self.slots.acquire(), self.queue_timeout if reject else None)
+            except asyncio.TimeoutError:
+                raise self._busy()
+            finally:
+                self.pending -= 1
+
+        started = time.perf_counter()
+        self.queue_wait.observe(started - queued)
+        self.in_flight += 1
+        try:
+            if self.executor is None:
+                return func(*args)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+            self.duration.observe(time.perf_counter() - started)
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(hash_password_sync, password)
+        self.hashed += 1
+        return hashed
+
+    async def hash_many(self, passwords: Iterable[str]) -> List[str]:
+        """
+        Hash a batch (bulk import) `workers` at a time. The batch waits for
+        free workers instead of being rejected, and never queues more than
+        `workers` jobs at once, so interactive signups still get their turn.
+        """
+        passwords = list(passwords)
+        hashed = []
+        step = max(self.workers, 1)
+        for start in range(0, len(passwords), step):
+            chunk = passwords[start:start + step]
+            hashed.extend(await asyncio.gather(*(self._run(hash_password_sync, p, reject=False) for p in chunk)))
+        self.hashed += len(hashed)
+        return hashed
+
+    async def verify(self, stored: Optional[str], password: str) -> bool:
+        """
+        Check a password against a stored hash; `stored` None (unknown user) is
+        never valid but takes as long as a real check
+        """
+        if stored:
+            valid = await self._run(verify_password_sync, stored, password)
+        else:
+            valid = await self._run(verify_missing_sync, password)
+        self.verified += 1
+        return valid
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "algorithm": self.algorithm,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "in_flight": self.in_flight,
+            "hashed": self.hashed,
+            "verified": self.verified,
+            "rejected": self.rejected,
+            "queue_wait": self.queue_wait.snapshot(),
+            "duration": self.duration.snapshot(),
+        }
+
+
+passwords = PasswordService()
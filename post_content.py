@@ -0,0 +1,209 @@
+"""
+Post bodies and the fields derived from them.
+
+The body of a post lives in post_bodies, out of line from the posts row;
+posts carries an excerpt, word count and content hash computed from the
+body on every write. List, search and export-without-content paths read
+only posts, so a list query no longer drags every body along, and the body
+is loaded (joinedload(models.Post.body)) only where a single post is shown
+or edited. Bodies of at least POST_BODY_COMPRESS_MIN_BYTES are stored
+zlib-compressed when POST_BODY_COMPRESSION=zlib.
+"""
+import hashlib
+import os
+import re
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import bindparam, delete, insert, update
+from sqlalchemy.future import select
+from sqlalchemy.orm.attributes import set_committed_value
+
+from database import engine
+from search import search_vector_value
+import models
+
+# Characters of the excerpt (cut at a word boundary, "…" appended when shortened)
+POST_EXCERPT_LENGTH = int(os.getenv("POST_EXCERPT_LENGTH", "200"))
+# "zlib" compresses large bodies in the application; "none" stores them as text
+# (Postgres still compresses large values itself, but not on the wire)
+POST_BODY_COMPRESSION = os.getenv("POST_BODY_COMPRESSION", "none").lower()
+POST_BODY_COMPRESS_MIN_BYTES = int(os.getenv("POST_BODY_COMPRESS_MIN_BYTES", "1024"))
+POST_BODY_ZLIB_LEVEL = int(os.getenv("POST_BODY_ZLIB_LEVEL", "6"))
+
+if POST_BODY_COMPRESSION not in ("none", "zlib"):
+    raise ValueError(f"Invalid POST_BODY_COMPRESSION: {POST_BODY_COMPRESSION}")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def make_excerpt(content: str, length: int = POST_EXCERPT_LENGTH) -> str:
+    text = _WHITESPACE_RE.sub(" ", content).strip()
+    if len(text) <= length:
+        return text
+    cut = text[:length]
+    space = cut.rfind(" ")
+    if space > length // 2:
+        cut = cut[:space]
+    return cut.rstrip(" ,.;:") + "…"
+
+
+def content_hash(content: str) -> str:
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def derived_fields(content: str) -> Dict[str, Any]:
+    """
+    The posts columns computed from a body
+    """
+    return {
+        "excerpt": make_excerpt(content),
+        "word_count": len(content.split()),
+        "content_hash": content_hash(content),
+    }
+
+
+def encode_body(content: str) -> Dict[str, Any]:
+    """
+    post_bodies values (content or compressed) for a body
+    """
+    data = content.encode()
+    if POST_BODY_COMPRESSION == "zlib" and len(data) >= POST_BODY_COMPRESS_MIN_BYTES:
+        return {"content": None, "compressed": zlib.compress(data, POST_BODY_ZLIB_LEVEL)}
+    return {"content": content, "compressed": None}
+
+
+def decode_body(content: Optional[str], compressed: Optional[bytes]) -> Optional[str]:
+    if compressed is not None:
+        return zlib.decompress(compressed).decode()
+    return content
+
+
+def post_values(title: Optional[str], content: Optional[str]) -> Dict[str, Any]:
+    """
+    posts columns to write alongside a new title and/or body: the derived
+    fields and, on Postgres, the search vector
+    """
+    values = derived_fields(content) if content is not None else {}
+    vector = search_vector_value(title, content)
+    if vector is not None:
+        values["search_vector"] = vector
+    return values
+
+
+def attach_body(post: models.Post, content: str) -> models.Post:
+    """
+    Make `post.content` answer from a body the caller already has, without a query
+    """
+    set_committed_value(post, "body", models.PostBody(post_id=post.id, content=content))
+    return post
+
+
+async def load_body(db, post: models.Post) -> models.Post:
+    """
+    Load the body of a post fetched without it (e.g. from UPDATE ... RETURNING)
+    """
+    bodies = await load_bodies(db, [post.id])
+    return attach_body(post, bodies.get(post.id, ""))
+
+
+async def insert_body(db, post_id: int, content: str) -> None:
+    await db.execute(insert(models.PostBody).values(post_id=post_id, **encode_body(content)))
+
+
+async def update_body(db, post_id: int, content: str) -> None:
+    await db.execute(
+        update(models.PostBody).where(models.PostBody.post_id == post_id).values(**encode_body(content))
+    )
+
+
+async def delete_bodies(db, post_ids: Sequence[int]) -> None:
+    """
+    Postgres removes bodies through ON DELETE CASCADE; SQLite doesn't enforce
+    foreign keys here, so they are deleted explicitly
+    """
+    if engine.dialect.name != "postgresql" and post_ids:
+        await db.execute(delete(models.PostBody).where(models.PostBody.post_id.in_(post_ids)))
+
+
+async def insert_posts(db, rows: Iterable[Dict[str, Any]]) -> List[Any]:
+    """
+    Insert posts given as dicts with title, content, published, author_id
+    (and optionally created_at): one executemany INSERT for the posts and one
+    for their bodies. Returns (id, created_at) rows in input order.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    table = models.Post.__table__
+    stmt = insert(table)
+    # Bound separately from the title/content values, which it is computed from
+    vector = search_vector_value(bindparam("vector_title"), bindparam("vector_content"))
+    if vector is not None:
+        stmt = stmt.values(search_vector=vector)
+    params = []
+    for row in rows:
+        values = {key: value for key, value in row.items() if key != "content"}
+        values.update(derived_fields(row["content"]))
+        if vector is not None:
+            values["vector_title"], values["vector_content"] = row["title"], row["content"]
+        params.append(values)
+    result = await db.execute(
+        stmt.returning(table.c.id, table.c.created_at, sort_by_parameter_order=True), params
+    )
+    inserted = result.all()
+    await db.execute(
+        insert(models.PostBody.__table__),
+        [{"post_id": post_id, **encode_body(row["content"])} for row, (post_id, _) in zip(rows, inserted)]
+    )
+    return inserted
+
+
+async def load_bodies(db, post_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Bodies of several posts in one query, by post id
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {}
+    result = await db.execute(
+        select(models.PostBody.post_id, models.PostBody.content, models.PostBody.compressed)
+        .where(models.PostBody.post_id.in_(post_ids))
+    )
+    return {row.post_id: decode_body(row.content, row.compressed) for row in result.all()}
+
+
+def column_fields(fields: Sequence[str]) -> List[str]:
+    """
+    The requested post fields that are posts columns (all but the body)
+    """
+    return [name for name in fields if name != "content"]
+
+
+async def post_dicts(db, rows: Sequence[Any], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    """
+    Rows selected with column_fields(fields) as plain dicts; a requested
+    `content` is filled from post_bodies in one extra query for the page
+    """
+    bodies = await load_bodies(db, [row.id for row in rows]) if "content" in fields else {}
+    return [
+        {name: bodies.get(row.id) if name == "content" else getattr(row, name) for name in fields}
+        for row in rows
+    ]
+
+
+def body_columns() -> List[Any]:
+    """
+    post_bodies columns for a select outer-joined on the post (see row_dict)
+    """
+    return [models.PostBody.content.label("body_content"), models.PostBody.compressed.label("body_compressed")]
+
+
+def row_dict(row: Any, fields: Sequence[str]) -> Dict[str, Any]:
+    """
+    A row selected with body_columns() as a plain dict holding `fields`
+    """
+    return {
+        name: decode_body(row.body_content, row.body_compressed) if name == "content" else getattr(row, name)
+        for name in fields
+    }
@@ -0,0 +1,156 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+# Batas koneksi per worker; koneksi baru ditolak setelah batas ini
+SOCKETIO_MAX_CONNECTIONS = int(os.getenv("SOCKETIO_MAX_CONNECTIONS", "10000"))
+# Batas room post per koneksi, supaya satu klien tidak bisa membesarkan indeks
+SOCKETIO_MAX_ROOMS_PER_CONNECTION = int(os.getenv("SOCKETIO_MAX_ROOMS_PER_CONNECTION", "50"))
+# Koneksi tanpa event dari atau ke klien selama ini diputus (0 = tidak pernah);
+# penonton pasif yang menerima broadcast tetap terhubung
+SOCKETIO_IDLE_SECONDS = float(os.getenv("SOCKETIO_IDLE_SECONDS", "1800"))
+
+
+class Connection:
+    """Satu koneksi socket; __slots__ supaya ribuan entri tetap kecil"""
+
+    __slots__ = ("sid", "user_id", "rooms", "connected_at", "last_seen")
+
+    def __init__(self, sid: str, now: float):
+        self.sid = sid
+        self.user_id: Optional[str] = None
+        # Dibuat saat room pertama di-join; kebanyakan koneksi tidak punya room
+        self.rooms: Optional[Set[str]] = None
+        self.connected_at = now
+        self.last_seen = now
+
+
+class PresenceRegistry:
+    """Koneksi di worker ini dengan indeks user -> sid dan room -> sid
+
+    `connections` diurutkan menurut last_seen (terlama di depan), sehingga
+    touch() cukup memindahkan entri ke belakang dan pencarian koneksi idle
+    berhenti di entri pertama yang masih aktif. Semua operasi O(1), kecuali
+    idle_sids() yang sebanding dengan jumlah koneksi idle.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = SOCKETIO_MAX_CONNECTIONS,
+        max_rooms: int = SOCKETIO_MAX_ROOMS_PER_CONNECTION,
+        idle_seconds: float = SOCKETIO_IDLE_SECONDS
+    ):
+        self.max_connections = max_connections
+        self.max_rooms = max_rooms
+        self.idle_seconds = idle_seconds
+        self.connections: "OrderedDict[str, Connection]" = OrderedDict()
+        self.users: Dict[str, Set[str]] = {}
+        self.rooms: Dict[str, Set[str]] = {}
+        self.rejected = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def add(self, sid: str) -> bool:
+        """Daftarkan koneksi baru; False jika registry sudah penuh"""
+        if sid not in self.connections and len(self.connections) >= self.max_connections:
+            self.rejected += 1
+            return False
+        self.connections[sid] = Connection(sid, time.monotonic())
+        return True
+
+    def remove(self, sid: str) -> Optional[Connection]:
+        """Hapus koneksi beserta entrinya di semua indeks (aman dipanggil dua kali)"""
+        conn = self.connections.pop(sid, None)
+        if conn is None:
+            return None
+        if conn.user_id is not None:
+            self._discard(self.users, conn.user_id, sid)
+        for room in conn.rooms or ():
+            self._discard(self.rooms, room, sid)
+        return conn
+
+    def touch(self, sid: str) -> None:
+        conn = self.connections.get(sid)
+        if conn is not None:
+            conn.last_seen = time.monotonic()
+            self.connections.move_to_end(sid)
+
+    def touch_many(self, sids) -> None:
+        """touch() untuk semua penerima satu emit"""
+        now = time.monotonic()
+        for sid in sids:
+            conn = self.connections.get(sid)
+            if conn is not None:
+                conn.last_seen = now
+                self.connections.move_to_end(sid)
+
+    def set_user(self, sid: str, user_id) -> bool:
+        conn = self.connections.get(sid)
+        if conn is None:
+            return False
+        if conn.user_id is not None:
+            self._discard(self.users, conn.user_id, sid)
+        conn.user_id = str(user_id)
+        self.users.setdefault(conn.user_id, set()).add(sid)
+        return True
+
+    def join(self, sid: str, room: str) -> bool:
+        """Catat sid di room; False jika koneksi tidak ada atau batas room tercapai"""
+        conn = self.connections.get(sid)
+        if conn is None:
+            return False
+        if conn.rooms is None:
+            conn.rooms = set()
+        if room not in conn.rooms:
+            if len(conn.rooms) >= self.max_rooms:
+                return False
+            conn.rooms.add(room)
+            self.rooms.setdefault(room, set()).add(sid)
+        return True
+
+    def leave(self, sid: str, room: str) -> None:
+        conn = self.connections.get(sid)
+        if conn is not None and conn.rooms and room in conn.rooms:
+            conn.rooms.discard(room)
+            self._discard(self.rooms, room, sid)
+
+    def sids_for_user(self, user_id) -> List[str]:
+        return list(self.users.get(str(user_id), ()))
+
+    def room_count(self, room: str) -> int:
+        return len(self.rooms.get(room, ()))
+
+    def idle_sids(self, now: Optional[float] = None) -> List[str]:
+        """Sid tanpa event dari atau ke klien selama idle_seconds, terlama dulu"""
+        if not self.idle_seconds:
+            return []
+        cutoff = (now if now is not None else time.monotonic()) - self.idle_seconds
+        idle = []
+        for sid, conn in self.connections.items():
+            if conn.last_seen > cutoff:
+                break
+            idle.append(sid)
+        return idle
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], key: str, sid: str) -> None:
+        sids = index.get(key)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                # Kunci kosong dihapus supaya indeks tidak tumbuh tanpa batas
+                del index[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.connections),
+            "users": len(self.users),
+            "rooms": len(self.rooms),
+            "max_connections": self.max_connections,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "idle_seconds": self.idle_seconds,
+        }
@@ -1,11 +1,36 @@
 import argparse
+import asyncio
 import uvicorn
 import os
+import secrets
 from dotenv import load_dotenv
 
 # Memuat variabel lingkungan dari file .env
 load_dotenv()
 
+# Setelah load_dotenv, karena modul-modul ini membaca environment saat diimpor
+from presence_registry import SOCKETIO_MAX_CONNECTIONS
+from serving import available_cpus, default_workers, serve, server_config
+
+# Negosiasi permessage-deflate untuk WebSocket (Socket.IO): pesan dikompres
+# per frame jika browser mendukung. Matikan jika CPU lebih mahal dari bandwidth
+SOCKETIO_WS_DEFLATE = os.getenv("SOCKETIO_WS_DEFLATE", "true").lower() == "true"
+
+def migrate_database():
+    """Terapkan migrasi yang belum dijalankan (lihat migrate.py)"""
+    from database import engine
+    from migrate import migrate
+
+    async def run():
+        try:
+            applied = await migrate()
+        finally:
+            # Koneksi proses ini tidak boleh terbawa ke worker
+            await engine.dispose()
+        print(f"Migrasi database: {len(applied)} diterapkan")
+
+    asyncio.run(run())
+
 def run_app():
     """
     Menjalankan aplikasi FastAPI dengan Uvicorn berdasarkan argumen command line.
@@ -14,6 +39,10 @@ def run_app():
         python run.py --port 8001      - Ganti port
         python run.py --host 0.0.0.0   - Buat dapat diakses dari jaringan
         python run.py --reload         - Mode development dengan auto-reload
+        python run.py --no-migrate     - Lewati migrasi (sudah dijalankan terpisah)
+        python run.py --prod           - Mode produksi (lihat serving.py);
+                                         `kill -HUP <pid>` untuk rolling restart
+        python run.py --prod --workers 8
     """
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Jalankan FastAPI CRUD Demo')
@@ -26,7 +55,11 @@ def run_app():
     parser.add_argument('--reload', action='store_true',
                         help='Aktifkan auto-reload saat file berubah')
     parser.add_argument('--prod', action='store_true',
-                        help='Jalankan dalam mode produksi (workers=4, tanpa reload)')
+                        help='Jalankan dalam mode produksi (worker sesuai core, daur ulang worker, SIGHUP rolling restart)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Jumlah worker mode produksi (default: SERVER_WORKERS atau jumlah core)')
+    parser.add_argument('--no-migrate', action='store_true',
+                        help='Jangan jalankan migrasi database sebelum start (python migrate.py)')
     
     # Parse argumen
     args = parser.parse_args()
@@ -35,7 +68,21 @@ def run_app():
     log_level = "info"
     
     # Set workers
-    workers = 4 if args.prod else 1
+    workers = (args.workers or default_workers()) if args.prod else 1
+    
+    # Dengan banyak worker, broadcast Socket.IO harus lewat pub/sub bersama
+    # (Postgres LISTEN/NOTIFY) supaya sampai ke klien di worker lain
+    if workers > 1:
+        os.environ.setdefault("SOCKETIO_MANAGER", "postgres")
+    
+    # Token socket dari /auth/socket-token harus diterima semua worker, juga
+    # worker pengganti (daur ulang, SIGHUP, --reload) yang mewarisi environment
+    # proses ini. Tanpa SOCKETIO_AUTH_SECRET, rahasia dibuat sekali di sini;
+    # token lama baru tidak berlaku setelah run.py sendiri di-restart
+    if not os.getenv("SOCKETIO_AUTH_SECRET"):
+        os.environ["SOCKETIO_AUTH_SECRET"] = secrets.token_hex(32)
+        if workers > 1:
+            print("SOCKETIO_AUTH_SECRET tidak diset: memakai rahasia acak bersama untuk semua worker")
     
     # Cek DB connection
     database_url = os.getenv("DATABASE_URL", "")
@@ -43,20 +90,42 @@ def run_app():
         print("PERINGATAN: DATABASE_URL tidak ditemukan di .env")
         print("Pastikan file .env ada dan berisi DATABASE_URL yang valid")
     
+    # Migrasi dijalankan sekali di sini, sebelum worker dibuat; worker
+    # cukup mengecek versi skema saat startup
+    if database_url and not args.no_migrate:
+        migrate_database()
+    
     # Tampilkan informasi startup
     print(f"Menjalankan FastAPI CRUD Demo di http://{args.host}:{args.port}")
     print(f"Mode: {'Production' if args.prod else 'Development'}")
     if args.reload:
         print("Auto-reload diaktifkan")
     
+    if args.prod:
+        config = server_config(
+            "main:app", args.host, args.port, workers,
+            log_level=log_level, ws_per_message_deflate=SOCKETIO_WS_DEFLATE
+        )
+        print(f"Worker: {workers} (CPU tersedia: {available_cpus():g}), loop: {config.loop}, http: {config.http}")
+        if database_url:
+            from database import DB_MAX_OVERFLOW, DB_POOL_SIZE
+            print(f"Koneksi database maksimum: {workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)} "
+                  f"({workers} x (DB_POOL_SIZE + DB_MAX_OVERFLOW))")
+        if config.limit_concurrency and config.limit_concurrency <= SOCKETIO_MAX_CONNECTIONS:
+            print(f"PERINGATAN: SERVER_LIMIT_CONCURRENCY ({config.limit_concurrency}) tidak lebih besar dari "
+                  f"SOCKETIO_MAX_CONNECTIONS ({SOCKETIO_MAX_CONNECTIONS}); koneksi Socket.IO bisa membuat "
+                  "request HTTP dijawab 503")
+        serve(config)
+        return
+    
     # Konfigurasi Uvicorn dan jalankan
     uvicorn.run(
         "main:app",
         host=args.host,
         port=args.port,
-        reload=args.reload and not args.prod,
-        workers=workers,
-        log_level=log_level
+        reload=args.reload,
+        log_level=log_level,
+        ws_per_message_deflate=SOCKETIO_WS_DEFLATE
     )
 
 if __name__ == "__main__":
@@ -11,6 +11,10 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
 
+class SocketTokenRequest(BaseModel):
+    username: str
+    password: str
+
 class UserResponse(UserBase):
     id: int
     created_at: datetime
@@ -32,11 +36,32 @@ class PostUpdate(BaseModel):
     content: Optional[str] = None
     published: Optional[bool] = None
 
+class PostBulkCreate(PostBase):
+    author_id: int
+
 class PostResponse(PostBase):
     id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
     author_id: int
+    excerpt: str
+    word_count: int
+    content_hash: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+class PostSummary(BaseModel):
+    """A post without its body, as list and search endpoints return it"""
+    id: int
+    title: str
+    excerpt: str
+    word_count: int
+    content_hash: Optional[str] = None
+    published: bool = False
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    author_id: int
     
     class Config:
         from_attributes = True
\ No newline at end of file
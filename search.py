@@ -0,0 +1,135 @@
+import os
+import re
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import REAL, cast, exists, func, literal, literal_column, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import engine
+import models
+from pagination import decode_position, encode_position, keyset_paginate, next_cursor
+
+# Text search configuration used for the tsvector column ("simple" does no stemming,
+# which suits mixed-language content)
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "simple")
+if not re.fullmatch(r"\w+", SEARCH_LANGUAGE):
+    raise ValueError(f"Invalid SEARCH_LANGUAGE: {SEARCH_LANGUAGE}")
+
+search_vector = models.Post.search_vector
+_language = literal_column(f"'{SEARCH_LANGUAGE}'::regconfig")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _weighted(value: Any, weight: str):
+    return func.setweight(func.to_tsvector(_language, func.coalesce(value, "")), literal_column(f"'{weight}'"))
+
+
+def _kept(weight: str):
+    # The part of the stored vector with this weight (ts_filter keeps title or body lexemes)
+    return func.ts_filter(search_vector, literal_column(f"'{{{weight.lower()}}}'::\"char\"[]"))
+
+
+def search_vector_value(title: Any = None, content: Any = None) -> Optional[Any]:
+    """
+    New search_vector for a write that sets `title` and/or `content` (values
+    or SQL expressions): title weighted A, body B. The half that isn't being
+    written is kept from the stored vector, so the body (stored out of line,
+    possibly compressed) is never read back. None without full-text search.
+    """
+    if not fulltext_available() or (title is None and content is None):
+        return None
+    title_part = _weighted(title, "A") if title is not None else _kept("A")
+    content_part = _weighted(content, "B") if content is not None else _kept("B")
+    return title_part.op("||")(content_part)
+
+
+def build_tsquery(search: str) -> Optional[str]:
+    """
+    Turn free text into a prefix-matching tsquery: "fast api" -> "fast:* & api:*".
+    Only word characters are kept, so user input can't inject tsquery operators.
+    """
+    tokens = _TOKEN_RE.findall(search.lower())
+    if not tokens:
+        return None
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+def fulltext_available() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+async def search_posts(
+    db: AsyncSession,
+    search: str,
+    cursor: Optional[str],
+    limit: int,
+    columns: Optional[Sequence[Any]] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Ranked full-text search over post title and content.
+    Returns one page of posts and the cursor of the next page. With `columns`
+    only those are selected and Core rows are returned instead of Post objects.
+    """
+    if not fulltext_available():
+        return await _search_posts_fallback(db, search, cursor, limit, columns)
+
+    tsquery_text = build_tsquery(search)
+    if tsquery_text is None:
+        return [], None
+
+    tsquery = func.to_tsquery(_language, tsquery_text)
+    rank = func.ts_rank_cd(search_vector, tsquery)
+    entities = tuple(columns) if columns else (models.Post,)
+    query = (
+        select(*entities, rank.label("rank"))
+        .filter(search_vector.op("@@")(tsquery))
+        .order_by(rank.desc(), models.Post.id.desc())
+    )
+
+    if cursor:
+        try:
+            last_rank, last_id = decode_position(cursor)
+            position = tuple_(cast(float(last_rank), REAL), literal(int(last_id)))
+        except (ValueError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = query.filter(tuple_(rank, models.Post.id) < position)
+
+    result = await db.execute(query.limit(limit + 1))
+    rows = list(result.all())
+
+    posts = list(rows) if columns else [row[0] for row in rows]
+    cursor = None
+    if len(rows) > limit:
+        del rows[limit:], posts[limit:]
+        cursor = encode_position([rows[-1].rank, posts[-1].id])
+    return posts, cursor
+
+
+async def _search_posts_fallback(db, search, cursor, limit, columns=None):
+    """
+    Unranked substring match for databases without tsvector (e.g. SQLite in
+    development). Compressed bodies can't be matched in SQL; for those only
+    the title and excerpt are searched.
+    """
+    # % and _ in the search term match themselves, not any text
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = f"%{escaped}%"
+    body_matches = exists().where(
+        models.PostBody.post_id == models.Post.id, models.PostBody.content.ilike(pattern, escape="\\")
+    )
+    query = select(*(columns or (models.Post,))).filter(
+        or_(
+            models.Post.title.ilike(pattern, escape="\\"),
+            models.Post.excerpt.ilike(pattern, escape="\\"),
+            body_matches
+        )
+    )
+    result = await db.execute(keyset_paginate(query, models.Post, cursor, limit))
+    posts = list(result.all() if columns else result.scalars().all())
+    return posts, next_cursor(posts, limit)
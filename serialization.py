@@ -0,0 +1,86 @@
+import json
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+from schemas import PostResponse, PostSummary, UserResponse
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+# Response fields in schema order; list endpoints return exactly these keys
+POST_FIELDS: Tuple[str, ...] = tuple(PostResponse.model_fields)
+# What lists return unless `fields` asks for more: everything but the body
+POST_SUMMARY_FIELDS: Tuple[str, ...] = tuple(PostSummary.model_fields)
+USER_FIELDS: Tuple[str, ...] = tuple(UserResponse.model_fields)
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        # Same format as pydantic: UTC as "Z"
+        if value.tzinfo is not None and value.utcoffset() == timezone.utc.utcoffset(None):
+            return value.replace(tzinfo=None).isoformat() + "Z"
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Encode plain data (dicts, lists, datetimes) to JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response for data that is already plain dicts: no pydantic
+    validation, encoded with orjson when available
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def parse_fields(
+    fields: Optional[str], allowed: Sequence[str], default: Optional[Sequence[str]] = None
+) -> Tuple[str, ...]:
+    """
+    Sparse fieldset: "id,title" -> ("title", "id") in schema order; `default`
+    (all allowed fields unless given) when empty
+    """
+    if not fields:
+        return tuple(default if default is not None else allowed)
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}"
+        )
+    return tuple(name for name in allowed if name in requested)
+
+
+def projection(model, fields: Sequence[str], required: Sequence[str] = ("id", "created_at")) -> List[Any]:
+    """
+    Columns to select for `fields`, plus the ones pagination and ETags need
+    """
+    return [getattr(model, name) for name in dict.fromkeys((*fields, *required))]
+
+
+def to_dict(row: Any, fields: Sequence[str]) -> Dict[str, Any]:
+    """
+    A Core row or ORM object as a plain dict holding only `fields`
+    """
+    return {name: getattr(row, name) for name in fields}
+
+
+def to_dicts(rows: Iterable[Any], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    return [to_dict(row, fields) for row in rows]
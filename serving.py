@@ -0,0 +1,234 @@
+"""
+Mode produksi untuk run.py: supervisor worker uvicorn.
+
+Turunan Multiprocess milik uvicorn (socket dibuka sekali di proses induk
+lalu dibagi ke semua worker) dengan tambahan:
+- jumlah worker dari core yang benar-benar tersedia (affinity dan kuota
+  cgroup v1/v2), satu worker per core karena tiap worker adalah event loop;
+- uvloop dan httptools jika terpasang (fallback asyncio dan h11);
+- daur ulang worker setelah SERVER_MAX_REQUESTS request ditambah jitter
+  acak per worker, supaya worker tidak restart bersamaan;
+- SIGHUP = rolling restart: worker baru dijalankan dan ditunggu siap
+  (lifespan startup selesai) sebelum worker lama dihentikan dengan
+  graceful shutdown, satu per satu, jadi selalu ada worker yang menerima
+  koneksi. Worker baru mengimpor ulang kode (spawn), jadi SIGHUP setelah
+  deploy memuat kode baru; migrasi diterapkan worker pertama yang start
+  (DB_AUTO_MIGRATE, lihat migrate.py) atau jalankan `python migrate.py` dulu.
+SIGTTIN/SIGTTOU menambah/mengurangi worker seperti di uvicorn.
+"""
+import functools
+import importlib.util
+import logging
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from uvicorn.config import Config
+from uvicorn.server import Server
+from uvicorn.supervisors.multiprocess import Multiprocess, Process
+
+# Jumlah worker; 0 = otomatis dari core yang tersedia (dibatasi SERVER_MAX_WORKERS)
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "0"))
+SERVER_MAX_WORKERS = int(os.getenv("SERVER_MAX_WORKERS", "16"))
+# "auto" memilih uvloop/httptools jika terpasang
+SERVER_LOOP = os.getenv("SERVER_LOOP", "auto")
+SERVER_HTTP = os.getenv("SERVER_HTTP", "auto")
+# Antrian koneksi di socket listen (listen backlog) selama semua worker sibuk
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))
+# Detik koneksi keep-alive yang idle dipertahankan; di belakang load balancer
+# buat lebih besar dari idle timeout load balancer
+SERVER_KEEPALIVE = int(os.getenv("SERVER_KEEPALIVE", "5"))
+# Koneksi + task per worker sebelum request baru dijawab 503 (0 = tanpa batas).
+# Koneksi WebSocket Socket.IO ikut dihitung, jadi harus di atas SOCKETIO_MAX_CONNECTIONS
+SERVER_LIMIT_CONCURRENCY = int(os.getenv("SERVER_LIMIT_CONCURRENCY", "0"))
+# Worker didaur ulang setelah sekian request (0 = tidak pernah), ditambah
+# jitter acak 0..SERVER_MAX_REQUESTS_JITTER yang berbeda per worker
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "10000"))
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", "1000"))
+# Batas waktu worker yang dihentikan menyelesaikan request dan koneksi terbuka
+SERVER_GRACEFUL_TIMEOUT = float(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+# Batas waktu menunggu worker baru siap saat rolling restart; jika lewat,
+# restart dibatalkan dan worker lama tetap jalan
+SERVER_RELOAD_TIMEOUT = float(os.getenv("SERVER_RELOAD_TIMEOUT", "60"))
+
+logger = logging.getLogger("uvicorn.error")
+
+_spawn = multiprocessing.get_context("spawn")
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """Kuota CPU container (cgroup v2, lalu v1); None jika tidak dibatasi"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus() -> float:
+    """Core yang boleh dipakai proses ini: affinity, dibatasi kuota cgroup"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS/Windows
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    return min(cpus, limit) if limit else cpus
+
+
+def default_workers() -> int:
+    if SERVER_WORKERS:
+        return SERVER_WORKERS
+    # Kuota pecahan (mis. 1.5 CPU) dibulatkan ke atas: worker lebih banyak dari
+    # kuota tidak menambah throughput, tapi menyisakan worker saat satu sibuk
+    return max(1, min(SERVER_MAX_WORKERS, math.ceil(available_cpus())))
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def resolve_loop() -> str:
+    if SERVER_LOOP != "auto":
+        return SERVER_LOOP
+    return "uvloop" if sys.platform != "win32" and _installed("uvloop") else "asyncio"
+
+
+def resolve_http() -> str:
+    if SERVER_HTTP != "auto":
+        return SERVER_HTTP
+    return "httptools" if _installed("httptools") else "h11"
+
+
+class WorkerServer(Server):
+    """Server yang memberi tahu supervisor saat sudah menerima koneksi"""
+
+    def __init__(self, config: Config, ready):
+        super().__init__(config)
+        self.ready = ready
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets)
+        if self.started and not self.should_exit:
+            self.ready.set()
+
+
+def serve_worker(config: Config, max_requests_jitter: int, ready, sockets=None) -> None:
+    """Target proses worker (dijalankan di proses anak)"""
+    if config.limit_max_requests and max_requests_jitter:
+        # Diundi di proses anak, jadi tiap worker (dan tiap generasinya) berbeda
+        config.limit_max_requests += random.randint(0, max_requests_jitter)
+    WorkerServer(config, ready).run(sockets=sockets)
+
+
+class Supervisor(Multiprocess):
+    """Multiprocess uvicorn dengan jitter daur ulang dan rolling restart"""
+
+    def __init__(
+        self,
+        config: Config,
+        sockets,
+        max_requests_jitter: int = SERVER_MAX_REQUESTS_JITTER,
+        reload_timeout: float = SERVER_RELOAD_TIMEOUT
+    ):
+        super().__init__(config, target=None, sockets=sockets)
+        self.max_requests_jitter = max_requests_jitter
+        self.reload_timeout = reload_timeout
+
+    def spawn(self) -> Process:
+        ready = _spawn.Event()
+        target = functools.partial(serve_worker, self.config, self.max_requests_jitter, ready)
+        process = Process(self.config, target, self.sockets)
+        process.ready = ready
+        process.start()
+        return process
+
+    def init_processes(self) -> None:
+        self.processes = [self.spawn() for _ in range(self.processes_num)]
+
+    def wait_ready(self, process: Process) -> bool:
+        deadline = time.monotonic() + self.reload_timeout
+        while not process.ready.wait(0.5):
+            if not process.process.is_alive() or time.monotonic() > deadline:
+                return False
+            # Worker lain tetap dijaga selama menunggu (mis. yang baru didaur ulang)
+            self.keep_subprocess_alive()
+        return True
+
+    def restart_all(self) -> None:
+        """Ganti worker satu per satu: yang baru siap dulu, baru yang lama dihentikan"""
+        for idx in range(len(self.processes)):
+            new = self.spawn()
+            if not self.wait_ready(new):
+                logger.error(f"Worker baru [{new.pid}] tidak siap dalam {self.reload_timeout:.0f} detik; "
+                             "rolling restart dibatalkan, worker lama tetap jalan")
+                new.terminate()
+                new.join()
+                return
+            # Dibaca ulang: slot ini bisa sudah diisi pengganti selama menunggu
+            old, self.processes[idx] = self.processes[idx], new
+            old.terminate()
+            old.join()
+        logger.info(f"Rolling restart selesai ({len(self.processes)} worker)")
+
+    def keep_subprocess_alive(self) -> None:
+        if self.should_exit.is_set():
+            return
+        for idx, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            process.kill()  # proses macet
+            process.join()
+            if self.should_exit.is_set():
+                return
+            if process.process.exitcode == 0:
+                # Keluar normal: batas SERVER_MAX_REQUESTS tercapai
+                logger.info(f"Worker [{process.pid}] didaur ulang")
+            else:
+                logger.info(f"Worker [{process.pid}] mati (exit code {process.process.exitcode})")
+            self.processes[idx] = self.spawn()
+
+    def handle_ttin(self) -> None:
+        logger.info("SIGTTIN: menambah satu worker")
+        self.processes_num += 1
+        self.processes.append(self.spawn())
+
+
+def server_config(app: str, host: str, port: int, workers: int, **options: Any) -> Config:
+    """Config uvicorn mode produksi; `options` menimpa nilai dari environment"""
+    settings: Dict[str, Any] = {
+        "loop": resolve_loop(),
+        "http": resolve_http(),
+        "backlog": SERVER_BACKLOG,
+        "timeout_keep_alive": SERVER_KEEPALIVE,
+        "limit_concurrency": SERVER_LIMIT_CONCURRENCY or None,
+        "limit_max_requests": SERVER_MAX_REQUESTS or None,
+        "timeout_graceful_shutdown": SERVER_GRACEFUL_TIMEOUT,
+    }
+    settings.update(options)
+    return Config(app, host=host, port=port, workers=workers, **settings)
+
+
+def serve(config: Config) -> None:
+    """Jalankan supervisor sampai SIGINT/SIGTERM"""
+    sock = config.bind_socket()
+    try:
+        Supervisor(config, [sock]).run()
+    finally:
+        sock.close()
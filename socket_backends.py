@@ -0,0 +1,410 @@
+import asyncio
+import json
+import os
+import pickle
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from sqlalchemy import delete, func, insert, text, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.future import select
+
+from database import DATABASE_URL, SessionLocal, engine
+import models
+
+# Backend Socket.IO: "memory" (satu proses, default), "local" (bus dalam proses,
+# untuk test multi-server) atau "postgres" (LISTEN/NOTIFY antar worker dan node)
+SOCKETIO_MANAGER = os.getenv("SOCKETIO_MANAGER", "memory")
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "socketio")
+POSTS_CHANGELOG_SIZE = int(os.getenv("POSTS_CHANGELOG_SIZE", "1000"))
+PRESENCE_HEARTBEAT_SECONDS = float(os.getenv("PRESENCE_HEARTBEAT_SECONDS", "30"))
+# Klien yang antrean kirim engine.io-nya melebihi batas ini dianggap lambat dan
+# dilewati untuk event yang boleh hilang (klien resync lewat versi daftar)
+SOCKETIO_SLOW_CLIENT_QUEUE = int(os.getenv("SOCKETIO_SLOW_CLIENT_QUEUE", "64"))
+SOCKETIO_DROPPABLE_EVENTS = frozenset(
+    event.strip()
+    for event in os.getenv("SOCKETIO_DROPPABLE_EVENTS", "posts_list_update,new_post").split(",")
+    if event.strip()
+)
+
+# Batas payload NOTIFY di Postgres adalah 8000 byte; pesan lebih besar disimpan
+# di tabel socketio_payloads dan hanya id-nya yang dikirim
+NOTIFY_MAX_BYTES = 7900
+PAYLOAD_RETENTION_SECONDS = 60
+
+
+def asyncpg_dsn(url: str) -> str:
+    """Ubah URL SQLAlchemy (postgresql+asyncpg://...) menjadi DSN asyncpg"""
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class BackpressureManager(socketio.AsyncManager):
+    """Manager yang tidak menumpuk event ke klien lambat
+
+    Event di SOCKETIO_DROPPABLE_EVENTS dilewati untuk klien yang antrean
+    engine.io-nya sudah penuh, supaya memori tidak terus tumbuh karena satu
+    koneksi yang lambat. Untuk pub/sub, pengecekan terjadi di setiap node saat
+    emit dikirim ke klien lokalnya.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slow_client_drops = 0
+        # Dipanggil dengan sid penerima lokal setiap emit (lihat sockets.py:
+        # koneksi yang menerima event tidak dianggap idle)
+        self.on_deliver = None
+        # Handler pesan internal antar worker per nama method (lihat publish_control)
+        self.control_handlers: Dict[str, Any] = {}
+
+    async def publish_control(self, method: str, data: Dict[str, Any]) -> None:
+        """Kirim pesan internal ke worker lain; tanpa pub/sub tidak ada worker lain"""
+
+    def slow_clients(self, namespace, room) -> List[str]:
+        sockets = self.server.eio.sockets
+        slow = []
+        for sid, eio_sid in self.get_participants(namespace, room):
+            eio_socket = sockets.get(eio_sid)
+            if eio_socket is not None and eio_socket.queue.qsize() > SOCKETIO_SLOW_CLIENT_QUEUE:
+                slow.append(sid)
+        return slow
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        if event in SOCKETIO_DROPPABLE_EVENTS and callback is None and namespace in self.rooms:
+            slow = self.slow_clients(namespace, to or room)
+            if slow:
+                self.slow_client_drops += len(slow)
+                if skip_sid is None:
+                    skip_sid = []
+                elif not isinstance(skip_sid, list):
+                    skip_sid = [skip_sid]
+                skip_sid = skip_sid + slow
+        if self.on_deliver is not None and namespace in self.rooms:
+            skip = skip_sid if isinstance(skip_sid, list) else [skip_sid]
+            self.on_deliver([sid for sid, _ in self.get_participants(namespace, to or room) if sid not in skip])
+        return await super().emit(
+            event, data, namespace, room=room, skip_sid=skip_sid, callback=callback, to=to, **kwargs
+        )
+
+
+class ControlPubSubManager(AsyncPubSubManager, BackpressureManager):
+    """Manager pub/sub yang juga membawa pesan internal antar worker
+
+    Pesan dengan method di control_handlers (mis. invalidasi cache) dikirim
+    lewat channel yang sama dengan emit Socket.IO, ditangani di setiap worker
+    lain dan tidak diteruskan ke python-socketio. Subclass menyediakan
+    _listen_channel() sebagai ganti _listen().
+    """
+
+    async def publish_control(self, method: str, data: Dict[str, Any]) -> None:
+        await self._publish({**data, "method": method, "host_id": self.host_id})
+
+    async def _listen(self):
+        async for message in self._listen_channel():
+            handler = self.control_handlers.get(message.get("method")) if isinstance(message, dict) else None
+            if handler is None:
+                yield message
+            elif message.get("host_id") != self.host_id:
+                try:
+                    await handler(message)
+                except Exception:
+                    self._get_logger().exception(f"pubsub control handler {message['method']} failed")
+
+
+class PostgresPubSubManager(ControlPubSubManager):
+    """Client manager Socket.IO yang menyebarkan emit lewat Postgres LISTEN/NOTIFY
+
+    Setiap worker mendengarkan channel yang sama, jadi emit dari satu worker
+    sampai ke klien yang terhubung ke worker lain.
+    """
+    name = 'postgres'
+
+    def __init__(self, url=DATABASE_URL, channel=SOCKETIO_CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.dsn = asyncpg_dsn(url)
+        self._publish_conn = None
+        self._publish_lock = asyncio.Lock()
+        self._spilled = 0
+
+    async def _connect(self):
+        import asyncpg
+        return await asyncpg.connect(self.dsn)
+
+    async def _publish(self, data):
+        payload = json.dumps(data, default=str)
+        async with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publish_conn is None or self._publish_conn.is_closed():
+                        self._publish_conn = await self._connect()
+                    await self._send(payload)
+                    return
+                except (OSError, ConnectionError) as e:
+                    # Koneksi putus, coba sekali lagi dengan koneksi baru
+                    self._publish_conn = None
+                    if attempt:
+                        raise
+                    self._get_logger().warning(f"pubsub publish failed, reconnecting: {e}")
+
+    async def _send(self, payload):
+        conn = self._publish_conn
+        if len(payload.encode()) > NOTIFY_MAX_BYTES:
+            ref = await conn.fetchval(
+                "INSERT INTO socketio_payloads (payload) VALUES ($1) RETURNING id", payload
+            )
+            payload = json.dumps({"ref": ref})
+            self._spilled += 1
+            if self._spilled % 100 == 0:
+                await conn.execute(
+                    "DELETE FROM socketio_payloads WHERE created_at < now() - make_interval(secs => $1)",
+                    PAYLOAD_RETENTION_SECONDS
+                )
+        await conn.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+
+    async def _listen_channel(self):
+        queue: asyncio.Queue = asyncio.Queue()
+        conn = await self._connect()
+        await conn.add_listener(self.channel, lambda c, pid, channel, payload: queue.put_nowait(payload))
+        # None menandakan koneksi LISTEN terputus
+        conn.add_termination_listener(lambda c: queue.put_nowait(None))
+        try:
+            while True:
+                payload = await queue.get()
+                if payload is None:
+                    await asyncio.sleep(1)
+                    raise ConnectionError("LISTEN connection lost")
+                message = json.loads(payload)
+                if "ref" in message and "method" not in message:
+                    raw = await conn.fetchval("SELECT payload FROM socketio_payloads WHERE id = $1", message["ref"])
+                    if raw is None:
+                        continue
+                    message = json.loads(raw)
+                yield message
+        finally:
+            if not conn.is_closed():
+                await conn.close()
+
+
+# Bus lokal: channel -> antrian setiap server yang mendengarkan
+_local_channels: Dict[str, List[asyncio.Queue]] = {}
+
+
+class LocalPubSubManager(ControlPubSubManager):
+    """Client manager dengan bus dalam proses, untuk test beberapa server sekaligus"""
+    name = 'local'
+
+    def __init__(self, channel=SOCKETIO_CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    async def _publish(self, data):
+        # Pickle supaya setiap server menerima salinan sendiri, seperti lewat jaringan
+        message = pickle.dumps(data)
+        for queue in _local_channels.get(self.channel, []):
+            queue.put_nowait(message)
+
+    async def _listen_channel(self):
+        queue: asyncio.Queue = asyncio.Queue()
+        _local_channels.setdefault(self.channel, []).append(queue)
+        try:
+            while True:
+                yield pickle.loads(await queue.get())
+        finally:
+            _local_channels[self.channel].remove(queue)
+
+
+class MemoryChangeLog:
+    """Log perubahan daftar post di memori (hanya valid untuk satu proses)"""
+
+    def __init__(self, size: int = POSTS_CHANGELOG_SIZE):
+        self.version = 0
+        self.changes = deque(maxlen=size)
+
+    async def current_version(self) -> int:
+        return self.version
+
+    async def record(self, changes) -> List[Dict[str, Any]]:
+        recorded = []
+        for change_type, post_id, post_data in changes:
+            self.version += 1
+            change = {'version': self.version, 'type': change_type, 'post_id': post_id, 'post': post_data}
+            self.changes.append(change)
+            recorded.append(change)
+        return recorded
+
+    async def since(self, version: int) -> Dict[str, Any]:
+        oldest = self.changes[0]['version'] if self.changes else self.version + 1
+        if version > self.version or version < oldest - 1:
+            return {'version': self.version, 'reset': True, 'changes': []}
+        changes = [c for c in self.changes if c['version'] > version]
+        return {'version': self.version, 'reset': False, 'changes': changes}
+
+
+class DatabaseChangeLog:
+    """Log perubahan daftar post di tabel post_list_changes, dipakai bersama semua worker
+
+    Penulisan diserialkan dengan advisory lock, jadi versi yang sudah terlihat
+    berarti semua versi sebelumnya juga sudah di-commit.
+    """
+
+    LOCK_KEY = 7316001
+
+    def __init__(self, size: int = POSTS_CHANGELOG_SIZE):
+        self.size = size
+        self._recorded = 0
+
+    async def current_version(self) -> int:
+        async with SessionLocal() as db:
+            result = await db.execute(select(func.max(models.PostListChange.version)))
+            return result.scalar() or 0
+
+    async def record(self, changes) -> List[Dict[str, Any]]:
+        table = models.PostListChange.__table__
+        async with SessionLocal() as db:
+            if engine.dialect.name == "postgresql":
+                await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": self.LOCK_KEY})
+            result = await db.execute(
+                insert(table).returning(table.c.version, sort_by_parameter_order=True),
+                [{'type': t, 'post_id': post_id, 'post': data} for t, post_id, data in changes]
+            )
+            versions = result.scalars().all()
+            self._recorded += len(changes)
+            if self._recorded >= self.size // 10:
+                # Buang entri lama sesekali, simpan `size` versi terakhir
+                self._recorded = 0
+                await db.execute(delete(table).where(table.c.version <= versions[-1] - self.size))
+            await db.commit()
+        return [
+            {'version': version, 'type': t, 'post_id': post_id, 'post': data}
+            for version, (t, post_id, data) in zip(versions, changes)
+        ]
+
+    async def since(self, version: int) -> Dict[str, Any]:
+        table = models.PostListChange.__table__
+        async with SessionLocal() as db:
+            bounds = await db.execute(select(func.min(table.c.version), func.max(table.c.version)))
+            oldest, current = bounds.one()
+            current = current or 0
+            if oldest is None:
+                oldest = current + 1
+            if version > current or version < oldest - 1:
+                return {'version': current, 'reset': True, 'changes': []}
+            result = await db.execute(
+                select(table.c.version, table.c.type, table.c.post_id, table.c.post)
+                .where(table.c.version > version)
+                .order_by(table.c.version)
+            )
+            changes = [dict(row._mapping) for row in result.all()]
+        return {'version': changes[-1]['version'] if changes else version, 'reset': False, 'changes': changes}
+
+
+# Presence lokal: dipakai bersama oleh semua server dalam proses yang sama
+_local_presence: Dict[str, Dict[str, Any]] = {}
+
+
+class LocalPresenceStore:
+    """Presence di memori proses"""
+
+    async def add(self, sid: str) -> None:
+        _local_presence[sid] = {'user_id': None, 'seen_at': time.time()}
+
+    async def set_user(self, sid: str, user_id) -> None:
+        if sid in _local_presence:
+            _local_presence[sid]['user_id'] = str(user_id)
+
+    async def remove(self, sid: str) -> None:
+        _local_presence.pop(sid, None)
+
+    async def summary(self) -> Dict[str, int]:
+        users = {entry['user_id'] for entry in _local_presence.values() if entry['user_id']}
+        return {'connections': len(_local_presence), 'users': len(users)}
+
+    async def sids_for_user(self, user_id) -> List[str]:
+        return [sid for sid, entry in _local_presence.items() if entry['user_id'] == str(user_id)]
+
+    async def heartbeat(self) -> None:
+        pass
+
+
+class DatabasePresenceStore:
+    """Presence di tabel socket_presence, dipakai bersama semua worker dan node
+
+    Setiap host memperbarui `seen_at` koneksinya secara berkala; baris dari host
+    yang mati kedaluwarsa setelah tiga kali interval heartbeat.
+    """
+
+    def __init__(self, host_id: str):
+        self.host_id = host_id
+
+    def _fresh(self):
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=PRESENCE_HEARTBEAT_SECONDS * 3)
+        return models.SocketPresence.seen_at >= cutoff
+
+    async def add(self, sid: str) -> None:
+        async with SessionLocal() as db:
+            await db.merge(models.SocketPresence(sid=sid, host_id=self.host_id, user_id=None))
+            await db.commit()
+
+    async def set_user(self, sid: str, user_id) -> None:
+        async with SessionLocal() as db:
+            await db.execute(
+                update(models.SocketPresence)
+                .where(models.SocketPresence.sid == sid)
+                .values(user_id=str(user_id), seen_at=func.now())
+            )
+            await db.commit()
+
+    async def remove(self, sid: str) -> None:
+        async with SessionLocal() as db:
+            await db.execute(delete(models.SocketPresence).where(models.SocketPresence.sid == sid))
+            await db.commit()
+
+    async def summary(self) -> Dict[str, int]:
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(
+                    func.count(models.SocketPresence.sid),
+                    func.count(models.SocketPresence.user_id.distinct())
+                ).where(self._fresh())
+            )
+            connections, users = result.one()
+        return {'connections': connections, 'users': users}
+
+    async def sids_for_user(self, user_id) -> List[str]:
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(models.SocketPresence.sid)
+                .where(models.SocketPresence.user_id == str(user_id), self._fresh())
+            )
+            return list(result.scalars().all())
+
+    async def heartbeat(self) -> None:
+        async with SessionLocal() as db:
+            await db.execute(
+                update(models.SocketPresence)
+                .where(models.SocketPresence.host_id == self.host_id)
+                .values(seen_at=func.now())
+            )
+            await db.execute(delete(models.SocketPresence).where(~self._fresh()))
+            await db.commit()
+
+
+def create_client_manager(name: str = SOCKETIO_MANAGER) -> socketio.AsyncManager:
+    """Pilih client manager dari SOCKETIO_MANAGER"""
+    if name == "memory":
+        return BackpressureManager()
+    if name == "local":
+        return LocalPubSubManager()
+    if name == "postgres":
+        return PostgresPubSubManager()
+    raise ValueError(f"Unsupported SOCKETIO_MANAGER: {name}")
+
+
+def create_changelog(name: str = SOCKETIO_MANAGER):
+    return DatabaseChangeLog() if name == "postgres" else MemoryChangeLog()
+
+
+def create_presence_store(host_id: str, name: str = SOCKETIO_MANAGER):
+    return DatabasePresenceStore(host_id) if name == "postgres" else LocalPresenceStore()
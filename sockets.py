@@ -1,10 +1,71 @@
 import socketio
-from typing import Dict, Any
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from typing import Dict, Any, List, Optional
+
+from broadcast_scheduler import BroadcastScheduler, FieldDiffer
+from presence_registry import PresenceRegistry
+from serialization import orjson
+from socket_backends import (
+    PRESENCE_HEARTBEAT_SECONDS, create_changelog, create_client_manager, create_presence_store
+)
+
+try:
+    import msgpack
+except ImportError:  # opsional: hanya untuk SOCKETIO_SERIALIZER=msgpack
+    msgpack = None
+
+# Rahasia untuk menandatangani token autentikasi socket. Harus sama di semua
+# worker; run.py membuatnya sekali untuk semua worker jika tidak diset, proses
+# yang dijalankan dengan cara lain membuat rahasia acak sendiri
+SOCKETIO_AUTH_SECRET = os.getenv("SOCKETIO_AUTH_SECRET") or secrets.token_hex(32)
+SOCKETIO_AUTH_TTL = int(os.getenv("SOCKETIO_AUTH_TTL", "3600"))
+
+# Format paket Socket.IO: "json" (default) atau "msgpack" (biner, lebih kecil
+# dan tanpa escape string; butuh `pip install msgpack`, klien memuat parser
+# msgpack lewat base.html)
+SOCKETIO_SERIALIZER = os.getenv("SOCKETIO_SERIALIZER", "json").lower()
+if SOCKETIO_SERIALIZER == "msgpack" and msgpack is None:
+    print("SOCKETIO_SERIALIZER=msgpack tetapi paket msgpack tidak terpasang, memakai json")
+    SOCKETIO_SERIALIZER = "json"
+# Update post hanya berisi field yang berubah dibanding update sebelumnya
+SOCKETIO_DIFF_UPDATES = os.getenv("SOCKETIO_DIFF_UPDATES", "true").lower() == "true"
+# Transport polling: respons di atas ukuran ini dikompres (gzip/deflate).
+# WebSocket memakai permessage-deflate yang dinegosiasikan uvicorn (lihat run.py)
+SOCKETIO_COMPRESSION_THRESHOLD = int(os.getenv("SOCKETIO_COMPRESSION_THRESHOLD", "1024"))
+
+
+class FastJSON:
+    """Modul json untuk paket Socket.IO, memakai orjson jika tersedia"""
+
+    @staticmethod
+    def dumps(obj, **kwargs) -> str:
+        if orjson is not None:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z).decode()
+        return json.dumps(obj, separators=(",", ":"), default=str)
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+
+# Client manager menentukan bagaimana emit sampai ke klien di worker/node lain
+client_manager = create_client_manager()
 
 # Buat Socket.IO server dengan konfigurasi yang benar
 sio = socketio.AsyncServer(
     async_mode='asgi',
-    cors_allowed_origins='*'  # Gunakan string '*' untuk mengizinkan semua asal di lingkungan dev
+    cors_allowed_origins='*',  # Gunakan string '*' untuk mengizinkan semua asal di lingkungan dev
+    client_manager=client_manager,
+    serializer='msgpack' if SOCKETIO_SERIALIZER == 'msgpack' else 'default',
+    json=FastJSON,
+    http_compression=True,
+    compression_threshold=SOCKETIO_COMPRESSION_THRESHOLD
 )
 
 # Buat ASGI app untuk Socket.IO - perbaiki konfigurasi
@@ -13,81 +74,286 @@ socket_app = socketio.ASGIApp(
     # Hapus socketio_path di sini
 )
 
-# Simpan koneksi pengguna aktif
-connected_users: Dict[str, Dict[str, Any]] = {}
+# Koneksi aktif di worker ini, dengan indeks user dan room
+registry = PresenceRegistry()
+# Event yang dikirim ke klien juga dihitung sebagai aktivitas, jadi penonton
+# daftar/detail post yang hanya menerima broadcast tidak diputus sebagai idle
+client_manager.on_deliver = registry.touch_many
+
+# Presence yang dipakai bersama semua worker (tergantung SOCKETIO_MANAGER)
+host_id = getattr(client_manager, "host_id", "local")
+presence = create_presence_store(host_id)
+
+# Versi daftar post yang naik setiap ada perubahan, plus log perubahan terbatas
+# supaya klien yang tertinggal bisa resync tanpa memuat ulang seluruh daftar
+changelog = create_changelog()
+
+# Broadcast dari request diantrikan dan dikirim oleh task latar belakang
+scheduler = BroadcastScheduler(sio, changelog)
+
+# State post terakhir yang dikirim worker ini, basis update diff-only
+post_differ = FieldDiffer("updated_at")
+
+def _post_update_payload(data):
+    """Ubah update penuh menjadi diff terhadap update terakhir yang dikirim
+
+    Klien menerapkan diff hanya jika versinya sama dengan `since`; jika tidak
+    (update dari worker lain, atau ada yang terlewat) klien memuat post penuh.
+    """
+    if data['type'] == 'delete':
+        post_differ.forget(data['post_id'])
+        return data
+    if data['type'] != 'update':
+        return data
+    changed, since, is_diff = post_differ.diff(data['post_id'], data['data'])
+    if not is_diff:
+        return data
+    return {**data, 'data': changed, 'diff': True, 'since': since}
+
+def _remember_new_post(data):
+    """Post baru menjadi basis diff untuk update pertamanya"""
+    post = data.get('post') or {}
+    if 'id' in post:
+        post_differ.remember(post['id'], {**post, 'updated_at': post.get('updated_at')})
+    return data
+
+if SOCKETIO_DIFF_UPDATES:
+    scheduler.transforms['post_update'] = _post_update_payload
+    scheduler.transforms['new_post'] = _remember_new_post
+
+_heartbeat_task: Optional[asyncio.Task] = None
+
+async def evict_idle_connections():
+    """Putus koneksi yang terlalu lama tanpa event dari atau ke klien"""
+    for sid in registry.idle_sids():
+        registry.evicted += 1
+        await sio.disconnect(sid)
+        # Socket yang sudah hilang tidak memicu disconnect(); hapus langsung
+        registry.remove(sid)
+
+async def _presence_heartbeat():
+    while True:
+        await asyncio.sleep(PRESENCE_HEARTBEAT_SECONDS)
+        try:
+            await presence.heartbeat()
+            await evict_idle_connections()
+        except Exception as e:
+            print(f"Presence heartbeat failed: {e}")
+
+def start_background_tasks():
+    """Mulai heartbeat presence dan scheduler broadcast (dipanggil saat startup aplikasi)"""
+    global _heartbeat_task
+    if _heartbeat_task is None:
+        _heartbeat_task = asyncio.create_task(_presence_heartbeat())
+    scheduler.start()
+
+async def stop_background_tasks():
+    """Hentikan heartbeat dan kirim broadcast yang masih di antrean"""
+    global _heartbeat_task
+    if _heartbeat_task is not None:
+        _heartbeat_task.cancel()
+        _heartbeat_task = None
+    await scheduler.stop()
+
+def get_presence_stats() -> Dict[str, Any]:
+    """Koneksi, user, dan room di worker ini"""
+    return registry.get_stats()
+
+def get_broadcast_stats() -> Dict[str, Any]:
+    """Kedalaman antrean, latensi emit, dan klien lambat yang dilewati"""
+    stats = scheduler.get_stats()
+    stats["slow_client_drops"] = getattr(client_manager, "slow_client_drops", 0)
+    stats["serializer"] = SOCKETIO_SERIALIZER
+    stats["post_diffs"] = post_differ.get_stats() if SOCKETIO_DIFF_UPDATES else None
+    return stats
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(SOCKETIO_AUTH_SECRET.encode(), payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+def make_socket_token(user_id, ttl: int = SOCKETIO_AUTH_TTL) -> str:
+    """Token bertanda tangan untuk event `authenticate`: <user_id>.<kedaluwarsa>.<tanda tangan>"""
+    payload = f"{user_id}.{int(time.time()) + ttl}"
+    return f"{payload}.{_sign(payload)}"
+
+def verify_socket_token(token) -> Optional[str]:
+    """user_id dari token yang sah dan belum kedaluwarsa, selain itu None"""
+    try:
+        user_id, expires, signature = str(token).rsplit(".", 2)
+        expired = int(expires) < time.time()
+    except ValueError:
+        return None
+    if expired or not hmac.compare_digest(signature, _sign(f"{user_id}.{expires}")):
+        return None
+    return user_id
+
+def user_room(user_id) -> str:
+    return f"user_{user_id}"
+
+def post_room(post_id) -> str:
+    return f"post_{post_id}"
+
+def _post_id(data) -> Optional[int]:
+    try:
+        return int(data['post_id'])
+    except (KeyError, TypeError, ValueError):
+        return None
 
 # Peristiwa koneksi
 @sio.event
 async def connect(sid, environ):
-    """Tangani koneksi socket baru"""
+    """Tangani koneksi socket baru; ditolak jika worker sudah penuh"""
+    if not registry.add(sid):
+        print(f"Client rejected, {len(registry)} connections: {sid}")
+        return False
     print(f"Client connected: {sid}")
-    connected_users[sid] = {"user_id": None}  # Inisialisasi, akan diupdate saat login
+    await presence.add(sid)
 
 @sio.event
 async def disconnect(sid):
     """Tangani disconnect socket"""
     print(f"Client disconnected: {sid}")
-    if sid in connected_users:
-        del connected_users[sid]
+    registry.remove(sid)
+    await presence.remove(sid)
 
 # Peristiwa autentikasi
 @sio.event
 async def authenticate(sid, data):
-    """Autentikasi user dan simpan user_id ke connected_users"""
-    if 'user_id' in data:
-        user_id = data['user_id']
-        connected_users[sid]['user_id'] = user_id
-        print(f"User authenticated: {user_id} (sid: {sid})")
-        return {"status": "authenticated"}
-    return {"status": "error", "message": "Missing user_id"}
+    """Autentikasi dengan token dari POST /auth/socket-token (user_id saja tidak dipercaya)"""
+    registry.touch(sid)
+    user_id = verify_socket_token((data or {}).get('token'))
+    if user_id is None:
+        return {"status": "error", "message": "Invalid or expired token"}
+    registry.set_user(sid, user_id)
+    # Room per user, supaya emit_to_user sampai ke semua tab/worker user ini
+    await sio.enter_room(sid, user_room(user_id))
+    await presence.set_user(sid, user_id)
+    print(f"User authenticated: {user_id} (sid: {sid})")
+    return {"status": "authenticated", "user_id": user_id}
 
 # Peristiwa untuk post baru
 @sio.event
 async def join_post_room(sid, data):
     """Bergabung ke room post untuk mendapatkan update real-time"""
-    if 'post_id' in data:
-        post_id = data['post_id']
-        room = f"post_{post_id}"
-        await sio.enter_room(sid, room)
-        print(f"Client {sid} joined room: {room}")
-        return {"status": "success"}
-    return {"status": "error", "message": "Missing post_id"}
+    registry.touch(sid)
+    post_id = _post_id(data)
+    if post_id is None:
+        return {"status": "error", "message": "Missing post_id"}
+    room = post_room(post_id)
+    if not registry.join(sid, room):
+        return {"status": "error", "message": "Too many rooms"}
+    await sio.enter_room(sid, room)
+    print(f"Client {sid} joined room: {room}")
+    return {"status": "success", "viewers": registry.room_count(room)}
+
+@sio.event
+async def leave_post_room(sid, data):
+    """Keluar dari room post"""
+    registry.touch(sid)
+    post_id = _post_id(data)
+    if post_id is None:
+        return {"status": "error", "message": "Missing post_id"}
+    registry.leave(sid, post_room(post_id))
+    await sio.leave_room(sid, post_room(post_id))
+    return {"status": "success"}
+
+@sio.event
+async def get_post_viewers(sid, data):
+    """Jumlah koneksi di room post (di worker ini), O(1)"""
+    registry.touch(sid)
+    post_id = _post_id(data)
+    if post_id is None:
+        return {"status": "error", "message": "Missing post_id"}
+    return {"status": "success", "post_id": post_id, "viewers": registry.room_count(post_room(post_id))}
+
+async def publish_cache_invalidation(keys) -> None:
+    """Minta worker lain membuang kunci ini dari cache lokal mereka
+
+    Lewat channel pub/sub client manager; kegagalan hanya dicatat, supaya
+    write yang sudah di-commit tidak ikut gagal (entri habis oleh TTL).
+    """
+    try:
+        await client_manager.publish_control("cache_invalidate", {"keys": list(keys)})
+    except Exception as e:
+        print(f"Cache invalidation broadcast failed: {e}")
+
+def on_cache_invalidation(handler) -> None:
+    """Panggil handler(*keys) untuk invalidasi cache dari worker lain"""
+    async def handle(message):
+        handler(*message["keys"])
+    client_manager.control_handlers["cache_invalidate"] = handle
+
+async def emit_to_user(user_id, event, data) -> None:
+    """Kirim event hanya ke koneksi user ini (semua tab, di semua worker)
+
+    Lewat room user, jadi client manager pub/sub meneruskannya ke worker lain
+    dan tidak ada broadcast ke semua klien.
+    """
+    await sio.emit(event, data, room=user_room(user_id))
 
 # Fungsi helper untuk broadcast update
 async def broadcast_post_update(post_id, post_data, event_type="update"):
-    """Kirim update post ke semua klien yang terhubung ke room post"""
-    room = f"post_{post_id}"
-    await sio.emit(
+    """Antrikan update post untuk klien di room post (update terakhir per post menang)"""
+    room = post_room(post_id)
+    scheduler.emit(
         'post_update',
         {
             'type': event_type,  # 'create', 'update', 'delete'
             'post_id': post_id,
             'data': post_data
         },
-        room=room
+        room=room,
+        key=post_id
     )
 
-async def broadcast_post_list_update():
-    """Kirim notifikasi bahwa daftar post telah berubah"""
-    await sio.emit('posts_list_update', {})
+async def get_post_list_changes(since: int) -> Dict[str, Any]:
+    """Ambil semua delta setelah versi `since`.
+
+    Jika versi tersebut sudah keluar dari log (atau berasal dari proses lain
+    sebelum restart), kembalikan `reset: True` agar klien memuat ulang daftar.
+    """
+    return await changelog.since(since)
+
+async def broadcast_post_list_update(change_type, post_id, post_data: Optional[Dict[str, Any]] = None):
+    """Antrikan delta daftar post (bukan sinyal kosong) untuk semua klien"""
+    await broadcast_post_list_changes([(change_type, post_id, post_data)])
+
+async def broadcast_post_list_changes(changes):
+    """Antrikan banyak delta sekaligus (mis. hasil bulk insert)
+
+    `changes` berisi tuple (change_type, post_id, post_data). Delta dicatat ke
+    changelog dan dikirim sebagai satu event per jendela scheduler.
+    """
+    if not changes:
+        return
+    scheduler.post_list_changes(changes)
 
 async def broadcast_new_post(post_data):
-    """Kirim notifikasi bahwa post baru telah dibuat"""
-    await sio.emit(
+    """Antrikan notifikasi bahwa post baru telah dibuat"""
+    scheduler.emit(
         'new_post', 
         {
             'post': post_data
-        }
+        },
+        key=post_data.get('id')
     )
 
+@sio.event
+async def get_presence(sid):
+    """Jumlah koneksi dan user online di semua worker"""
+    registry.touch(sid)
+    return await presence.summary()
+
 # Tambahkan event handler test sederhana
 @sio.event
 async def test_event(sid, data):
     """Event test sederhana"""
+    registry.touch(sid)
     print(f"Test event received from {sid}: {data}")
     return {"status": "success", "message": "Test event received"}
 
 @sio.event
 async def ping(sid):
+    registry.touch(sid)
     print(f"Ping from {sid}")
     return {"status": "pong", "timestamp": time.time()}
\ No newline at end of file
@@ -10,10 +10,19 @@ document.addEventListener('DOMContentLoaded', function() {
 
 function initializeSocketIO() {
     // Perbaikan: Konfigurasi koneksi Socket.IO yang benar
-    const socket = io({
+    const options = {
         transports: ['websocket'],
         upgrade: false
-    });
+    };
+    // Server dengan SOCKETIO_SERIALIZER=msgpack: base.html memuat parsernya
+    if (window.socketioParser) {
+        options.parser = window.socketioParser;
+    }
+    const socket = io(options);
+    // Handler real-time dipasang sekali; koneksi berikutnya hanya memanggil
+    // fungsi resync halaman ini
+    let connectedBefore = false;
+    let resyncPage = null;
 
     // Event saat berhasil terhubung
     socket.on('connect', () => {
@@ -24,21 +33,35 @@ function initializeSocketIO() {
             console.log('Server response:', response);
         });
         
+        // Sambungan ulang, otomatis atau lewat socket.connect() (yang tidak
+        // memicu 'reconnect'): ambil yang terlewat selama terputus
+        if (connectedBefore) {
+            if (resyncPage) resyncPage();
+            return;
+        }
+        connectedBefore = true;
+        
         // Jika di halaman post list, aktifkan update real-time
         if (window.location.pathname === '/web/posts') {
-            setupPostsListRealtime(socket);
+            resyncPage = setupPostsListRealtime(socket);
         }
         
         // Jika di halaman detail post, aktifkan update real-time
         if (window.location.pathname.match(/^\/web\/posts\/\d+$/)) {
             const postId = parseInt(window.location.pathname.split('/').pop());
-            setupPostDetailRealtime(socket, postId);
+            resyncPage = setupPostDetailRealtime(socket, postId);
         }
     });
 
     // Event saat koneksi terputus
     socket.on('disconnect', (reason) => {
         console.log('Disconnected from Socket.IO server:', reason);
+        
+        // Server memutus koneksi yang lama idle dan tidak reconnect otomatis;
+        // sambung lagi saat tab dipakai kembali (delta yang terlewat di-resync)
+        if (reason === 'io server disconnect') {
+            window.addEventListener('focus', () => socket.connect(), { once: true });
+        }
     });
 
     // Event saat terjadi error
@@ -48,46 +71,153 @@ function initializeSocketIO() {
 }
 
 function setupPostsListRealtime(socket) {
-    // Listen untuk update daftar post
-    socket.on('posts_list_update', () => {
-        console.log('Posts list updated, refreshing...');
-        refreshPostsList();
-    });
-    
-    // Listen untuk post baru
-    socket.on('new_post', (data) => {
-        console.log('New post created:', data);
-        addPostToList(data.post);
+    // Versi daftar yang sedang ditampilkan, dirender oleh server
+    const table = document.querySelector('.table[data-list-version]');
+    let listVersion = table ? parseInt(table.getAttribute('data-list-version')) : 0;
+    let resyncing = false;
+    let resyncAgain = false;
+
+    // Ambil delta yang terlewat dari server, bukan memuat ulang seluruh daftar
+    function resync() {
+        if (resyncing) {
+            // Delta yang datang selama resync diambil ulang setelahnya
+            resyncAgain = true;
+            return;
+        }
+        resyncing = true;
+        fetch(`/web/posts/changes?since=${listVersion}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.reset) {
+                    // Log perubahan sudah terlewat jauh, muat ulang sekali
+                    return refreshPostsList().then(version => { listVersion = version; });
+                }
+                data.changes.forEach(applyPostListChange);
+                listVersion = data.version;
+            })
+            .catch(error => console.error('Error resyncing posts:', error))
+            .finally(() => {
+                resyncing = false;
+                if (resyncAgain) {
+                    resyncAgain = false;
+                    resync();
+                }
+            });
+    }
+
+    // Listen untuk delta daftar post
+    socket.on('posts_list_update', (data) => {
+        console.log('Posts list delta received:', data);
+        if (resyncing) {
+            resync();
+            return;
+        }
+
+        const first = data.changes.length ? data.changes[0].version : data.version;
+        if (first === listVersion + 1) {
+            data.changes.forEach(applyPostListChange);
+            listVersion = data.version;
+        } else if (data.version > listVersion) {
+            // Ada delta yang terlewat
+            resync();
+        }
     });
+
+    // Dipanggil setelah reconnect: mungkin ada delta yang terlewat selama terputus
+    return resync;
 }
 
 function setupPostDetailRealtime(socket, postId) {
+    // Versi (updated_at) post yang sedang ditampilkan, basis update diff
+    const card = document.querySelector('.card[data-updated-at]');
+    let version = card ? card.getAttribute('data-updated-at') || null : null;
+
+    // Disimpan juga di halaman (data-updated-at)
+    function setVersion(value) {
+        version = value;
+        if (card) card.setAttribute('data-updated-at', value || '');
+    }
+
     // Bergabung ke room post untuk mendapatkan update
-    socket.emit('join_post_room', { post_id: postId });
+    function joinRoom() {
+        socket.emit('join_post_room', { post_id: postId });
+    }
+    joinRoom();
     
+    // Ambil post penuh jika diff tidak bisa diterapkan ke versi yang ditampilkan
+    function reload() {
+        fetch(`/posts/${postId}`)
+            .then(response => response.json())
+            .then(post => {
+                updatePostDetails(post);
+                setVersion(post.updated_at);
+            })
+            .catch(error => console.error('Error reloading post:', error));
+    }
+
     // Listen untuk update post
     socket.on('post_update', (data) => {
         console.log('Post update received:', data);
         
         if (data.post_id === postId) {
             if (data.type === 'update') {
+                if (data.diff && !sameVersion(data.since, version)) {
+                    // Ada update yang terlewat (atau dari worker lain)
+                    reload();
+                    return;
+                }
                 updatePostDetails(data.data);
+                if ('updated_at' in data.data) {
+                    setVersion(data.data.updated_at);
+                }
             } else if (data.type === 'delete') {
                 handlePostDeleted();
             }
         }
     });
+
+    // Dipanggil setelah reconnect: server sudah melupakan room koneksi lama,
+    // dan update selama terputus tidak diterima; ambil ulang versi terbaru
+    return () => {
+        joinRoom();
+        reload();
+    };
+}
+
+// Bandingkan dua timestamp versi (format ISO bisa berbeda, mis. "Z" dan "+00:00")
+function sameVersion(a, b) {
+    if (!a || !b) {
+        return !a && !b;
+    }
+    return Date.parse(a) === Date.parse(b);
 }
 
 // Fungsi helper untuk merefresh daftar post tanpa reload halaman
 function refreshPostsList() {
     // Gunakan fetch API untuk memuat ulang daftar post
-    fetch('/web/posts?format=json')
+    return fetch('/web/posts?format=json')
         .then(response => response.json())
         .then(data => {
             updatePostsListUI(data.posts);
-        })
-        .catch(error => console.error('Error refreshing posts:', error));
+            return data.version;
+        });
+}
+
+// Terapkan satu delta ke tabel post
+function applyPostListChange(change) {
+    if (change.type === 'created') {
+        addPostToList(change.post);
+    } else if (change.type === 'updated') {
+        const existingRow = document.querySelector(`tr[data-post-id="${change.post_id}"]`);
+        if (existingRow) {
+            existingRow.replaceWith(buildPostRow(change.post));
+        } else {
+            addPostToList(change.post);
+        }
+    } else if (change.type === 'deleted') {
+        const existingRow = document.querySelector(`tr[data-post-id="${change.post_id}"]`);
+        if (existingRow) existingRow.remove();
+    }
 }
 
 // Fungsi untuk menambahkan post baru ke daftar tanpa reload
@@ -100,7 +230,24 @@ function addPostToList(post) {
     const existingRow = document.querySelector(`tr[data-post-id="${post.id}"]`);
     if (existingRow) return;
     
-    // Buat row baru untuk post
+    const row = buildPostRow(post);
+
+    // Prepend row ke tabel
+    if (postsTable.querySelector('tr')) {
+        postsTable.insertBefore(row, postsTable.querySelector('tr'));
+    } else {
+        postsTable.appendChild(row);
+    }
+    
+    // Jika baris "No posts found" ada, hapus
+    const noPostsRow = postsTable.querySelector('tr td[colspan="6"]');
+    if (noPostsRow) {
+        noPostsRow.closest('tr').remove();
+    }
+}
+
+// Buat elemen row untuk satu post
+function buildPostRow(post) {
     const row = document.createElement('tr');
     row.setAttribute('data-post-id', post.id);
     
@@ -115,7 +262,7 @@ function addPostToList(post) {
     row.innerHTML = `
         <td>${post.id}</td>
         <td>${post.title}</td>
-        <td>Unknown</td>
+        <td>${post.author || 'Unknown'}</td>
         <td>${statusBadge}</td>
         <td>${formattedDate}</td>
         <td>
@@ -148,35 +295,25 @@ function addPostToList(post) {
         </td>
     `;
 
-    // Prepend row ke tabel
-    if (postsTable.querySelector('tr')) {
-        postsTable.insertBefore(row, postsTable.querySelector('tr'));
-    } else {
-        postsTable.appendChild(row);
-    }
-    
-    // Jika baris "No posts found" ada, hapus
-    const noPostsRow = postsTable.querySelector('tr td[colspan="6"]');
-    if (noPostsRow) {
-        noPostsRow.closest('tr').remove();
-    }
+    return row;
 }
 
-// Fungsi untuk mengupdate detail post tanpa reload
+// Fungsi untuk mengupdate detail post tanpa reload; field yang tidak ada
+// (update diff) dibiarkan seperti yang ditampilkan
 function updatePostDetails(postData) {
     // Update title
     const titleElement = document.querySelector('.card-header h5');
-    if (titleElement) titleElement.textContent = postData.title;
+    if (titleElement && 'title' in postData) titleElement.textContent = postData.title;
     
     // Update content
     const contentElement = document.querySelector('.post-content');
-    if (contentElement) {
+    if (contentElement && 'content' in postData) {
         contentElement.innerHTML = postData.content.replace(/\n/g, '<br>');
     }
     
     // Update status publikasi
     const statusBadge = document.querySelector('.badge');
-    if (statusBadge) {
+    if (statusBadge && 'published' in postData) {
         if (postData.published) {
             statusBadge.textContent = 'Published';
             statusBadge.className = 'badge bg-success';
@@ -212,52 +349,6 @@ function updatePostsListUI(posts) {
     
     // Tambahkan semua post
     posts.forEach(post => {
-        const statusBadge = post.published ? 
-            '<span class="badge bg-success">Published</span>' : 
-            '<span class="badge bg-warning">Draft</span>';
-        
-        const date = new Date(post.created_at);
-        const formattedDate = date.toLocaleDateString() + ' ' + date.toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'});
-        
-        const row = document.createElement('tr');
-        row.setAttribute('data-post-id', post.id);
-        
-        row.innerHTML = `
-            <td>${post.id}</td>
-            <td>${post.title}</td>
-            <td>${post.author}</td>
-            <td>${statusBadge}</td>
-            <td>${formattedDate}</td>
-            <td>
-                <div class="btn-group btn-group-sm" role="group">
-                    <a href="/web/posts/${post.id}" class="btn btn-info">View</a>
-                    <a href="/web/posts/${post.id}/edit" class="btn btn-warning">Edit</a>
-                    <button class="btn btn-danger" data-bs-toggle="modal" data-bs-target="#deleteModal${post.id}">Delete</button>
-                </div>
-                
-                <!-- Delete Modal -->
-                <div class="modal fade" id="deleteModal${post.id}" tabindex="-1" aria-hidden="true">
-                    <div class="modal-dialog">
-                        <div class="modal-content">
-                            <div class="modal-header">
-                                <h5 class="modal-title">Confirm Delete</h5>
-                                <button type="button" class="btn-close" data-bs-dismiss="modal" aria-label="Close"></button>
-                            </div>
-                            <div class="modal-body">
-                                Are you sure you want to delete "${post.title}"? This action cannot be undone.
-                            </div>
-                            <div class="modal-footer">
-                                <button type="button" class="btn btn-secondary" data-bs-dismiss="modal">Cancel</button>
-                                <form action="/web/posts/${post.id}/delete" method="post">
-                                    <button type="submit" class="btn btn-danger">Delete</button>
-                                </form>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </td>
-        `;
-        
-        postsTable.appendChild(row);
+        postsTable.appendChild(buildPostRow(post));
     });
 }
\ No newline at end of file
@@ -0,0 +1,228 @@
+"""
+Content-hashed, pre-compressed static assets.
+
+Build step (run on deploy, after the static files change):
+    python static_assets.py                     - static/ -> static/dist/
+    python static_assets.py --static-dir assets
+
+Every file in static/ is copied to static/dist/ under a name containing a
+hash of its content (js/main.js -> dist/js/main.3f2a9c1e0b.js), next to
+.gz and .br (brotli installed) variants compressed at maximum level, and
+dist/manifest.json maps the source paths to the hashed ones. Templates link
+assets through {{ asset_url("js/main.js") }}; without a manifest (nothing
+built, e.g. in development) that is simply /static/js/main.js.
+
+Hashed files never change, so they are served with an immutable one-year
+Cache-Control, and the pre-compressed variant matching Accept-Encoding is
+sent as-is: no compression work per request.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import sys
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.middleware.exceptions import ExceptionMiddleware
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from compression import brotli, negotiate_encoding
+
+STATIC_DIR = os.getenv("STATIC_DIR", "static")
+STATIC_URL = "/static"
+# Build output inside STATIC_DIR
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+# Hashed assets; anything else is revalidated with its ETag/Last-Modified
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STATIC_CACHE_CONTROL = os.getenv("STATIC_CACHE_CONTROL", "no-cache")
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/xml")
+# Pre-compressed variant suffixes, by Content-Encoding
+VARIANTS = {"br": ".br", "gzip": ".gz"}
+
+_manifest: Optional[Dict[str, str]] = None
+
+
+def load_manifest(static_dir: str = STATIC_DIR) -> Dict[str, str]:
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(os.path.join(static_dir, DIST_DIR, MANIFEST_NAME), encoding="utf-8") as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {}
+    return _manifest
+
+
+def asset_url(path: str) -> str:
+    """
+    Template global: URL of the hashed build of a static file, e.g.
+    asset_url("css/style.css") -> /static/dist/css/style.5d41402abc.css
+    """
+    return f"{STATIC_URL}/{load_manifest().get(path, path)}"
+
+
+def hashed_name(path: str, content: bytes) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{hashlib.blake2b(content, digest_size=5).hexdigest()}{ext}"
+
+
+def is_compressible(path: str) -> bool:
+    media_type = mimetypes.guess_type(path)[0] or ""
+    return media_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def build(static_dir: str = STATIC_DIR) -> Dict[str, str]:
+    """
+    Rebuild static_dir/dist and its manifest; returns the manifest
+    """
+    dist = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+
+    for directory, subdirs, files in os.walk(static_dir):
+        if os.path.abspath(directory) == os.path.abspath(static_dir):
+            subdirs[:] = [name for name in subdirs if name != DIST_DIR]
+        for name in sorted(files):
+            source = os.path.join(directory, name)
+            path = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                content = f.read()
+
+            target_path = f"{DIST_DIR}/{hashed_name(path, content)}"
+            target = os.path.join(static_dir, *target_path.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(content)
+
+            if is_compressible(path):
+                variants = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+                if brotli is not None:
+                    variants["br"] = brotli.compress(content, quality=11)
+                for encoding, data in variants.items():
+                    # A variant that isn't smaller is never worth sending
+                    if len(data) < len(content):
+                        with open(target + VARIANTS[encoding], "wb") as f:
+                            f.write(data)
+
+            manifest[path] = target_path
+
+    with open(os.path.join(dist, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class PathSendFileResponse(FileResponse):
+    """
+    FileResponse that hands the file to the server (ASGI "http.response.pathsend"
+    extension) when it supports it, so the body is sent with sendfile instead of
+    being read into Python in chunks. Servers without the extension get the
+    regular chunked response.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.use_pathsend = "http.response.pathsend" in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        if not self.use_pathsend or send_header_only:
+            await super()._handle_simple(send, send_header_only)
+            return
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+
+
+class HashedStaticFiles(StaticFiles):
+    """
+    StaticFiles serving dist/ (hashed) files immutable and pre-compressed
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Hashed files never change: remember which variants exist per file
+        self.variants: Dict[str, Dict[str, Tuple[str, os.stat_result]]] = {}
+
+    def find_variants(self, full_path: str) -> Dict[str, Tuple[str, os.stat_result]]:
+        variants = self.variants.get(full_path)
+        if variants is None:
+            variants = {}
+            for encoding, suffix in VARIANTS.items():
+                try:
+                    variants[encoding] = (full_path + suffix, os.stat(full_path + suffix))
+                except FileNotFoundError:
+                    pass
+            self.variants[full_path] = variants
+        return variants
+
+    def is_hashed(self, full_path: str) -> bool:
+        relative = os.path.relpath(full_path, self.directory)
+        return relative.startswith(DIST_DIR + os.sep) and not relative.endswith((*VARIANTS.values(), ".json"))
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = os.fspath(full_path)
+        headers = {"Cache-Control": STATIC_CACHE_CONTROL}
+        media_type = None
+
+        if status_code == 200 and self.is_hashed(full_path):
+            headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+            variants = self.find_variants(full_path)
+            encoding = negotiate_encoding(request_headers.get("accept-encoding", ""), tuple(variants))
+            if encoding is not None:
+                # Send the pre-compressed file, typed as the original
+                headers["Content-Encoding"] = encoding
+                media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+                full_path, stat_result = variants[encoding]
+
+        response = PathSendFileResponse(
+            full_path, status_code=status_code, headers=headers, media_type=media_type, stat_result=stat_result
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class StaticDispatcher:
+    """
+    Outermost ASGI middleware that sends /static requests straight to the
+    static app, so they skip the per-request middlewares (and can use
+    pathsend, which BaseHTTPMiddleware cannot pass on)
+    """
+
+    def __init__(self, app: ASGIApp, static_app: ASGIApp, prefix: str = STATIC_URL):
+        self.app = app
+        # Turns 404/405 HTTPExceptions into responses, as the app's own stack would
+        self.static_app = ExceptionMiddleware(static_app)
+        self.prefix = prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        root_path = scope.get("root_path", "")
+        if scope["type"] == "http" and scope["path"][len(root_path):].startswith(self.prefix + "/"):
+            scope = dict(scope, root_path=root_path + self.prefix)
+            await self.static_app(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build content-hashed, pre-compressed static assets")
+    parser.add_argument("--static-dir", default=STATIC_DIR)
+    args = parser.parse_args()
+
+    manifest = build(args.static_dir)
+    for path, target in sorted(manifest.items()):
+        print(f"{path} -> {target}")
+    if brotli is None:
+        print("brotli is not installed: only .gz variants were written", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
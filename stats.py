@@ -0,0 +1,219 @@
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, cast
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import engine
+from http_cache import as_utc
+from jobs import enqueue, job_handler
+import models
+
+# "queued" enqueues counter changes as a job in the transaction of each post
+# write and a job worker adds up many writes' changes in one upsert, so
+# concurrent writes stop queueing on the shared total row (counters trail the
+# posts by the job latency, and need a job worker: JOBS_WORKERS or
+# `python jobs.py`); "inline" applies them in the write's transaction instead
+POST_STATS_UPDATES = os.getenv("POST_STATS_UPDATES", "queued")
+# Queued changes applied together in one upsert
+POST_STATS_BATCH_SIZE = int(os.getenv("POST_STATS_BATCH_SIZE", "500"))
+
+PostStat = models.PostStat
+
+# Bucket of the whole-table totals
+TOTAL = ("total", "")
+
+
+def post_buckets(author_id: int, created_at: datetime) -> Tuple[Tuple[str, str], ...]:
+    """
+    Counter rows a post counts towards; days are UTC dates of created_at
+    """
+    return TOTAL, ("author", str(author_id)), ("day", as_utc(created_at).date().isoformat())
+
+
+class PostStatsDelta:
+    """
+    Changes to the post counters made by one write. `apply()` enqueues them in
+    the write's own transaction (or adds them there with a single multi-row
+    upsert, see POST_STATS_UPDATES), so counters commit or roll back together
+    with the posts they count.
+    """
+
+    def __init__(self):
+        self.counts: Dict[Tuple[str, str], List[int]] = {}
+
+    def add(self, author_id: int, published: bool, created_at: datetime, sign: int = 1) -> "PostStatsDelta":
+        """
+        Count (sign=1) or uncount (sign=-1) a post
+        """
+        for key in post_buckets(author_id, created_at):
+            counts = self.counts.setdefault(key, [0, 0])
+            counts[0] += sign
+            counts[1] += sign if published else 0
+        return self
+
+    def add_post(self, post: Any, sign: int = 1) -> "PostStatsDelta":
+        # Any object with author_id, published and created_at (ORM object or row)
+        return self.add(post.author_id, post.published, post.created_at, sign)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        # Sorted so concurrent writers lock counter rows in the same order
+        return [
+            {"dimension": dimension, "bucket": bucket, "posts": posts, "published": published}
+            for (dimension, bucket), (posts, published) in sorted(self.counts.items())
+            if posts or published
+        ]
+
+    async def apply(self, db: AsyncSession) -> None:
+        rows = self.rows()
+        if not rows:
+            return
+        if POST_STATS_UPDATES == "queued":
+            await enqueue(db, "post_stats", rows)
+            return
+        await upsert_post_stats(db, rows)
+
+
+async def upsert_post_stats(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(PostStat).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PostStat.dimension, PostStat.bucket],
+        set_={
+            "posts": PostStat.posts + stmt.excluded.posts,
+            "published": PostStat.published + stmt.excluded.published,
+        }
+    )
+    await db.execute(stmt)
+
+
+@job_handler("post_stats", batch_size=POST_STATS_BATCH_SIZE)
+async def apply_queued_post_stats(db: AsyncSession, payloads: List[List[Dict[str, Any]]]) -> None:
+    """
+    Add up the queued changes of many writes and apply them in one upsert
+    """
+    delta = PostStatsDelta()
+    for rows in payloads:
+        for row in rows:
+            counts = delta.counts.setdefault((row["dimension"], row["bucket"]), [0, 0])
+            counts[0] += row["posts"]
+            counts[1] += row["published"]
+    await upsert_post_stats(db, delta.rows())
+
+
+async def count_created(db: AsyncSession, posts: Iterable[Any]) -> None:
+    delta = PostStatsDelta()
+    for post in posts:
+        delta.add_post(post)
+    await delta.apply(db)
+
+
+async def count_deleted(db: AsyncSession, post: Any) -> None:
+    await PostStatsDelta().add_post(post, -1).apply(db)
+
+
+async def count_updated(db: AsyncSession, old: Any, new: Any) -> None:
+    """
+    Move a post between buckets; a no-op unless author or published changed
+    """
+    await PostStatsDelta().add_post(old, -1).add_post(new).apply(db)
+
+
+async def lock_post_counts(db: AsyncSession, post_id: int) -> Optional[Any]:
+    """
+    The counted columns of a post before an update changes them, locked
+    until the transaction ends so the counter delta can't race another writer.
+    The content hash comes along so an unchanged body needn't be rewritten.
+    """
+    result = await db.execute(
+        select(models.Post.author_id, models.Post.published, models.Post.created_at, models.Post.content_hash)
+        .where(models.Post.id == post_id)
+        .with_for_update()
+    )
+    return result.first()
+
+
+async def ensure_post_stats(conn) -> None:
+    """
+    Fill empty counter tables from the posts table (first start with this
+    version, or after the counters were truncated). This is the only place
+    that scans posts; the table is read once, streamed.
+    """
+    if (await conn.execute(select(PostStat.dimension).limit(1))).first() is not None:
+        return
+    delta = PostStatsDelta()
+    result = await conn.stream(
+        select(models.Post.author_id, models.Post.published, models.Post.created_at)
+        .execution_options(yield_per=1000)
+    )
+    async for post in result:
+        delta.add_post(post)
+    rows = delta.rows()
+    if not rows:
+        return
+    try:
+        async with conn.begin_nested():
+            await conn.execute(PostStat.__table__.insert(), rows)
+    except IntegrityError:
+        # Another worker filled them first
+        pass
+
+
+def ratio(part: int, whole: int) -> float:
+    return round(part / whole, 4) if whole else 0.0
+
+
+def summarize(posts: int, published: int) -> Dict[str, Any]:
+    return {"posts": posts, "published": published, "drafts": posts - published, "published_ratio": ratio(published, posts)}
+
+
+async def get_post_totals(db: AsyncSession) -> Dict[str, Any]:
+    result = await db.execute(
+        select(PostStat.posts, PostStat.published)
+        .where(PostStat.dimension == TOTAL[0], PostStat.bucket == TOTAL[1])
+    )
+    row = result.first()
+    return summarize(row.posts, row.published) if row else summarize(0, 0)
+
+
+async def get_author_stats(db: AsyncSession, limit: int) -> List[Dict[str, Any]]:
+    """
+    Authors with the most posts first
+    """
+    result = await db.execute(
+        select(PostStat.bucket, PostStat.posts, PostStat.published, models.User.username)
+        .outerjoin(models.User, models.User.id == cast(PostStat.bucket, Integer))
+        .where(PostStat.dimension == "author", PostStat.posts > 0)
+        .order_by(PostStat.posts.desc(), PostStat.bucket)
+        .limit(limit)
+    )
+    return [
+        {"author_id": int(row.bucket), "username": row.username, **summarize(row.posts, row.published)}
+        for row in result.all()
+    ]
+
+
+async def get_daily_stats(db: AsyncSession, days: int, today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Posts created per UTC day over the last `days` days, oldest first;
+    days without posts are included with zero counts
+    """
+    today = today or datetime.now(timezone.utc).date()
+    start = today - timedelta(days=days - 1)
+    result = await db.execute(
+        select(PostStat.bucket, PostStat.posts, PostStat.published)
+        .where(PostStat.dimension == "day", PostStat.bucket >= start.isoformat(), PostStat.bucket <= today.isoformat())
+    )
+    counts = {row.bucket: (row.posts, row.published) for row in result.all()}
+    histogram = []
+    for offset in range(days):
+        day = (start + timedelta(days=offset)).isoformat()
+        posts, published = counts.get(day, (0, 0))
+        histogram.append({"day": day, **summarize(posts, published)})
+    return histogram
@@ -0,0 +1,70 @@
+import os
+from typing import Any, Dict
+
+from jinja2 import FileSystemBytecodeCache, pass_environment
+from markupsafe import Markup
+
+from cache import LocalCache
+
+# Compiled templates are shared by every worker on the host through this
+# directory ("" = Jinja's per-user temp directory, "off" = no bytecode cache)
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR", "")
+# Re-check template files for changes on every render (disable in production)
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "true").lower() == "true"
+# Rendered fragments kept per process
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "5000"))
+
+
+class FragmentCache:
+    """
+    Rendered template fragments keyed by the data they were rendered from
+    (e.g. a post row by every field it shows), so a fragment is rendered once
+    per version. Stale versions are never looked up again and age out of the
+    LRU. Don't key on updated_at alone: it is NULL until the first edit, has
+    one-second resolution on SQLite, and SQLite reuses the ids of deleted rows.
+    """
+
+    def __init__(self, max_entries: int = FRAGMENT_CACHE_SIZE):
+        self.local = LocalCache(max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, env, template_name: str, key: tuple, context: Dict[str, Any]) -> Markup:
+        cache_key = repr((template_name,) + key)
+        html = self.local.get(cache_key)
+        if isinstance(html, Markup):
+            self.hits += 1
+            return html
+        self.misses += 1
+        html = Markup(env.get_template(template_name).render(context))
+        self.local.set(cache_key, html, float("inf"))
+        return html
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.local), "evictions": self.local.evictions}
+
+
+fragments = FragmentCache()
+
+
+@pass_environment
+def fragment(env, template_name: str, *key, **context) -> Markup:
+    """
+    Template global:
+        {{ fragment("posts/_row.html", post.id, post.title, post.published, post.created_at, post=post) }}
+    `key` must cover everything the fragment shows.
+    """
+    return fragments.render(env, template_name, key, context)
+
+
+def configure_templates(templates) -> None:
+    """
+    Enable the shared bytecode cache and the `fragment` global on a Jinja2Templates
+    """
+    env = templates.env
+    if TEMPLATE_BYTECODE_CACHE_DIR != "off":
+        if TEMPLATE_BYTECODE_CACHE_DIR:
+            os.makedirs(TEMPLATE_BYTECODE_CACHE_DIR, exist_ok=True)
+        env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_BYTECODE_CACHE_DIR or None)
+    env.auto_reload = TEMPLATE_AUTO_RELOAD
+    env.globals["fragment"] = fragment
@@ -0,0 +1,81 @@
+"""
+Keyset pagination over rows that share a created_at second.
+
+Runs the app against a throwaway SQLite file (needs aiosqlite and httpx from
+benchmarks/requirements.txt):
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp.name, 'pagination.db')}"
+os.environ["JOBS_WORKERS"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from database import engine  # noqa: E402
+from migrate import migrate  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+
+LIMIT = 3
+
+
+async def setup_database():
+    await migrate()
+    # Rows written by SQLAlchemy store fractional seconds, CURRENT_TIMESTAMP
+    # doesn't; both formats within one second must page in one order
+    async with engine.begin() as conn:
+        await conn.execute(insert(models.User).values(id=1, username="author", email="author@example.com"))
+        now = datetime.utcnow().replace(microsecond=0)
+        await conn.execute(insert(models.Post), [
+            {"title": f"explicit {i}", "author_id": 1, "created_at": now} for i in range(4)
+        ])
+    await engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def client():
+    asyncio.run(setup_database())
+    with TestClient(main.app) as client:
+        for i in range(7):
+            response = client.post("/posts/?user_id=1", json={"title": f"default {i}", "content": "same second"})
+            assert response.status_code == 201
+        yield client
+
+
+def walk(client, params):
+    pages, cursor = [], None
+    while True:
+        response = client.get("/posts/", params={**params, "limit": LIMIT, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.append([post["id"] for post in response.json()])
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return pages
+        assert len(pages) <= 20, "cursor does not advance"
+
+
+def test_list_pages_cover_every_row_once(client):
+    pages = walk(client, {})
+    ids = [post_id for page in pages for post_id in page]
+    assert len(pages) > 1
+    assert sorted(ids) == list(range(1, 12))
+    assert len(set(ids)) == len(ids)
+
+
+def test_search_fallback_pages_cover_every_match_once(client):
+    pages = walk(client, {"search": "default"})
+    ids = [post_id for page in pages for post_id in page]
+    assert len(pages) > 1
+    assert sorted(ids) == list(range(5, 12))